@@ -1,30 +1,282 @@
-from flask import Flask, render_template_string, request, redirect, url_for, session
+from flask import (Flask, render_template_string, request, redirect, url_for, session, jsonify, flash,
+                   get_flashed_messages, g, abort, has_request_context)
 import sqlite3
+import logging
+import logging.handlers
+import queue
+import re
+import contextvars
 import random
+import time
+import codecs
+import csv
+import threading
+import base64
+import bisect
+import itertools
+import heapq
+import subprocess
+import hashlib
+import atexit
+import zlib
+import json
+import secrets
+import hmac
+import marshal
+import cProfile
+import pstats
+from abc import ABC, abstractmethod
+from array import array
+from collections import namedtuple, OrderedDict, deque, Counter
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import os
+import sys
+import click
+from flask.cli import ScriptInfo
+from flask.sessions import SecureCookieSessionInterface
 from werkzeug.utils import secure_filename
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
-app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
-# Create upload folder if it doesn't exist
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
 # Database setup
 DATABASE = 'vocabulary.db'
 
+# Tenant databases
+# Each tenant (a school or a class) has its own database file in TENANT_DIR.
+# The X-Tenant header or the tenant cookie picks one per request, the TENANT
+# variable on the command line; without a tenant DATABASE is used.
+TENANT_DIR = os.environ.get('TENANT_DIR', 'tenants')
+TENANT_NAME = re.compile(r'[a-z0-9][a-z0-9_-]{0,62}')
+
+# Connections each thread keeps open; the least recently used one is closed beyond this
+MAX_OPEN_DATABASES = max(1, int(os.environ.get('MAX_OPEN_DATABASES', 8)))
+
+# Seconds a connection waits for another worker's write lock before giving up
+DB_TIMEOUT = 30
+
+# Functions run when a server worker shuts down, see on_shutdown()
+_shutdown_hooks = []
+
+# Per-thread pool of open connections, see open_connections()
+_pool = threading.local()
+
+# Databases whose schema this process has created or upgraded
+_initialized_databases = set()
+_schema_lock = threading.Lock()
+
+# Set by use_tenant(); holds a 1-tuple so that None can select the default database
+_tenant_override = contextvars.ContextVar('tenant_override', default=None)
+
+
+# Time this thread spent in SQLite since reset_sql_timer(); read by the access log
+_sql_timer = threading.local()
+
+
+def reset_sql_timer():
+    _sql_timer.seconds = 0.0
+    _sql_timer.statements = 0
+
+
+def add_sql_time(started, statements=0):
+    if not hasattr(_sql_timer, 'seconds'):
+        reset_sql_timer()
+    _sql_timer.seconds += time.perf_counter() - started
+    _sql_timer.statements += statements
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that adds the time spent in execute(), executemany() and fetchall() to the SQL timer.
+
+    Rows read one at a time are not timed: wrapping __next__ in Python
+    made every row-streaming loop several times slower.
+    """
+
+    def execute(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().execute(*args)
+        finally:
+            add_sql_time(started, 1)
+
+    def executemany(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().executemany(*args)
+        finally:
+            add_sql_time(started, 1)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            add_sql_time(started)
+
+
+class PooledConnection(sqlite3.Connection):
+    """Connection kept open between requests; close() only ends its transaction"""
+
+    def cursor(self, factory=None):
+        if factory is None:
+            # Only the access log reads the SQL timer
+            factory = TimedCursor if ACCESS_LOG else sqlite3.Cursor
+        return super().cursor(factory)
+
+    # The built-in shortcuts create plain cursors, bypassing cursor()
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def close(self):
+        self.rollback()
+
+    def discard(self):
+        super().close()
+
+
+def tenant_database(tenant):
+    """Database file of a tenant; None is the default database"""
+    if tenant is None:
+        return DATABASE
+    if not TENANT_NAME.fullmatch(tenant):
+        raise ValueError(f'invalid tenant name {tenant!r}')
+    return os.path.join(TENANT_DIR, f'{tenant}.db')
+
+
+def list_tenants():
+    if not os.path.isdir(TENANT_DIR):
+        return []
+    return sorted(name[:-3] for name in os.listdir(TENANT_DIR)
+                  if name.endswith('.db') and TENANT_NAME.fullmatch(name[:-3]))
+
+
+def tenant_exists(tenant):
+    try:
+        path = tenant_database(tenant)
+    except ValueError:
+        return False
+    return path in _initialized_databases or os.path.exists(path)
+
+
+def current_tenant():
+    """Tenant whose database get_db() opens: use_tenant(), the request, or $TENANT"""
+    override = _tenant_override.get()
+    if override is not None:
+        return override[0]
+    if has_request_context():
+        return g.get('tenant')
+    return os.environ.get('TENANT') or None
+
+
+@contextmanager
+def use_tenant(tenant):
+    """Route get_db() to a tenant's database (None: the default one) inside the block"""
+    token = _tenant_override.set((tenant,))
+    try:
+        yield
+    finally:
+        _tenant_override.reset(token)
+
+
+def open_connections():
+    """This thread's connections by database path, least recently used first"""
+    if getattr(_pool, 'pid', None) != os.getpid():
+        # SQLite connections must not be shared with a forked parent
+        _pool.pid = os.getpid()
+        _pool.connections = OrderedDict()
+    return _pool.connections
+
 
 def get_db():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
+    """Connection to the current tenant's database, reused from this thread's pool.
+
+    The first time a process uses a database its schema is created or
+    upgraded. close() rolls back instead of closing, so callers keep the
+    usual open/close pattern.
+    """
+    path = tenant_database(current_tenant())
+    connections = open_connections()
+    conn = connections.get(path)
+    if conn is not None:
+        connections.move_to_end(path)
+    else:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=DB_TIMEOUT, factory=PooledConnection)
+        conn.row_factory = sqlite3.Row
+        # Needed for the ON DELETE CASCADE clauses to take effect
+        conn.execute('PRAGMA foreign_keys = ON')
+        connections[path] = conn
+        while len(connections) > MAX_OPEN_DATABASES:
+            _, evicted = connections.popitem(last=False)
+            evicted.discard()
+
+    if path not in _initialized_databases:
+        with _schema_lock:
+            if path not in _initialized_databases:
+                create_schema(conn)
+                _initialized_databases.add(path)
     return conn
 
 
+def on_shutdown(func):
+    """Register a function that flushes pending work before a worker exits"""
+    _shutdown_hooks.append(func)
+    return func
+
+
+def run_shutdown_hooks():
+    for hook in _shutdown_hooks:
+        try:
+            hook()
+        except Exception:
+            app.logger.exception('Shutdown hook %s failed', hook.__name__)
+
+
+@on_shutdown
+def close_connections():
+    connections = open_connections()
+    while connections:
+        _, conn = connections.popitem()
+        conn.discard()
+
+
+@on_shutdown
+def checkpoint_wal():
+    """Copy committed WAL frames back into the database files this process used"""
+    for path in sorted(_initialized_databases):
+        conn = sqlite3.connect(path, timeout=DB_TIMEOUT)
+        try:
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        finally:
+            conn.close()
+
+
+def add_column(conn, table, column, definition):
+    """Add a column to an existing table unless an earlier start already did"""
+    columns = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
 def init_db():
-    with get_db() as conn:
+    """Create or upgrade the schema of the current database"""
+    _initialized_databases.discard(tenant_database(current_tenant()))
+    get_db()
+
+
+def create_schema(conn):
+    with conn:
+        # Only takes effect on a new database; see the maintenance command for existing ones
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        # WAL lets readers in every worker proceed while one worker writes
+        conn.execute('PRAGMA journal_mode=WAL')
         conn.execute('''
                      CREATE TABLE IF NOT EXISTS pages
                      (
@@ -105,25 +357,410 @@ def init_db():
                      ) ON DELETE CASCADE
                          )
                      ''')
+        conn.execute('''
+                     CREATE TABLE IF NOT EXISTS applied_answers
+                     (
+                         key        TEXT PRIMARY KEY,
+                         word_id    INTEGER NOT NULL,
+                         applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                     ) WITHOUT ROWID
+                     ''')
+        conn.execute('''
+                     CREATE TABLE IF NOT EXISTS word_forms
+                     (
+                         word_id    INTEGER NOT NULL REFERENCES words (id) ON DELETE CASCADE,
+                         direction  TEXT    NOT NULL,
+                         position   INTEGER NOT NULL,
+                         text       TEXT    NOT NULL,
+                         normalized TEXT    NOT NULL,
+                         PRIMARY KEY (word_id, direction, position)
+                     ) WITHOUT ROWID
+                     ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_word_forms_normalized ON word_forms (normalized)')
+        conn.execute('''
+                     CREATE TABLE IF NOT EXISTS study_sessions
+                     (
+                         id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                         direction   TEXT    NOT NULL,
+                         method      TEXT    NOT NULL,
+                         mode        TEXT    NOT NULL,
+                         deck        TEXT    NOT NULL,
+                         deck_size   INTEGER NOT NULL,
+                         seed        INTEGER NOT NULL,
+                         progress    TEXT    NOT NULL,
+                         wrong_words TEXT    NOT NULL DEFAULT '[]',
+                         finished    INTEGER NOT NULL DEFAULT 0,
+                         created_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                         updated_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                     )
+                     ''')
+        # Cards of a Leitner session, in the order they are drawn from each box
+        conn.execute('''
+                     CREATE TABLE IF NOT EXISTS leitner_queue
+                     (
+                         session_id INTEGER NOT NULL REFERENCES study_sessions (id) ON DELETE CASCADE,
+                         box        INTEGER NOT NULL,
+                         position   INTEGER NOT NULL,
+                         word_id    INTEGER NOT NULL REFERENCES words (id) ON DELETE CASCADE,
+                         PRIMARY KEY (session_id, box, position)
+                     ) WITHOUT ROWID
+                     ''')
+        conn.execute('''
+                     CREATE TABLE IF NOT EXISTS decks
+                     (
+                         id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                         name       TEXT NOT NULL UNIQUE,
+                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                     )
+                     ''')
+        conn.execute('''
+                     CREATE TABLE IF NOT EXISTS deck_pages
+                     (
+                         deck_id INTEGER NOT NULL REFERENCES decks (id) ON DELETE CASCADE,
+                         page_id INTEGER NOT NULL REFERENCES pages (id) ON DELETE CASCADE,
+                         PRIMARY KEY (deck_id, page_id)
+                     ) WITHOUT ROWID
+                     ''')
+        conn.execute('''
+                     CREATE TABLE IF NOT EXISTS uploads
+                     (
+                         id           TEXT PRIMARY KEY,
+                         page_id      INTEGER NOT NULL REFERENCES pages (id) ON DELETE CASCADE,
+                         filename     TEXT    NOT NULL,
+                         received     INTEGER NOT NULL DEFAULT 0,
+                         parser_state TEXT    NOT NULL,
+                         updated_at   TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                     )
+                     ''')
+        # Filled by build_distractors(); side is the language of the options ('en' or 'am')
+        conn.execute('''
+                     CREATE TABLE IF NOT EXISTS distractors
+                     (
+                         word_id       INTEGER NOT NULL REFERENCES words (id) ON DELETE CASCADE,
+                         side          TEXT    NOT NULL,
+                         rank          INTEGER NOT NULL,
+                         distractor_id INTEGER NOT NULL REFERENCES words (id) ON DELETE CASCADE,
+                         PRIMARY KEY (word_id, side, rank)
+                     ) WITHOUT ROWID
+                     ''')
+        conn.execute('''
+                     CREATE TABLE IF NOT EXISTS confusions
+                     (
+                         word_id   INTEGER NOT NULL REFERENCES words (id) ON DELETE CASCADE,
+                         side      TEXT    NOT NULL,
+                         chosen_id INTEGER NOT NULL REFERENCES words (id) ON DELETE CASCADE,
+                         count     INTEGER NOT NULL DEFAULT 1,
+                         PRIMARY KEY (word_id, side, chosen_id)
+                     ) WITHOUT ROWID
+                     ''')
+        add_column(conn, 'pages', 'version', 'INTEGER NOT NULL DEFAULT 0')
+        # Pages of chunked uploads that are not finalized yet are hidden
+        add_column(conn, 'pages', 'pending', 'INTEGER NOT NULL DEFAULT 0')
+        add_column(conn, 'pages', 'content_hash', 'TEXT')
+        add_column(conn, 'statistics', 'box', 'INTEGER NOT NULL DEFAULT 1')
+        # Written by score_words(); the defaults are the scores of a word never answered
+        add_column(conn, 'statistics', 'difficulty', 'REAL NOT NULL DEFAULT 0.5')
+        add_column(conn, 'statistics', 'recall', 'REAL NOT NULL DEFAULT 0')
+        add_column(conn, 'statistics', 'score', 'REAL NOT NULL DEFAULT 0.5')
+        # Words answered before answers updated the score start from their counts. Their
+        # recall is not known until score_words() runs, so they count as due (recall 0).
+        conn.execute('''UPDATE statistics
+                        SET difficulty = (incorrect + 1.0) / (correct + incorrect + 2.0),
+                            recall = 0,
+                            score = (incorrect + 1.0) / (correct + incorrect + 2.0)
+                        WHERE difficulty = 0.5 AND score = 0.5 AND correct != incorrect''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_words_page_id ON words (page_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_statistics_word_id ON statistics (word_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_statistics_box ON statistics (box, word_id)')
+        # Smart mode sorts the selected words, which no index on score helps with
+        conn.execute('DROP INDEX IF EXISTS idx_statistics_score')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_study_sessions_open ON study_sessions (finished, updated_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_deck_pages_page_id ON deck_pages (page_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_leitner_queue_word_id ON leitner_queue (word_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_pages_content_hash ON pages (content_hash)')
+        # Deleting a word must find the rows that name it as a distractor or a wrong pick
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_distractors_distractor_id ON distractors (distractor_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_confusions_chosen_id ON confusions (chosen_id)')
+        add_word_forms(conn)
+        add_content_hashes(conn)
         conn.commit()
 
 
-def parse_word_file(filepath):
-    """Parse uploaded text file and return list of word pairs"""
-    words = []
-    with open(filepath, 'r', encoding='utf-8') as f:
-        for line in f:
+# Word file formats understood by the importer
+WORD_FILE_FORMATS = ('dash', 'tsv', 'csv', 'separator')
+WORD_FILE_EXTENSIONS = ('.txt', '.tsv', '.csv')
+
+# Bytes read from an upload or file per parser step
+PARSE_CHUNK_SIZE = 64 * 1024
+
+# Line errors kept for the report; later ones are only counted
+MAX_REPORTED_ERRORS = 100
+
+ParseError = namedtuple('ParseError', 'line_no reason text')
+
+
+def is_armenian(char):
+    return '\u0530' <= char <= '\u058f' or '\ufb13' <= char <= '\ufb17'
+
+
+def split_dash_line(line):
+    """Split english-armenian on the dash that precedes the Armenian text.
+
+    English words may contain hyphens themselves (well-known-հայտնի), so the
+    separator is the last '-' before the first Armenian letter. Lines without
+    Armenian letters fall back to the first '-'.
+    """
+    armenian_start = next((i for i, char in enumerate(line) if is_armenian(char)), None)
+    if armenian_start is None:
+        separator = line.find('-')
+    else:
+        separator = line.rfind('-', 0, armenian_start)
+    if separator == -1:
+        raise ValueError("missing '-' separator")
+    return line[:separator], line[separator + 1:]
+
+
+def split_columns(columns):
+    if len(columns) != 2:
+        raise ValueError(f'expected 2 columns, found {len(columns)}')
+    return columns[0], columns[1]
+
+
+def line_splitter(fmt='dash', separator=None):
+    """Return a function that splits one line of the given format into (english, armenian)"""
+    if fmt == 'dash':
+        return split_dash_line
+    if fmt == 'tsv':
+        return lambda line: split_columns(line.split('\t'))
+    if fmt == 'csv':
+        return lambda line: split_columns(next(csv.reader([line])))
+    if fmt == 'separator':
+        if not separator:
+            raise ValueError('the separator format needs a separator')
+
+        def split_separator(line):
+            if separator not in line:
+                raise ValueError(f'missing {separator!r} separator')
+            return tuple(line.split(separator, 1))
+        return split_separator
+    raise ValueError(f'unknown word file format: {fmt}')
+
+
+def format_for_filename(filename):
+    """Pick the word file format from the file extension"""
+    extension = os.path.splitext(filename)[1].lower()
+    return {'.tsv': 'tsv', '.csv': 'csv'}.get(extension, 'dash')
+
+
+class WordFileParser:
+    """Incremental word file parser.
+
+    Bytes are fed in chunks of any size and decoded incrementally, so a file
+    never has to be held in memory as a whole. Every call returns the word
+    pairs of the lines completed so far; malformed lines are skipped and
+    recorded in ``errors`` (the first MAX_REPORTED_ERRORS of them, all of
+    them counted in ``error_count``). Lines spanning chunks are handled, but
+    quoted CSV fields may not contain line breaks.
+    """
+
+    def __init__(self, fmt='dash', separator=None):
+        self.fmt = fmt
+        self.separator = separator
+        self.split_line = line_splitter(fmt, separator)
+        self.decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+        self.pending = ''
+        self.line_no = 0
+        self.errors = []
+        self.error_count = 0
+
+    def feed(self, data):
+        lines = (self.pending + self.decoder.decode(data)).split('\n')
+        self.pending = lines.pop()
+        return self.parse_lines(lines)
+
+    def close(self):
+        lines = (self.pending + self.decoder.decode(b'', final=True)).split('\n')
+        self.pending = ''
+        return self.parse_lines(lines)
+
+    def parse_lines(self, lines):
+        words = []
+        for line in lines:
+            self.line_no += 1
             line = line.strip()
             if not line or line.startswith('#'):
                 continue
 
-            if '-' in line:
-                parts = line.split('-', 1)
-                if len(parts) == 2:
-                    english = parts[0].strip()
-                    armenian = parts[1].strip()
-                    words.append((english, armenian))
-    return words
+            try:
+                if '\ufffd' in line:
+                    raise ValueError('invalid UTF-8')
+                english, armenian = (part.strip() for part in self.split_line(line))
+                if not english or not armenian:
+                    raise ValueError('empty word or translation')
+            except ValueError as e:
+                self.add_error(str(e), line)
+                continue
+            words.append((english, armenian))
+        return words
+
+    def add_error(self, reason, text):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(ParseError(self.line_no, reason, text))
+
+    def getstate(self):
+        """JSON-serializable state, so parsing can continue in another request or worker"""
+        buffered, flag = self.decoder.getstate()
+        return {
+            'fmt': self.fmt,
+            'separator': self.separator,
+            'decoder': [base64.b64encode(buffered).decode('ascii'), flag],
+            'pending': self.pending,
+            'line_no': self.line_no,
+            'errors': [list(error) for error in self.errors],
+            'error_count': self.error_count,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        parser = cls(state['fmt'], state['separator'])
+        buffered, flag = state['decoder']
+        parser.decoder.setstate((base64.b64decode(buffered), flag))
+        parser.pending = state['pending']
+        parser.line_no = state['line_no']
+        parser.errors = [ParseError(*error) for error in state['errors']]
+        parser.error_count = state['error_count']
+        return parser
+
+
+def iter_word_rows(stream, parser, chunk_size=PARSE_CHUNK_SIZE):
+    """Lazily yield word pairs read from a binary stream"""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+def read_word_file(filepath, fmt='dash', separator=None):
+    """Parse a word file and return the word pairs, the reported line errors and the number of bad lines"""
+    parser = WordFileParser(fmt, separator)
+    with open(filepath, 'rb') as f:
+        words = list(iter_word_rows(f, parser))
+    return words, parser.errors, parser.error_count
+
+
+def parse_word_file(filepath, fmt='dash', separator=None):
+    """Parse uploaded text file and return list of word pairs"""
+    return read_word_file(filepath, fmt, separator)[0]
+
+
+def describe_parse_errors(filename, parser):
+    """One-line summary of the skipped lines for the manage page"""
+    shown = '; '.join(f'line {e.line_no}: {e.reason}' for e in parser.errors[:5])
+    more = f' (and {parser.error_count - 5} more)' if parser.error_count > 5 else ''
+    return f'{filename}: skipped {parser.error_count} line(s) - {shown}{more}'
+
+
+def page_name_from_filename(filename):
+    """Derive the page name from an uploaded file name (1.txt -> "Page 1")"""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in ('.tsv', '.csv'):
+        filename = filename[:-len(extension)]
+    page_name = filename.replace('.txt', '')
+    if page_name.isdigit():
+        return f"Page {page_name}"
+    return page_name.replace('_', ' ').title()
+
+
+def append_words(conn, page_id, words):
+    conn.executemany('INSERT INTO words (page_id, english, armenian) VALUES (?, ?, ?)',
+                     ((page_id, english, armenian) for english, armenian in words))
+
+
+def import_words(conn, page_id, words):
+    """Insert parsed word pairs into a page along with empty statistics rows"""
+    append_words(conn, page_id, words)
+    conn.execute('''
+                 INSERT INTO statistics (word_id)
+                 SELECT w.id
+                 FROM words w
+                 WHERE w.page_id = ?
+                   AND NOT EXISTS (SELECT 1 FROM statistics s WHERE s.word_id = w.id)
+                 ''', (page_id,))
+    add_word_forms(conn, page_id)
+
+
+def normalize_form(text):
+    """Form of a synonym used for matching: trimmed, single-spaced, case-folded"""
+    return ' '.join(text.split()).casefold()
+
+
+def hashing_words(words, digest):
+    """Pass word pairs through while adding their normalized form to a hashlib digest.
+
+    Two files hash the same when they hold the same words in the same
+    order, whatever their format, spacing or letter case.
+    """
+    for english, armenian in words:
+        digest.update(f'{normalize_form(english)}\t{normalize_form(armenian)}\n'.encode('utf-8'))
+        yield english, armenian
+
+
+def page_content_hash(conn, page_id):
+    digest = hashlib.sha256()
+    rows = conn.execute('SELECT english, armenian FROM words WHERE page_id = ? ORDER BY id', (page_id,))
+    for _ in hashing_words(rows, digest):
+        pass
+    return digest.hexdigest()
+
+
+def add_content_hashes(conn):
+    """Hash the pages that were created before content hashes were stored"""
+    pages = conn.execute('SELECT id FROM pages WHERE content_hash IS NULL AND pending = 0').fetchall()
+    for page in pages:
+        conn.execute('UPDATE pages SET content_hash = ? WHERE id = ?', (page_content_hash(conn, page['id']), page['id']))
+
+
+def find_duplicate_page(conn, content_hash, page_id=None):
+    """A visible page other than page_id whose words hash to content_hash, or None"""
+    return conn.execute('''SELECT id, name FROM pages
+                           WHERE content_hash = ? AND pending = 0 AND id IS NOT ?
+                           LIMIT 1''', (content_hash, page_id)).fetchone()
+
+
+def describe_duplicate(filename, page):
+    return f'{filename}: same words as "{page["name"]}", not added again'
+
+
+def add_word_forms(conn, page_id=None):
+    """Split the synonyms of words that have no word_forms rows yet.
+
+    Each side of a word ('en' and 'am') is stored as one row per synonym, so
+    study routes read pre-split answers and any synonym can be looked up.
+    Without page_id every word in the database is checked.
+    """
+    query = '''
+        SELECT w.id, w.english, w.armenian
+        FROM words w
+        WHERE NOT EXISTS (SELECT 1 FROM word_forms f WHERE f.word_id = w.id)
+    '''
+    params = ()
+    if page_id is not None:
+        query += ' AND w.page_id = ?'
+        params = (page_id,)
+
+    rows = conn.execute(query, params).fetchall()
+    conn.executemany(
+        'INSERT INTO word_forms (word_id, direction, position, text, normalized) VALUES (?, ?, ?, ?, ?)',
+        (
+            (word_id, direction, position, form, normalize_form(form))
+            for word_id, english, armenian in rows
+            for direction, text in (('en', english), ('am', armenian))
+            for position, form in enumerate(form for form in parse_synonyms(text) if form)
+        )
+    )
 
 
 # HTML Templates
@@ -171,6 +808,13 @@ HOME_TEMPLATE = '''
         button:hover { background: #45a049; }
         .secondary { background: #2196F3; }
         .secondary:hover { background: #0b7dda; }
+        .tenant {
+            margin-top: 30px;
+            text-align: center;
+            color: #666;
+        }
+        .tenant input { padding: 6px; font-size: 14px; }
+        .tenant button { padding: 6px 14px; font-size: 14px; }
     </style>
 </head>
 <body>
@@ -180,6 +824,11 @@ HOME_TEMPLATE = '''
             <button onclick="location.href='/study'">Study</button>
             <button class="secondary" onclick="location.href='/manage'">Manage Pages</button>
         </div>
+        <form class="tenant" method="POST" action="/tenant">
+            School or class: <strong>{{ tenant or 'default' }}</strong>
+            <input type="text" name="tenant" placeholder="switch to..." maxlength="63">
+            <button type="submit" class="secondary">Switch</button>
+        </form>
     </div>
 </body>
 </html>
@@ -235,6 +884,7 @@ MANAGE_TEMPLATE = '''
             align-items: center;
         }
         .page-info { flex: 1; }
+        .page-select { margin-right: 15px; transform: scale(1.2); }
         .page-name { font-weight: bold; font-size: 16px; }
         .page-stats { color: #666; font-size: 14px; margin-top: 5px; }
         .btn-group { display: flex; gap: 10px; }
@@ -271,6 +921,20 @@ MANAGE_TEMPLATE = '''
             border-radius: 3px;
             font-family: monospace;
         }
+        .flash-message {
+            background: #fff3e0;
+            padding: 10px 15px;
+            border-radius: 4px;
+            margin: 10px 0;
+            font-size: 14px;
+            color: #e65100;
+        }
+        select, input[type="text"] {
+            padding: 10px;
+            border: 1px solid #ddd;
+            border-radius: 4px;
+            font-size: 14px;
+        }
     </style>
 </head>
 <body>
@@ -283,20 +947,43 @@ MANAGE_TEMPLATE = '''
             <strong>File Format:</strong> Upload .txt files (UTF-8 encoded) with format:<br>
             <code>english_word-armenian_word</code><br>
             For synonyms: <code>word1,word2-translation</code><br>
+            Tab-separated (.tsv), CSV (.csv) or a custom separator also work; quote CSV fields containing commas<br>
             File name becomes page name (e.g., <code>1.txt</code> → "Page 1")
         </div>
-        <form method="POST" action="/upload_file" enctype="multipart/form-data">
+        {% for message in get_flashed_messages() %}
+        <div class="flash-message">{{ message }}</div>
+        {% endfor %}
+        <form method="POST" action="/upload_file" enctype="multipart/form-data" id="uploadForm">
             <div class="form-group">
-                <input type="file" name="files" accept=".txt" multiple required>
+                <input type="file" name="files" accept=".txt,.tsv,.csv" multiple required>
+                <select name="format">
+                    <option value="auto">Format: by extension</option>
+                    <option value="dash">english-armenian</option>
+                    <option value="tsv">Tab separated</option>
+                    <option value="csv">CSV</option>
+                    <option value="separator">Custom separator</option>
+                </select>
+                <input type="text" name="separator" placeholder="Separator" size="6">
                 <button type="submit" class="btn-primary">Upload & Create Page</button>
             </div>
+            <div id="uploadStatus"></div>
         </form>
 
         <h2>Existing Pages</h2>
         {% if pages %}
+        <form method="POST" action="/bulk_pages" id="bulkForm" class="form-group">
+            <select name="action">
+                <option value="merge">Merge ticked pages into the oldest one</option>
+                <option value="reset">Reset statistics of ticked pages</option>
+                <option value="delete">Delete ticked pages</option>
+            </select>
+            <input type="text" name="name" placeholder="Name of merged page (optional)">
+            <button type="submit" class="btn-secondary" onclick="return confirm('Apply to the ticked pages?')">Apply</button>
+        </form>
         <ul class="page-list">
             {% for page in pages %}
             <li class="page-item">
+                <input type="checkbox" name="pages" value="{{ page.id }}" form="bulkForm" class="page-select">
                 <div class="page-info">
                     <div class="page-name">{{ page.name }}</div>
                     <div class="page-stats">
@@ -308,9 +995,14 @@ MANAGE_TEMPLATE = '''
                 <div class="btn-group">
                     <button class="btn-secondary" onclick="location.href='/view_page/{{ page.id }}'">View Words</button>
                     <form method="POST" action="/reupload_page/{{ page.id }}" enctype="multipart/form-data" style="display:inline;">
-                        <input type="file" name="file" accept=".txt" id="file_{{ page.id }}" style="display:none;" onchange="this.form.submit()">
+                        <input type="file" name="file" accept=".txt,.tsv,.csv" id="file_{{ page.id }}" style="display:none;" onchange="this.form.submit()">
                         <button type="button" class="btn-secondary" onclick="document.getElementById('file_{{ page.id }}').click()">Re-upload</button>
                     </form>
+                    <form method="POST" action="/split_page/{{ page.id }}" style="display:inline;">
+                        <input type="hidden" name="ranges">
+                        <button type="submit" class="btn-secondary"
+                                onclick="const ranges = prompt('Word positions of each new page, e.g. 1-50,51-100'); if (!ranges) return false; this.form.elements.ranges.value = ranges;">Split</button>
+                    </form>
                     <button class="btn-danger" onclick="if(confirm('Delete this page?')) location.href='/delete_page/{{ page.id }}'">Delete</button>
                 </div>
             </li>
@@ -320,6 +1012,74 @@ MANAGE_TEMPLATE = '''
         <p>No pages yet. Upload your first file above.</p>
         {% endif %}
     </div>
+
+    <script>
+        // Upload in chunks so large files stream into the importer and a
+        // dropped connection resumes where the server left off
+        async function uploadInChunks(file, form, showStatus) {
+            const resumeKey = 'upload:' + file.name + ':' + file.size + ':' + file.lastModified;
+            let upload = null;
+            const savedId = localStorage.getItem(resumeKey);
+            if (savedId) {
+                const response = await fetch('/uploads/' + savedId);
+                if (response.ok) upload = await response.json();
+            }
+            if (!upload) {
+                const response = await fetch('/uploads', {
+                    method: 'POST',
+                    body: new URLSearchParams({
+                        filename: file.name,
+                        format: form.elements.format.value,
+                        separator: form.elements.separator.value
+                    })
+                });
+                upload = await response.json();
+                if (!response.ok) throw new Error(upload.error);
+                localStorage.setItem(resumeKey, upload.upload_id);
+            }
+
+            let offset = upload.offset;
+            let failures = 0;
+            while (offset < file.size) {
+                showStatus(file.name + ': ' + Math.floor(100 * offset / file.size) + '%');
+                try {
+                    const response = await fetch('/uploads/' + upload.upload_id + '/chunk?offset=' + offset, {
+                        method: 'POST',
+                        headers: {'Content-Type': 'application/octet-stream'},
+                        body: file.slice(offset, offset + upload.chunk_size)
+                    });
+                    const result = await response.json();
+                    if (!response.ok && response.status !== 409) throw new Error(result.error);
+                    offset = result.offset;
+                    failures = 0;
+                } catch (error) {
+                    if (++failures > 5) throw error;
+                    await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+                }
+            }
+
+            const response = await fetch('/uploads/' + upload.upload_id + '/finalize', {method: 'POST'});
+            localStorage.removeItem(resumeKey);
+            if (!response.ok) throw new Error((await response.json()).error);
+        }
+
+        document.getElementById('uploadForm').addEventListener('submit', async (event) => {
+            if (!window.fetch || !window.Blob || !Blob.prototype.slice) return;
+            event.preventDefault();
+            const form = event.target;
+            const status = document.getElementById('uploadStatus');
+            const showStatus = (text) => { status.textContent = text; };
+            form.querySelector('button[type="submit"]').disabled = true;
+            try {
+                for (const file of form.elements.files.files) {
+                    await uploadInChunks(file, form, showStatus);
+                }
+            } catch (error) {
+                alert('Upload failed: ' + error.message + '. Upload the file again to resume.');
+            }
+            location.reload();
+        });
+    </script>
 </body>
 </html>
 '''
@@ -367,6 +1127,19 @@ VIEW_PAGE_TEMPLATE = '''
             background: #f5f5f5;
             font-weight: bold;
         }
+        .move-form select, .move-form button {
+            padding: 8px 12px;
+            margin-left: 8px;
+            border: 1px solid #ddd;
+            border-radius: 4px;
+            font-size: 14px;
+        }
+        .move-form button {
+            background: #2196F3;
+            color: white;
+            border: none;
+            cursor: pointer;
+        }
     </style>
 </head>
 <body>
@@ -376,9 +1149,22 @@ VIEW_PAGE_TEMPLATE = '''
 
         <h2>Words in this Page ({{ words|length }})</h2>
         {% if words %}
+        {% if other_pages %}
+        <form method="POST" action="/move_words" id="moveForm" class="move-form">
+            <input type="hidden" name="source_page" value="{{ page.id }}">
+            Move ticked words to
+            <select name="target_page">
+                {% for other in other_pages %}
+                <option value="{{ other.id }}">{{ other.name }}</option>
+                {% endfor %}
+            </select>
+            <button type="submit">Move</button>
+        </form>
+        {% endif %}
         <table>
             <thead>
                 <tr>
+                    {% if other_pages %}<th></th>{% endif %}
                     <th>English</th>
                     <th>Armenian</th>
                     <th>Statistics</th>
@@ -387,6 +1173,7 @@ VIEW_PAGE_TEMPLATE = '''
             <tbody>
                 {% for word in words %}
                 <tr>
+                    {% if other_pages %}<td><input type="checkbox" name="words" value="{{ word.id }}" form="moveForm"></td>{% endif %}
                     <td>{{ word.english }}</td>
                     <td>{{ word.armenian }}</td>
                     <td>✓{{ word.correct }} / ✗{{ word.incorrect }}</td>
@@ -490,6 +1277,16 @@ STUDY_SETUP_TEMPLATE = '''
             background: #ccc;
             cursor: not-allowed;
         }
+        .offline-btn {
+            background: #607D8B;
+            width: 100%;
+            margin-top: 10px;
+        }
+        .offline-btn:hover { background: #455A64; }
+        .offline-btn:disabled {
+            background: #ccc;
+            cursor: not-allowed;
+        }
         .back-link { 
             display: inline-block;
             margin-bottom: 20px;
@@ -502,12 +1299,73 @@ STUDY_SETUP_TEMPLATE = '''
             margin-top: 10px;
             text-align: center;
         }
+        .resume-item {
+            display: flex;
+            align-items: center;
+            justify-content: space-between;
+            gap: 15px;
+            padding: 10px;
+            margin: 5px 0;
+            background: white;
+            border: 2px solid #ddd;
+            border-radius: 4px;
+        }
+        .resume-item small { color: #888; }
+        .delete-deck-btn {
+            float: right;
+            flex: 0;
+            min-width: 0;
+            padding: 4px 12px;
+            font-size: 13px;
+            background: #f44336;
+        }
+        .delete-deck-btn:hover { background: #d32f2f; }
+        .save-deck {
+            width: 100%;
+            padding: 10px;
+            font-size: 15px;
+            border: 2px solid #ddd;
+            border-radius: 4px;
+        }
+        .resume-item button {
+            flex: 0;
+            padding: 10px 20px;
+            background: #2196F3;
+        }
+        .resume-item button:hover { background: #1976D2; }
+        .flash-message {
+            background: #fff3e0;
+            padding: 10px 15px;
+            border-radius: 4px;
+            margin: 10px 0;
+            font-size: 14px;
+            color: #e65100;
+        }
     </style>
 </head>
 <body>
     <div class="container">
         <a href="/" class="back-link">← Back to Home</a>
         <h1>Study Setup</h1>
+        {% for message in messages %}
+        <div class="flash-message">{{ message }}</div>
+        {% endfor %}
+
+        {% if study_sessions %}
+        <div class="section">
+            <h2>Resume a Session</h2>
+            {% for saved in study_sessions %}
+            <form class="resume-item" method="POST" action="/resume_session">
+                <input type="hidden" name="session_id" value="{{ saved.id }}">
+                <div>
+                    {{ saved.mode_text }} · {{ saved.direction_text }} · {{ saved.method_text }}<br>
+                    <small>{{ saved.answered }} answered, {{ saved.deck_size }} words · last studied {{ saved.updated_at }}</small>
+                </div>
+                <button type="submit">Resume</button>
+            </form>
+            {% endfor %}
+        </div>
+        {% endif %}
 
         <form id="studyForm" method="POST" action="/study_session">
             <div class="section">
@@ -524,6 +1382,7 @@ STUDY_SETUP_TEMPLATE = '''
                 <div class="btn-group">
                     <button type="button" onclick="selectMethod('write')" id="btn_write">Write</button>
                     <button type="button" onclick="selectMethod('say')" id="btn_say">Say</button>
+                    <button type="button" onclick="selectMethod('choice')" id="btn_choice">Multiple Choice</button>
                 </div>
                 <input type="hidden" name="method" id="method" required>
             </div>
@@ -534,12 +1393,25 @@ STUDY_SETUP_TEMPLATE = '''
                     <button type="button" onclick="selectMode('smart')" id="btn_smart">Smart (Mistake-based)</button>
                     <button type="button" onclick="selectMode('random')" id="btn_random">Random</button>
                     <button type="button" onclick="selectMode('session')" id="btn_session">Session (Each Once)</button>
+                    <button type="button" onclick="selectMode('leitner')" id="btn_leitner">Leitner (Boxes)</button>
                 </div>
                 <input type="hidden" name="mode" id="mode" required>
             </div>
 
             <div class="section">
                 <h2>4. Select Pages</h2>
+                {% if decks %}
+                <div class="page-selection">
+                    {% for deck in decks %}
+                    <label class="page-checkbox">
+                        <input type="checkbox" name="decks" value="{{ deck.id }}">
+                        <strong>{{ deck.name }}</strong> ({{ deck.page_count }} pages, {{ deck.word_count }} words)
+                        <button type="submit" class="delete-deck-btn" formaction="/delete_deck/{{ deck.id }}"
+                                formnovalidate onclick="return confirm('Delete saved deck {{ deck.name }}?')">Delete</button>
+                    </label>
+                    {% endfor %}
+                </div>
+                {% endif %}
                 <div class="page-selection">
                     {% if pages %}
                         {% for page in pages %}
@@ -552,9 +1424,11 @@ STUDY_SETUP_TEMPLATE = '''
                         <p class="error">No pages available. Please upload files first.</p>
                     {% endif %}
                 </div>
+                <input type="text" name="save_deck" class="save-deck" placeholder="Save this selection as a deck (optional name)">
             </div>
 
             <button type="submit" class="start-btn" id="startBtn" {% if not pages %}disabled{% endif %}>Start Study Session</button>
+            <button type="button" class="offline-btn" id="offlineBtn" onclick="startOffline()" disabled>Download for Offline Study</button>
             <div id="error" class="error"></div>
         </form>
     </div>
@@ -576,7 +1450,7 @@ STUDY_SETUP_TEMPLATE = '''
 
         function selectMode(mode) {
             document.getElementById('mode').value = mode;
-            document.querySelectorAll('[id^="btn_smart"], [id^="btn_random"], [id^="btn_session"]').forEach(b => b.classList.remove('selected'));
+            document.querySelectorAll('[id^="btn_smart"], [id^="btn_random"], [id^="btn_session"], [id^="btn_leitner"]').forEach(b => b.classList.remove('selected'));
             document.getElementById('btn_' + mode).classList.add('selected');
             validateForm();
         }
@@ -585,10 +1459,11 @@ STUDY_SETUP_TEMPLATE = '''
             const direction = document.getElementById('direction').value;
             const method = document.getElementById('method').value;
             const mode = document.getElementById('mode').value;
-            const pages = document.querySelectorAll('input[name="pages"]:checked').length;
+            const pages = document.querySelectorAll('input[name="pages"]:checked, input[name="decks"]:checked').length;
 
             const isValid = direction && method && mode && pages > 0;
             document.getElementById('startBtn').disabled = !isValid;
+            document.getElementById('offlineBtn').disabled = !isValid;
 
             if (!isValid && direction && method && mode) {
                 document.getElementById('error').textContent = 'Please select at least one page';
@@ -597,9 +1472,14 @@ STUDY_SETUP_TEMPLATE = '''
             }
         }
 
-        document.querySelectorAll('input[name="pages"]').forEach(cb => {
+        document.querySelectorAll('input[name="pages"], input[name="decks"]').forEach(cb => {
             cb.addEventListener('change', validateForm);
         });
+
+        function startOffline() {
+            const params = new URLSearchParams(new FormData(document.getElementById('studyForm')));
+            location.href = '/offline?' + params.toString();
+        }
     </script>
 </body>
 </html>
@@ -755,6 +1635,23 @@ STUDY_SESSION_TEMPLATE = '''
             background: #ccc;
             cursor: not-allowed;
         }
+        .choice-options {
+            display: grid;
+            grid-template-columns: 1fr 1fr;
+            gap: 15px;
+            margin: 30px 0;
+        }
+        .choice-option {
+            padding: 18px;
+            font-size: 20px;
+            background: white;
+            color: #333;
+            border: 2px solid #ddd;
+        }
+        .choice-option:hover:enabled { border-color: #2196F3; }
+        .choice-option:disabled { cursor: default; }
+        .choice-option.correct { background: #4CAF50; border-color: #4CAF50; color: white; }
+        .choice-option.wrong { background: #f44336; border-color: #f44336; color: white; }
         .field-feedback {
             margin-top: 10px;
             text-align: center;
@@ -805,6 +1702,14 @@ STUDY_SESSION_TEMPLATE = '''
             color: #666;
         }
     </style>
+    <script>
+        function newKey() {
+            if (window.crypto && crypto.randomUUID) {
+                return crypto.randomUUID();
+            }
+            return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+        }
+    </script>
 </head>
 <body>
     <div class="container">
@@ -880,10 +1785,13 @@ STUDY_SESSION_TEMPLATE = '''
                         {% endfor %}
                     </div>
 
-                    <div class="btn-group">
+                    <div class="btn-group" id="wordActions">
                         <button type="button" class="btn-reveal" onclick="revealAnswers()">Reveal All Answers</button>
                         <button type="button" class="btn-skip" onclick="document.getElementById('skipForm').submit()">Skip</button>
                     </div>
+                    <div class="btn-group" id="nextAction" style="display:none;">
+                        <button type="button" class="btn-next" onclick="location.href='/study_word'">Next Word</button>
+                    </div>
                     <form id="skipForm" method="POST" action="/study_action" style="display:none;">
                         <input type="hidden" name="action" value="skip">
                     </form>
@@ -902,7 +1810,10 @@ STUDY_SESSION_TEMPLATE = '''
                 <script>
                     const correctAnswers = {{ current_word.answer_list | tojson }};
                     const wordId = {{ current_word.id }};
+                    // Sent with every answer for this word so retries are counted once
+                    const answerKey = newKey();
                     const usedAnswers = new Set();
+                    const fieldAnswers = {};
 
                     function showHint(fieldIndex) {
                         const input = document.getElementById('input_' + fieldIndex);
@@ -960,13 +1871,26 @@ STUDY_SESSION_TEMPLATE = '''
                             feedbackDiv.innerHTML = '<span class="incorrect-mark">✗ Wrong</span><div class="user-answer">Your answer: ' + userAnswer + '</div><div class="correct-answer">Any of: ' + correctAnswers.join(', ') + '</div>';
                         }
 
-                        // Send to server (no reload)
-                        fetch('/check_field', {
+                        // Once every field is filled in, grade the whole word in one request
+                        fieldAnswers[fieldIndex] = userAnswer;
+                        if (Object.keys(fieldAnswers).length === correctAnswers.length) {
+                            submitWord();
+                        }
+                    }
+
+                    function submitWord() {
+                        const body = new URLSearchParams({word_id: wordId, answer_key: answerKey});
+                        correctAnswers.forEach((_, index) => body.append('answers', fieldAnswers[index]));
+
+                        document.getElementById('wordActions').style.display = 'none';
+                        fetch('/check_word', {
                             method: 'POST',
                             headers: {
                                 'Content-Type': 'application/x-www-form-urlencoded',
                             },
-                            body: 'field_index=' + fieldIndex + '&user_answer=' + encodeURIComponent(userAnswer) + '&is_correct=' + isCorrect + '&word_id=' + wordId
+                            body: body.toString()
+                        }).then(() => {
+                            document.getElementById('nextAction').style.display = 'flex';
                         });
                     }
 
@@ -993,7 +1917,7 @@ STUDY_SESSION_TEMPLATE = '''
                             headers: {
                                 'Content-Type': 'application/x-www-form-urlencoded',
                             },
-                            body: 'word_id=' + wordId
+                            body: new URLSearchParams({word_id: wordId, answer_key: answerKey}).toString()
                         }).then(() => {
                             setTimeout(() => {
                                 document.getElementById('skipForm').submit();
@@ -1001,6 +1925,47 @@ STUDY_SESSION_TEMPLATE = '''
                         });
                     }
                 </script>
+            {% elif method == 'choice' %}
+                <div class="choice-options">
+                    {% for choice in choices %}
+                    <button type="button" class="choice-option" data-id="{{ choice.id }}" onclick="choose(this)">{{ choice.text }}</button>
+                    {% endfor %}
+                </div>
+                <div class="btn-group" id="wordActions">
+                    <button type="button" class="btn-skip" onclick="document.getElementById('skipForm').submit()">Skip</button>
+                </div>
+                <div class="btn-group" id="nextAction" style="display:none;">
+                    <button type="button" class="btn-next" onclick="location.href='/study_word'">Next Word</button>
+                </div>
+                <form id="skipForm" method="POST" action="/study_action" style="display:none;">
+                    <input type="hidden" name="action" value="skip">
+                </form>
+
+                <script>
+                    const wordId = {{ current_word.id }};
+                    // Sent with the answer so a retried request is counted once
+                    const answerKey = newKey();
+
+                    function choose(button) {
+                        const options = document.querySelectorAll('.choice-option');
+                        options.forEach(option => option.disabled = true);
+                        document.getElementById('wordActions').style.display = 'none';
+
+                        fetch('/check_choice', {
+                            method: 'POST',
+                            headers: {
+                                'Content-Type': 'application/x-www-form-urlencoded',
+                            },
+                            body: new URLSearchParams({word_id: wordId, choice_id: button.dataset.id, answer_key: answerKey}).toString()
+                        }).then(response => response.json()).then(result => {
+                            options.forEach(option => {
+                                if (Number(option.dataset.id) === result.answer_id) option.classList.add('correct');
+                            });
+                            if (!result.correct) button.classList.add('wrong');
+                            document.getElementById('nextAction').style.display = 'flex';
+                        });
+                    }
+                </script>
             {% else %}
                 <form method="POST" action="/study_action" id="mainForm">
                     <div class="answer-placeholder">
@@ -1019,6 +1984,8 @@ STUDY_SESSION_TEMPLATE = '''
                             <button type="button" class="btn-skip" onclick="document.getElementById('skipForm').submit()">Skip</button>
                         </div>
                     {% else %}
+                        <input type="hidden" name="answer_key" id="answerKey">
+                        <script>document.getElementById('answerKey').value = newKey();</script>
                         <div class="btn-group">
                             <button type="submit" name="action" value="next" class="btn-next">✓ Correct (Next)</button>
                             <button type="submit" name="action" value="mark_wrong" class="btn-wrong">✗ Wrong</button>
@@ -1048,55 +2015,1422 @@ STUDY_SESSION_TEMPLATE = '''
 '''
 
 
-def parse_synonyms(text):
-    """Parse comma-separated synonyms and return list"""
-    return [s.strip() for s in text.split(',')]
-
-
-# Routes
-@app.route('/')
-def index():
-    return render_template_string(HOME_TEMPLATE)
-
-
-@app.route('/end_session')
-def end_session():
-    """End the current session and show statistics"""
-    if 'words' not in session:
-        return redirect(url_for('study'))
-
-    direction = session.get('direction')
-    method = session.get('method')
-    mode = session.get('mode')
-
-    session_stats = session.get('stats', {'correct': 0, 'incorrect': 0, 'total': 0})
-    if session_stats['total'] > 0:
-        session_stats['accuracy'] = round((session_stats['correct'] / session_stats['total']) * 100, 1)
-    else:
-        session_stats['accuracy'] = 0
-
-    wrong_words = session.get('wrong_words', [])
-
-    direction_text = "English → Armenian" if direction == 'en_to_am' else "Armenian → English"
-    method_text = "Write" if method == 'write' else "Say"
-    mode_text = {"smart": "Smart Mode", "random": "Random Mode", "session": "Session Mode"}.get(mode, "Unknown")
-
-    return render_template_string(
-        STUDY_SESSION_TEMPLATE,
-        completed=True,
-        session_stats=session_stats,
-        wrong_words=wrong_words,
-        direction=direction,
-        method=method,
-        mode=mode,
-        direction_text=direction_text,
-        method_text=method_text,
-        mode_text=mode_text
-    )
-@app.route('/manage')
-def manage():
-    with get_db() as conn:
-        pages = conn.execute('''
+OFFLINE_STUDY_TEMPLATE = '''
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Offline Study</title>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <style>
+        * { margin: 0; padding: 0; box-sizing: border-box; }
+        body { 
+            font-family: Arial, sans-serif; 
+            max-width: 800px; 
+            margin: 50px auto; 
+            padding: 20px;
+            text-align: center;
+            font-size: 18px;
+            background: #f5f5f5;
+        }
+        .container {
+            background: white;
+            padding: 40px;
+            border-radius: 8px;
+            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+            min-height: 400px;
+        }
+        .header {
+            margin-bottom: 40px;
+            padding-bottom: 20px;
+            border-bottom: 2px solid #eee;
+        }
+        .sync-info {
+            color: #666;
+            font-size: 14px;
+        }
+        .prompt-word {
+            font-size: 48px;
+            font-weight: bold;
+            color: #2196F3;
+            margin: 50px 0 20px 0;
+        }
+        .revealed-answer {
+            font-size: 36px;
+            color: #4CAF50;
+            margin: 20px 0;
+        }
+        .synonym-input {
+            display: block;
+            margin: 10px auto;
+            padding: 12px;
+            font-size: 20px;
+            border: 2px solid #ddd;
+            border-radius: 6px;
+            width: 300px;
+            text-align: center;
+        }
+        .btn-group {
+            display: flex;
+            gap: 15px;
+            justify-content: center;
+            margin-top: 30px;
+        }
+        button {
+            padding: 15px 40px;
+            font-size: 18px;
+            border: none;
+            border-radius: 6px;
+            cursor: pointer;
+            color: white;
+            background: #4CAF50;
+        }
+        .btn-reveal { background: #FF9800; }
+        .btn-wrong, .btn-end { background: #f44336; }
+        .correct-mark { color: #2E7D32; font-weight: bold; }
+        .incorrect-mark { color: #C62828; font-weight: bold; }
+        .progress { color: #666; margin-top: 30px; font-size: 14px; }
+        .hidden { display: none; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>Offline Study</h1>
+            <div class="sync-info" id="syncInfo"></div>
+        </div>
+
+        <div id="card" class="hidden">
+            <div class="prompt-word" id="prompt"></div>
+            <div id="inputs"></div>
+            <div class="revealed-answer hidden" id="answer"></div>
+            <div id="feedback"></div>
+            <div class="btn-group" id="actions"></div>
+            <div class="progress" id="progress"></div>
+        </div>
+
+        <div id="summary" class="hidden">
+            <h2>Session Complete! 🎉</h2>
+            <p id="summaryStats"></p>
+        </div>
+
+        <div class="btn-group">
+            <button class="btn-end" onclick="endSession()">End Session</button>
+        </div>
+    </div>
+
+    <script>
+        const params = new URLSearchParams(location.search);
+        const direction = params.get('direction');
+        const method = params.get('method');
+        const mode = params.get('mode');
+        const deckUrl = '/offline_deck?' + params.toString();
+        const DECK_KEY = 'offline_deck:' + params.toString();
+        const PROGRESS_KEY = 'offline_progress:' + params.toString();
+        const QUEUE_KEY = 'offline_answers';
+        const SYNC_BATCH = 500;
+
+        let deck = null;
+        let progress = null;
+        let current = null;
+        let answered = false;
+        let syncing = false;
+
+        if ('serviceWorker' in navigator) {
+            navigator.serviceWorker.register('/sw.js');
+        }
+
+        function loadQueue() {
+            return JSON.parse(localStorage.getItem(QUEUE_KEY) || '[]');
+        }
+
+        function saveQueue(queue) {
+            localStorage.setItem(QUEUE_KEY, JSON.stringify(queue));
+            showSyncInfo(queue.length);
+        }
+
+        function showSyncInfo(pending) {
+            const state = navigator.onLine ? 'Online' : 'Offline';
+            document.getElementById('syncInfo').textContent =
+                state + ' | ' + pending + ' answer(s) waiting to sync';
+        }
+
+        function newKey() {
+            if (window.crypto && crypto.randomUUID) {
+                return crypto.randomUUID();
+            }
+            return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+        }
+
+        function recordAnswer(wordId, correct) {
+            const queue = loadQueue();
+            queue.push({key: newKey(), word_id: wordId, correct: correct, ts: Date.now() / 1000});
+            saveQueue(queue);
+            syncAnswers();
+        }
+
+        async function syncAnswers() {
+            if (syncing || !navigator.onLine) {
+                return;
+            }
+            syncing = true;
+            try {
+                let queue = loadQueue();
+                while (queue.length > 0) {
+                    const batch = queue.slice(0, SYNC_BATCH);
+                    const response = await fetch('/sync', {
+                        method: 'POST',
+                        headers: {'Content-Type': 'application/json'},
+                        body: JSON.stringify({events: batch})
+                    });
+                    if (!response.ok) {
+                        break;
+                    }
+                    const sent = new Set(batch.map(e => e.key));
+                    queue = loadQueue().filter(e => !sent.has(e.key));
+                    saveQueue(queue);
+                }
+            } catch (e) {
+                // Still offline; the queue is retried on the next answer or reconnect
+            } finally {
+                syncing = false;
+                showSyncInfo(loadQueue().length);
+            }
+        }
+
+        async function loadDeck() {
+            // An unfinished session keeps the deck (and order) it started with
+            const cached = JSON.parse(localStorage.getItem(DECK_KEY) || 'null');
+            const saved = JSON.parse(localStorage.getItem(PROGRESS_KEY) || 'null');
+            if (cached && saved && saved.deck_id === cached.deck_id) {
+                return cached;
+            }
+            try {
+                const response = await fetch(deckUrl);
+                if (response.ok) {
+                    const fresh = await response.json();
+                    localStorage.setItem(DECK_KEY, JSON.stringify(fresh));
+                    return fresh;
+                }
+            } catch (e) {
+                // Fall back to the copy downloaded earlier
+            }
+            return cached;
+        }
+
+        function saveProgress() {
+            localStorage.setItem(PROGRESS_KEY, JSON.stringify(progress));
+        }
+
+        function splitSynonyms(text) {
+            return text.split(',').map(s => s.trim());
+        }
+
+        function showWord() {
+            const words = deck.words;
+            answered = false;
+            if (mode === 'random') {
+                current = words[Math.floor(Math.random() * words.length)];
+            } else if (progress.index >= words.length) {
+                endSession();
+                return;
+            } else {
+                current = words[progress.index];
+            }
+
+            const [wordId, english, armenian] = current;
+            const prompt = direction === 'en_to_am' ? english : armenian;
+            const answer = direction === 'en_to_am' ? armenian : english;
+
+            document.getElementById('card').classList.remove('hidden');
+            document.getElementById('prompt').textContent = prompt;
+            document.getElementById('answer').textContent = answer;
+            document.getElementById('answer').classList.add('hidden');
+            document.getElementById('feedback').innerHTML = '';
+
+            const inputs = document.getElementById('inputs');
+            const actions = document.getElementById('actions');
+            inputs.innerHTML = '';
+            actions.innerHTML = '';
+
+            if (method === 'write') {
+                splitSynonyms(answer).forEach((_, i) => {
+                    const input = document.createElement('input');
+                    input.className = 'synonym-input';
+                    input.placeholder = 'Synonym ' + (i + 1);
+                    input.autocomplete = 'off';
+                    inputs.appendChild(input);
+                });
+                addButton('Check', '', checkAnswers);
+                addButton('Reveal Answer', 'btn-reveal', () => finishWord(false));
+            } else {
+                addButton('Reveal Answer', 'btn-reveal', () => {
+                    document.getElementById('answer').classList.remove('hidden');
+                    actions.innerHTML = '';
+                    addButton('✓ Correct (Next)', '', () => { finishWord(true); nextWord(); });
+                    addButton('✗ Wrong', 'btn-wrong', () => { finishWord(false); nextWord(); });
+                });
+            }
+
+            if (mode !== 'random') {
+                document.getElementById('progress').textContent =
+                    'Progress: ' + (progress.index + 1) + ' / ' + words.length;
+            }
+        }
+
+        function addButton(label, cls, handler) {
+            const button = document.createElement('button');
+            button.type = 'button';
+            button.textContent = label;
+            button.className = cls;
+            button.onclick = handler;
+            document.getElementById('actions').appendChild(button);
+        }
+
+        function checkAnswers() {
+            const answer = direction === 'en_to_am' ? current[2] : current[1];
+            const accepted = splitSynonyms(answer).map(a => a.toLowerCase());
+            const values = Array.from(document.querySelectorAll('.synonym-input')).map(i => i.value.trim());
+            if (values.some(v => !v)) {
+                alert('Please fill in every field first');
+                return;
+            }
+            finishWord(values.every(v => accepted.includes(v.toLowerCase())));
+        }
+
+        function finishWord(correct) {
+            if (answered) {
+                return;
+            }
+            answered = true;
+            recordAnswer(current[0], correct);
+            progress.total += 1;
+            if (correct) {
+                progress.correct += 1;
+            }
+            saveProgress();
+
+            if (method === 'write') {
+                document.querySelectorAll('.synonym-input').forEach(i => i.disabled = true);
+                document.getElementById('answer').classList.remove('hidden');
+                document.getElementById('feedback').innerHTML = correct
+                    ? '<span class="correct-mark">✓ Correct!</span>'
+                    : '<span class="incorrect-mark">✗ Wrong</span>';
+                document.getElementById('actions').innerHTML = '';
+                addButton('Next Word', '', nextWord);
+            }
+        }
+
+        function nextWord() {
+            if (mode !== 'random') {
+                progress.index += 1;
+                saveProgress();
+            }
+            showWord();
+        }
+
+        function endSession() {
+            const accuracy = progress && progress.total > 0
+                ? Math.round(progress.correct / progress.total * 1000) / 10
+                : 0;
+            document.getElementById('card').classList.add('hidden');
+            document.getElementById('summary').classList.remove('hidden');
+            document.getElementById('summaryStats').textContent = progress
+                ? 'Words studied: ' + progress.total + ' | Correct: ' + progress.correct + ' | Accuracy: ' + accuracy + '%'
+                : 'No deck available offline.';
+            localStorage.removeItem(PROGRESS_KEY);
+            syncAnswers();
+        }
+
+        window.addEventListener('online', syncAnswers);
+        window.addEventListener('offline', () => showSyncInfo(loadQueue().length));
+
+        (async function start() {
+            showSyncInfo(loadQueue().length);
+            syncAnswers();
+            deck = await loadDeck();
+            if (!deck || deck.words.length === 0) {
+                endSession();
+                return;
+            }
+            progress = JSON.parse(localStorage.getItem(PROGRESS_KEY) || 'null');
+            if (!progress || progress.deck_id !== deck.deck_id) {
+                progress = {deck_id: deck.deck_id, index: 0, correct: 0, total: 0};
+            }
+            showWord();
+        })();
+    </script>
+</body>
+</html>
+'''
+
+SERVICE_WORKER_JS = '''
+const CACHE_NAME = 'vocabulary-offline-v1';
+
+self.addEventListener('install', event => {
+    event.waitUntil(caches.open(CACHE_NAME).then(cache => cache.add('/offline')));
+    self.skipWaiting();
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(caches.keys().then(keys => Promise.all(
+        keys.filter(key => key !== CACHE_NAME).map(key => caches.delete(key))
+    )));
+    self.clients.claim();
+});
+
+self.addEventListener('fetch', event => {
+    const url = new URL(event.request.url);
+    if (event.request.method !== 'GET') {
+        return;
+    }
+    if (url.pathname === '/offline' || url.pathname === '/offline_deck') {
+        // Network first so decks stay fresh, cached copy when the connection drops
+        event.respondWith(
+            fetch(event.request).then(response => {
+                const copy = response.clone();
+                caches.open(CACHE_NAME).then(cache => cache.put(event.request, copy));
+                return response;
+            }).catch(() => caches.match(event.request, {ignoreSearch: url.pathname === '/offline'}))
+        );
+    }
+});
+'''
+
+
+def parse_synonyms(text):
+    """Parse comma-separated synonyms and return list"""
+    return [s.strip() for s in text.split(',')]
+
+
+class DeckCache:
+    """Bounded LRU of per-page word lists.
+
+    Entries are keyed by (tenant, page_id, version); every path that
+    changes the words of a page bumps its version, so stale entries are
+    never hit and simply age out. The bound is the total number of cached
+    words.
+    """
+
+    def __init__(self, max_words):
+        self.max_words = max_words
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            words = self.entries.get(key)
+            if words is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return words
+
+    def put(self, key, words):
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+            self.entries[key] = words
+            self.size += len(words)
+            while self.size > self.max_words and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def discard_page(self, tenant, page_id):
+        with self.lock:
+            for key in [key for key in self.entries if key[:2] == (tenant, page_id)]:
+                self.size -= len(self.entries.pop(key))
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'pages': len(self.entries),
+                'words': self.size,
+                'max_words': self.max_words,
+            }
+
+
+deck_cache = DeckCache(int(os.environ.get('DECK_CACHE_WORDS', 200000)))
+
+# Cards kept in the session: the current one plus a look-ahead window
+CARD_WINDOW = 10
+
+METHOD_NAMES = {'write': 'Write', 'say': 'Say', 'choice': 'Multiple Choice'}
+MODE_NAMES = {'smart': 'Smart Mode', 'random': 'Random Mode', 'session': 'Session Mode', 'leitner': 'Leitner Mode'}
+
+LEITNER_BOXES = 5
+
+# Box drawn on each turn: box 1 every other turn, box 2 every fourth, ...
+LEITNER_CADENCE = (1, 2, 1, 3, 1, 2, 1, 4, 1, 2, 1, 5)
+
+# Idempotency keys of applied answers are kept this many seconds (see run_maintenance())
+ANSWER_KEY_TTL = int(os.environ.get('ANSWER_KEY_TTL', 7 * 24 * 3600))
+ANSWER_KEY_LENGTH = 64
+
+
+def select_pages(conn, page_ids=(), deck_ids=()):
+    """Put the chosen pages, and the pages of the chosen saved decks, in temp.selected_pages.
+
+    The deck queries join against this table instead of binding one
+    parameter per page, so a selection of any size is a single indexed join.
+    """
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS selected_pages (page_id INTEGER PRIMARY KEY)')
+    conn.execute('DELETE FROM temp.selected_pages')
+    conn.executemany('INSERT OR IGNORE INTO temp.selected_pages (page_id) VALUES (?)',
+                     ((page_id,) for page_id in page_ids))
+    conn.executemany('''INSERT OR IGNORE INTO temp.selected_pages (page_id)
+                        SELECT page_id FROM deck_pages WHERE deck_id = ?''',
+                     ((deck_id,) for deck_id in deck_ids))
+
+
+def save_deck(conn, name):
+    """Save the current selection under a name, replacing a deck with the same name"""
+    conn.execute('INSERT OR IGNORE INTO decks (name) VALUES (?)', (name,))
+    deck_id = conn.execute('SELECT id FROM decks WHERE name = ?', (name,)).fetchone()[0]
+    conn.execute('DELETE FROM deck_pages WHERE deck_id = ?', (deck_id,))
+    conn.execute('''INSERT INTO deck_pages (deck_id, page_id)
+                    SELECT ?, s.page_id FROM temp.selected_pages s JOIN pages p ON p.id = s.page_id
+                    WHERE p.pending = 0''',
+                 (deck_id,))
+    return deck_id
+
+
+def fetch_deck(conn):
+    """Return (id, english, armenian) tuples for the pages chosen with select_pages().
+
+    Only the page versions are read on every call; the words of a page
+    come from deck_cache unless the page changed since it was cached.
+    """
+    pages = conn.execute('''
+        SELECT p.id, p.version
+        FROM temp.selected_pages s
+        JOIN pages p ON p.id = s.page_id
+        WHERE p.pending = 0
+        ORDER BY p.id
+    ''').fetchall()
+
+    words = []
+    for page in pages:
+        key = (current_tenant(), page['id'], page['version'])
+        page_words = deck_cache.get(key)
+        if page_words is None:
+            page_words = tuple(
+                tuple(row) for row in
+                conn.execute('SELECT id, english, armenian FROM words WHERE page_id = ? ORDER BY id', (page['id'],))
+            )
+            deck_cache.put(key, page_words)
+        words.extend(page_words)
+    return words
+
+
+def order_deck(conn, words, mode):
+    """Return word ids in the order the study mode presents them.
+
+    Smart mode orders the selected pages by score, which answers keep
+    up to date and score_words() refines. Session mode keeps the natural order here; it is
+    shuffled lazily by deck_position().
+    """
+    if mode == 'smart':
+        return [row[0] for row in conn.execute('''
+            SELECT w.id
+            FROM temp.selected_pages sp
+            JOIN words w ON w.page_id = sp.page_id
+            JOIN statistics s ON s.word_id = w.id
+            ORDER BY s.score DESC, w.id
+        ''')]
+    return [word[0] for word in words]
+
+
+def bump_page_version(conn, page_id):
+    """Mark the words of a page as changed so cached copies are not used"""
+    conn.execute('UPDATE pages SET version = version + 1 WHERE id = ?', (page_id,))
+
+
+def pack_ids(ids):
+    """Encode a list of word ids compactly for the session cookie.
+
+    Consecutive ids (the usual case, since words of a page are inserted
+    together) are stored as (first id, length) runs; the first ids are
+    delta-encoded and the result compressed.
+    """
+    runs = []
+    for word_id in ids:
+        if runs and word_id == runs[-2] + runs[-1]:
+            runs[-1] += 1
+        else:
+            runs.extend((word_id, 1))
+    previous = 0
+    for i in range(0, len(runs), 2):
+        runs[i], previous = runs[i] - previous, runs[i]
+    return base64.urlsafe_b64encode(zlib.compress(array('q', runs).tobytes())).decode('ascii')
+
+
+def unpack_runs(packed):
+    """Decode pack_ids() output into (first id of each run, deck offset of each run)"""
+    values = array('q')
+    values.frombytes(zlib.decompress(base64.urlsafe_b64decode(packed)))
+    starts = list(itertools.accumulate(values[0::2]))
+    offsets = [0, *itertools.accumulate(values[1::2])]
+    return starts, offsets
+
+
+def unpack_ids(packed):
+    starts, offsets = unpack_runs(packed)
+    return [word_id for start, begin, end in zip(starts, offsets, offsets[1:]) for word_id in range(start, start + end - begin)]
+
+
+def id_at(runs, position):
+    """Word id at a deck position, in O(log runs) without expanding the deck"""
+    starts, offsets = runs
+    run = bisect.bisect_right(offsets, position) - 1
+    return starts[run] + position - offsets[run]
+
+
+def runs_contain(runs, word_id):
+    starts, offsets = runs
+    return any(start <= word_id < start + end - begin for start, begin, end in zip(starts, offsets, offsets[1:]))
+
+
+def feistel_round(value, round_no, seed):
+    """Round function of permute_index(): a 32-bit integer hash"""
+    x = (value * 0x9E3779B1 + seed + round_no * 0x85EBCA77) & 0xFFFFFFFF
+    x ^= x >> 16
+    x = (x * 0x7FEB352D) & 0xFFFFFFFF
+    x ^= x >> 15
+    x = (x * 0x846CA68B) & 0xFFFFFFFF
+    return x ^ (x >> 16)
+
+
+def permute_index(index, size, seed, rounds=4):
+    """Map index to its place in a seeded shuffle of range(size).
+
+    A balanced Feistel network is a bijection on [0, 4^k); values that land
+    outside [0, size) are fed through again (cycle walking) until they fall
+    inside. The domain is less than four times size, so this takes a few
+    steps on average, and no shuffled list is ever materialized.
+    """
+    if size <= 1:
+        return index
+    half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+    mask = (1 << half_bits) - 1
+    value = index
+    while True:
+        left, right = value >> half_bits, value & mask
+        for round_no in range(rounds):
+            left, right = right, left ^ (feistel_round(right, round_no, seed) & mask)
+        value = (left << half_bits) | right
+        if value < size:
+            return value
+
+
+def deck_position(index):
+    """Deck position of the word shown at index in the current session"""
+    if session['mode'] == 'session':
+        return permute_index(index, session['deck_size'], session['seed'])
+    return index
+
+
+def get_card(word_id, upcoming=()):
+    """Return the word as a dict, or None if it no longer exists.
+
+    The session keeps only a small window of cards; when the word is not in
+    it, the word and the upcoming ids are fetched together by primary key.
+    """
+    card = session['cards'].get(str(word_id))
+    if card is None:
+        cards = get_repository().cards([word_id, *upcoming])
+        session['cards'] = {str(card_id): list(card) for card_id, card in cards.items()}
+        card = session['cards'].get(str(word_id))
+        if card is None:
+            return None
+    return {'id': word_id, 'english': card[0], 'armenian': card[1],
+            'english_forms': card[2], 'armenian_forms': card[3]}
+
+
+def answer_forms(card):
+    """Accepted answers for the card in the session's direction"""
+    return card['armenian_forms'] if session['direction'] == 'en_to_am' else card['english_forms']
+
+
+def get_session_card(word_id):
+    """Like get_card(), but only for words that belong to the current session"""
+    if str(word_id) not in session['cards'] and not runs_contain(unpack_runs(session['deck']), word_id):
+        return None
+    return get_card(word_id)
+
+
+def load_leitner_boxes(conn):
+    """Word ids of the selected pages for each Leitner box"""
+    rows = conn.execute('''
+        SELECT s.word_id, s.box
+        FROM temp.selected_pages sp
+        JOIN words w ON w.page_id = sp.page_id
+        JOIN statistics s ON s.word_id = w.id
+        ORDER BY s.box, s.word_id
+    ''')
+    boxes = [[] for _ in range(LEITNER_BOXES)]
+    for word_id, box in rows:
+        boxes[min(max(box, 1), LEITNER_BOXES) - 1].append(word_id)
+    return boxes
+
+
+def leitner_draw():
+    """Show the first card of the box due on this turn.
+
+    When that box is empty the nearest non-empty box is used instead. The
+    boxes are kept in leitner_queue; the card stays at the head of its box
+    until leitner_place() moves it, so a lost response only shows it again.
+    """
+    due = LEITNER_CADENCE[session['current_index'] % len(LEITNER_CADENCE)]
+    sizes = session['box_sizes']
+    repository = get_repository()
+    while session.get('study_session_id'):
+        box = min((box for box in range(1, LEITNER_BOXES + 1) if sizes[box - 1]),
+                  key=lambda box: (abs(box - due), box), default=None)
+        if box is None:
+            break
+        head = repository.leitner_head(session['study_session_id'], box)
+        if head is not None:
+            position, word_id = head
+            session['leitner_card'] = [word_id, box, position]
+            session['current_word_id'] = word_id
+            session.modified = True
+            return word_id
+        # Words deleted since the session started leave fewer cards than counted
+        sizes[box - 1] = 0
+        session.modified = True
+    return None
+
+
+def leitner_place(box):
+    """Move the drawn card to the end of a box"""
+    word_id, drawn_from, position = session.pop('leitner_card')
+    get_repository().leitner_move(session['study_session_id'], drawn_from, position, box)
+    session['box_sizes'][drawn_from - 1] -= 1
+    session['box_sizes'][box - 1] += 1
+    session.modified = True
+
+
+def grade_answers(user_answers, answer_list):
+    """Check each typed answer against all accepted synonyms (case-insensitive)"""
+    accepted = {normalize_form(answer) for answer in answer_list}
+    return [normalize_form(answer) in accepted for answer in user_answers]
+
+
+def update_word_stats(conn, word_id, correct, studied_at):
+    """Count an answer for a word and move it to its next Leitner box.
+
+    difficulty is updated from the new counts, and recall and score are
+    evaluated for the moment of the answer, when recall is 1 and so
+    score = difficulty * (1 - recall) is 0: a word just answered goes behind
+    the words that are due. score_words() then lets the recall decay.
+    """
+    if correct:
+        conn.execute('''UPDATE statistics
+                        SET correct = correct + 1, box = MIN(box + 1, ?),
+                            last_studied = MAX(COALESCE(last_studied, ''), ?),
+                            difficulty = (incorrect + 1.0) / (correct + incorrect + 3.0),
+                            recall = 1, score = 0
+                        WHERE word_id = ?''', (LEITNER_BOXES, studied_at, word_id))
+    else:
+        conn.execute('''UPDATE statistics
+                        SET incorrect = incorrect + 1, box = 1,
+                            last_studied = MAX(COALESCE(last_studied, ''), ?),
+                            difficulty = (incorrect + 2.0) / (correct + incorrect + 3.0),
+                            recall = 1, score = 0
+                        WHERE word_id = ?''', (studied_at, word_id))
+
+
+def request_answer_key():
+    """Client-generated idempotency key of the answer in this request, if any"""
+    key = request.form.get('answer_key') or request.headers.get('Idempotency-Key')
+    return key[:ANSWER_KEY_LENGTH] if key else None
+
+
+def claim_answer_key(conn, key, word_id):
+    """Remember an applied answer; False when the key was applied before"""
+    cursor = conn.execute('INSERT OR IGNORE INTO applied_answers (key, word_id) VALUES (?, ?)', (key, word_id))
+    return cursor.rowcount == 1
+
+
+def answer_counted(key):
+    """Whether this session already counted the answer to the current word.
+
+    A retry whose first attempt reached the server but whose response was
+    lost arrives with the old cookie; that case is caught by the key in
+    applied_answers instead (see record_word_result()).
+    """
+    return bool(session.get('word_stats_updated') or (key and key == session.get('answer_key')))
+
+
+def record_word_result(repository, word, correct, key=None):
+    """Count an answer in the word statistics and in the running session totals.
+
+    With an idempotency key the statistics are only updated the first time
+    the key is seen; the session totals are still updated, because the
+    cookie carrying the first attempt never made it back to the browser.
+    """
+    counted = repository.record_answer(word['id'], correct, datetime.now(), key)
+    session['answer_key'] = key
+    if session.get('leitner_card'):
+        box = session['leitner_card'][1]
+        leitner_place(min(box + 1, LEITNER_BOXES) if correct else 1)
+
+    if correct:
+        session['stats']['correct'] += 1
+    else:
+        session['stats']['incorrect'] += 1
+
+        # Track wrong word in the saved session; a retried answer is listed once
+        if counted and session.get('study_session_id'):
+            direction = session['direction']
+            prompt = word['english'] if direction == 'en_to_am' else word['armenian']
+            answer = word['armenian'] if direction == 'en_to_am' else word['english']
+            repository.add_wrong_word(session['study_session_id'], prompt, answer)
+
+    session['stats']['total'] += 1
+    session['word_stats_updated'] = True
+    session.modified = True
+
+
+def advance_session():
+    """Drop the per-word state and move on to the next word"""
+    if session.get('leitner_card'):
+        # Skipped: the card goes back to the end of its box
+        leitner_place(session['leitner_card'][1])
+    session['current_word_id'] = None
+
+    for key in list(session.keys()):
+        if key.startswith('field_'):
+            session.pop(key)
+    session.pop('word_stats_updated', None)
+    session.pop('all_revealed', None)
+    session.pop('choice_ids', None)
+
+    if session['mode'] != 'random':
+        session['current_index'] += 1
+
+    session['checked'] = False
+    session['revealed'] = False
+    session['is_correct'] = False
+    session.modified = True
+
+
+# Session keys saved in study_sessions.progress; the deck itself is written once
+CHECKPOINT_KEYS = ('current_index', 'stats', 'box_sizes', 'leitner_card')
+
+# Unfinished sessions not touched for this many seconds are removed by run_maintenance()
+STUDY_SESSION_TTL = int(os.environ.get('STUDY_SESSION_TTL', 30 * 24 * 3600))
+
+
+def session_progress():
+    return {key: session[key] for key in CHECKPOINT_KEYS if key in session}
+
+
+def progress_checksum(progress):
+    return zlib.crc32(json.dumps(progress, sort_keys=True, separators=(',', ':')).encode())
+
+
+def create_study_session(repository, boxes=None):
+    """Save a newly started session so it can be resumed from any device"""
+    progress = session_progress()
+    session['study_session_id'] = repository.create_study_session(
+        session['direction'], session['method'], session['mode'], session['deck'],
+        session['deck_size'], session['seed'], json.dumps(progress), boxes)
+    session['checkpoint'] = progress_checksum(progress)
+
+
+def session_wrong_words():
+    """Words answered wrongly in the current session, for the summary"""
+    if not session.get('study_session_id'):
+        return []
+    return get_repository().wrong_words(session['study_session_id'])
+
+
+def finish_study_session():
+    if session.get('study_session_id'):
+        get_repository().finish_study_session(session['study_session_id'])
+        session.pop('study_session_id')
+
+
+@app.after_request
+def checkpoint_study_session(response):
+    """Write the session progress to study_sessions when it changed in this request.
+
+    Only the progress column is rewritten; wrong words are appended to the
+    row as they happen (see record_word_result()).
+    """
+    if not session.get('study_session_id'):
+        return response
+
+    progress = session_progress()
+    checksum = progress_checksum(progress)
+    if checksum == session.get('checkpoint'):
+        return response
+
+    get_repository().save_progress(session['study_session_id'], json.dumps(progress))
+    session['checkpoint'] = checksum
+    return response
+
+
+def resumable_study_sessions(repository, limit=5):
+    """The most recently studied unfinished sessions, for the setup page"""
+    sessions = []
+    for row in repository.resumable_sessions(limit):
+        progress = json.loads(row['progress'])
+        sessions.append({
+            'id': row['id'],
+            'direction_text': "English → Armenian" if row['direction'] == 'en_to_am' else "Armenian → English",
+            'method_text': METHOD_NAMES.get(row['method'], "Say"),
+            'mode_text': MODE_NAMES.get(row['mode'], "Unknown"),
+            'answered': progress['stats']['total'],
+            'deck_size': row['deck_size'],
+            'updated_at': row['updated_at'],
+        })
+    return sessions
+
+
+def expire_study_sessions(conn, ttl=None):
+    """Delete finished sessions and sessions untouched for ttl seconds"""
+    ttl = STUDY_SESSION_TTL if ttl is None else ttl
+    cursor = conn.execute("DELETE FROM study_sessions WHERE finished = 1 OR updated_at < datetime('now', ?)",
+                          (f'-{int(ttl)} seconds',))
+    conn.commit()
+    return cursor.rowcount
+
+
+# Chunk size suggested to upload clients; each chunk is one request under MAX_CONTENT_LENGTH
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Chunked uploads not continued for this many seconds are removed by run_maintenance()
+UPLOAD_TTL = int(os.environ.get('UPLOAD_TTL', 24 * 3600))
+
+
+def expire_uploads(conn, ttl=None):
+    """Delete abandoned chunked uploads and the words they imported so far"""
+    ttl = UPLOAD_TTL if ttl is None else ttl
+    cursor = conn.execute('''DELETE FROM pages
+                            WHERE id IN (SELECT page_id FROM uploads WHERE updated_at < datetime('now', ?))''',
+                          (f'-{int(ttl)} seconds',))
+    conn.commit()
+    return cursor.rowcount
+
+
+def parser_for_upload(filename):
+    """Build the parser selected on the upload form; 'auto' goes by file extension"""
+    fmt = request.form.get('format', 'auto')
+    if fmt == 'auto':
+        fmt = format_for_filename(filename)
+    return WordFileParser(fmt, request.form.get('separator') or None)
+
+
+# Access and audit logging
+# Request threads only put records on a queue; one listener thread per
+# process writes them as JSON lines to a size-rotated file. {pid} in the path
+# gives every gunicorn worker its own file, so workers never rotate each
+# other's. An empty ACCESS_LOG turns logging off.
+ACCESS_LOG = os.environ.get('ACCESS_LOG', os.path.join('logs', 'access-{pid}.log'))
+ACCESS_LOG_MAX_BYTES = int(os.environ.get('ACCESS_LOG_MAX_BYTES', 10 * 1024 * 1024))
+ACCESS_LOG_BACKUPS = int(os.environ.get('ACCESS_LOG_BACKUPS', 5))
+
+# Records waiting for the listener; beyond this new records are dropped rather than blocking
+ACCESS_LOG_QUEUE_SIZE = int(os.environ.get('ACCESS_LOG_QUEUE_SIZE', 10000))
+
+access_logger = logging.getLogger('vocabulary.access')
+access_logger.setLevel(logging.INFO)
+access_logger.propagate = False
+access_log_lock = threading.Lock()
+# The running QueueListener and the process that started it (listener threads don't survive a fork)
+access_listener = None
+access_listener_pid = None
+
+
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'event': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that counts and drops records when the queue is full"""
+
+    def __init__(self, records):
+        super().__init__(records)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def start_access_log():
+    """Start this process's listener thread unless it is already running"""
+    global access_listener, access_listener_pid
+    if access_listener_pid == os.getpid():
+        return
+    with access_log_lock:
+        if access_listener_pid == os.getpid():
+            return
+        # Handlers inherited from the parent feed a queue nobody reads here
+        access_logger.handlers.clear()
+        path = ACCESS_LOG.format(pid=os.getpid())
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=ACCESS_LOG_MAX_BYTES,
+                                                       backupCount=ACCESS_LOG_BACKUPS, encoding='utf-8')
+        handler.setFormatter(JsonLogFormatter())
+        records = queue.Queue(ACCESS_LOG_QUEUE_SIZE)
+        access_listener = logging.handlers.QueueListener(records, handler)
+        access_listener.start()
+        access_logger.addHandler(DroppingQueueHandler(records))
+        access_listener_pid = os.getpid()
+
+
+@on_shutdown
+def stop_access_log():
+    """Write out the queued records and stop the listener thread"""
+    global access_listener, access_listener_pid
+    with access_log_lock:
+        if access_listener is not None and access_listener_pid == os.getpid():
+            access_listener.stop()
+            for handler in access_listener.handlers:
+                handler.close()
+        access_logger.handlers.clear()
+        access_listener = None
+        access_listener_pid = None
+
+
+# The development server and CLI commands exit without running on_shutdown() hooks
+atexit.register(stop_access_log)
+
+
+def log_event(event, **fields):
+    if not ACCESS_LOG:
+        return
+    start_access_log()
+    access_logger.info(event, extra={'fields': fields})
+
+
+def audit(action, **fields):
+    """Record a change to the stored vocabulary, with who asked for it"""
+    if has_request_context():
+        fields = {'request_id': g.get('request_id'), 'tenant': g.get('tenant'),
+                  'remote_addr': request.remote_addr, **fields}
+    log_event(action, kind='audit', **fields)
+
+
+@app.before_request
+def start_request_log():
+    g.request_id = request.headers.get('X-Request-Id') or secrets.token_hex(8)
+    g.request_started = time.perf_counter()
+    reset_sql_timer()
+
+
+@app.after_request
+def tag_response(response):
+    g.response_status = response.status_code
+    response.headers['X-Request-Id'] = g.get('request_id', '')
+    return response
+
+
+@app.teardown_request
+def write_request_log(exc):
+    """Log the route, latency, SQL time and outcome of every request"""
+    started = g.pop('request_started', None)
+    if started is None or not ACCESS_LOG:
+        return
+    status = 500 if exc is not None else g.get('response_status', 500)
+    log_event(
+        'request',
+        kind='access',
+        request_id=g.get('request_id'),
+        method=request.method,
+        route=request.url_rule.rule if request.url_rule else None,
+        path=request.path,
+        status=status,
+        outcome='error' if status >= 500 else 'rejected' if status >= 400 else 'ok',
+        error=type(exc).__name__ if exc is not None else None,
+        latency_ms=round((time.perf_counter() - started) * 1000, 2),
+        sql_ms=round(_sql_timer.seconds * 1000, 2),
+        sql_statements=_sql_timer.statements,
+        tenant=g.get('tenant'),
+        session_id=session.get('study_session_id'),
+        deck_size=session.get('deck_size'),
+        pid=os.getpid(),
+    )
+
+
+# Admin access and request profiling
+# /admin routes and the X-Profile header need ADMIN_TOKEN in the X-Admin-Token header;
+# without ADMIN_TOKEN they are refused. Query strings end up in logs and
+# Referer headers, so the token is never read from one.
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+# Fraction of requests profiled without being asked (0 disables sampling)
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+
+# Aggregated pstats.Stats and request counts per route rule
+route_profiles = {}
+route_profile_counts = {}
+route_profiles_lock = threading.Lock()
+# cProfile can only run one profiler at a time; busy requests are not profiled
+profiler_lock = threading.Lock()
+
+
+def is_admin_request():
+    if not ADMIN_TOKEN:
+        return False
+    token = request.headers.get('X-Admin-Token', '')
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def require_admin():
+    """Reject the request unless it carries the admin token"""
+    if not is_admin_request():
+        abort(403)
+
+
+def profile_key():
+    return request.url_rule.rule if request.url_rule else '<unmatched>'
+
+
+@app.before_request
+def start_profiling():
+    if not PROFILE_SAMPLE_RATE and not ADMIN_TOKEN:
+        return
+    wanted = random.random() < PROFILE_SAMPLE_RATE or (
+        request.headers.get('X-Profile') == '1' and is_admin_request())
+    if wanted and profiler_lock.acquire(blocking=False):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+@app.teardown_request
+def stop_profiling(exc):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return
+    profiler.disable()
+    profiler_lock.release()
+
+    key = profile_key()
+    stats = pstats.Stats(profiler)
+    with route_profiles_lock:
+        if key in route_profiles:
+            route_profiles[key].add(stats)
+        else:
+            route_profiles[key] = stats
+        route_profile_counts[key] = route_profile_counts.get(key, 0) + 1
+
+
+def merged_profile(route=None):
+    """Stats of one route, or of all routes merged; None when nothing was profiled"""
+    with route_profiles_lock:
+        profiles = [route_profiles[route]] if route in route_profiles else (
+            [] if route else list(route_profiles.values()))
+        if not profiles:
+            return None
+        merged = pstats.Stats()
+        merged.add(*profiles)
+    return merged
+
+
+def frame_label(func):
+    filename, lineno, name = func
+    if filename == '~':
+        return name.replace(';', ',')
+    return f'{name} ({os.path.basename(filename)}:{lineno})'.replace(';', ',')
+
+
+def collapsed_stacks(stats, min_seconds=1e-6, max_depth=64):
+    """Fold a pstats call graph into 'frame;frame;frame microseconds' lines for flame graphs.
+
+    cProfile keeps caller/callee pairs rather than whole stacks, so the time
+    of a function is split among its callers in proportion to the time
+    spent under each call edge.
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller in callers:
+            callees.setdefault(caller, []).append(func)
+
+    folded = {}
+    stack = [((func,), 1.0) for func, entry in stats.stats.items() if not entry[4]]
+    while stack:
+        path, fraction = stack.pop()
+        func = path[-1]
+        _, _, self_time, total_time, _ = stats.stats[func]
+        if self_time * fraction >= min_seconds:
+            line = ';'.join(frame_label(frame) for frame in path)
+            folded[line] = folded.get(line, 0) + self_time * fraction
+        if len(path) >= max_depth:
+            continue
+        for callee in callees.get(func, ()):
+            if callee in path:
+                continue
+            callee_total = stats.stats[callee][3]
+            edge_total = stats.stats[callee][4][func][3]
+            if callee_total and edge_total * fraction >= min_seconds:
+                stack.append((path + (callee,), fraction * edge_total / callee_total))
+
+    return ''.join(f'{line} {round(seconds * 1e6)}\n' for line, seconds in sorted(folded.items()))
+
+
+# Repositories
+# The study and page routes reach storage only through a repository, so
+# their logic can be measured without disk I/O and other stores can be
+# plugged in. Set app.config['REPOSITORY'] to an instance to replace the
+# SQLite repository of the current tenant (see get_repository()).
+class VocabularyRepository(ABC):
+    """Storage operations behind the page and study routes.
+
+    Rows are returned as mappings (sqlite3.Row or dict) with the columns
+    the templates use. Every method is one transaction.
+    """
+
+    # Pages
+    @abstractmethod
+    def list_pages(self):
+        """Visible pages, newest first, with word_count, correct and incorrect"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def study_pages(self):
+        """Visible pages that have words, by name, with word_count"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_page(self, page_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def page_words(self, page_id):
+        """Words of a page in upload order, with correct and incorrect"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def other_pages(self, page_id):
+        """id and name of the visible pages except page_id, by name"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_words(self, text):
+        """Words that have a synonym matching text on either side, with the direction ('en' or 'am') it is on"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_page(self, name, words):
+        """Store (english, armenian) pairs as a new page.
+
+        Returns (page_id, None), or (None, duplicate) without storing
+        anything when a page with the same words exists.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def replace_page_words(self, page_id, words):
+        """Replace the words of a page; returns 'missing', 'unchanged' or 'replaced'.
+
+        Unchanged words keep their ids and statistics.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_page(self, page_id):
+        """Delete a page with its words and their statistics"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def visible_page_ids(self, page_ids, deck_ids):
+        """Ids of the visible pages among page_ids and the pages of the saved decks deck_ids, ascending"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def merge_pages(self, page_ids, name=None):
+        """Move the words of page_ids into the first of them and delete the others.
+
+        Saved decks that contained a merged page get the first page instead.
+        Returns the number of words moved.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def reset_pages(self, page_ids):
+        """Forget answers, Leitner boxes and scores of the words of the pages; returns the word count"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_pages(self, page_ids):
+        """Delete visible pages with their words; returns the number deleted"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def split_page(self, page_id, ranges):
+        """Move the words at the 1-based positions of each (first, last) range into a new page.
+
+        Returns the new page ids; raises ValueError when the page does not exist.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def move_words(self, word_ids, target_id):
+        """Move words to another page; returns the number moved"""
+        raise NotImplementedError
+
+    # Chunked uploads
+    @abstractmethod
+    def start_upload(self, upload_id, name, filename, parser_state):
+        """Create the hidden page an upload is imported into; parser_state is the getstate() of its parser"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def upload_offset(self, upload_id):
+        """Bytes received so far, or None for an unknown upload"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_upload_chunk(self, upload_id, offset, data):
+        """Parse a chunk received at offset and store its complete lines.
+
+        Returns ('added', new offset), ('conflict', expected offset) or
+        ('missing', None).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def finalize_upload(self, upload_id):
+        """Import the last line and show the page of an upload.
+
+        Returns None for an unknown upload, else a dict with page_id,
+        filename, words, parser (for its line errors) and duplicate: the
+        page with the same words, in which case the upload is dropped.
+        """
+        raise NotImplementedError
+
+    # Decks and study sessions
+    @abstractmethod
+    def list_decks(self):
+        """Saved decks by name, with page_count and word_count"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_deck(self, deck_id):
+        """Forget a saved deck; its pages are kept"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def deck_words(self, page_ids, deck_ids, mode):
+        """(id, english, armenian) of the chosen pages and saved decks in the order of the mode"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def build_deck(self, page_ids, deck_ids, mode, save_as=None):
+        """Word ids of the chosen pages and saved decks in the order of the mode.
+
+        Returns (word_ids, boxes); boxes is the list of word ids in each
+        Leitner box in leitner mode and None otherwise. save_as stores the
+        selection as a deck unless it has no words.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_study_session(self, direction, method, mode, deck, deck_size, seed, progress, boxes=None):
+        """Save a new study session (progress as JSON) and its Leitner boxes; returns its id"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def leitner_head(self, session_id, box):
+        """(position, word_id) of the first card of a Leitner box, or None when it is empty"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def leitner_move(self, session_id, box, position, to_box):
+        """Move the card at position in box to the end of to_box"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_study_session(self, session_id):
+        """An unfinished study session, or None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_progress(self, session_id, progress):
+        """Store the JSON progress of a session"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_wrong_word(self, session_id, prompt, answer):
+        """Append a wrongly answered word to a session"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def wrong_words(self, session_id):
+        """[{'prompt', 'answer'}] of a session, finished or not, in the order they were answered"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def finish_study_session(self, session_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def resumable_sessions(self, limit):
+        """The most recently updated unfinished sessions"""
+        raise NotImplementedError
+
+    # Answers
+    @abstractmethod
+    def cards(self, word_ids):
+        """{word_id: (english, armenian, english forms, armenian forms)} for the ids that exist"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def record_answer(self, word_id, correct, studied_at, key=None):
+        """Count an answer; with a key only the first time the key is seen. Returns whether it counted."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def record_answers(self, answers):
+        """Apply (key, word_id, correct, studied_at) answers in one transaction.
+
+        Answers whose key was seen before are skipped. Returns (applied, duplicates).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def choice_candidates(self, word_id, side, column, confusions):
+        """([(id, text)] of up to confusions past wrong picks, [(id, text)] of similar words)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def word_texts(self, word_ids, column):
+        """[(id, text of column)] for the ids that exist"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def record_confusion(self, word_id, side, chosen_id):
+        raise NotImplementedError
+
+
+class SQLiteRepository(VocabularyRepository):
+    """The repository on an open connection, normally get_db()"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def list_pages(self):
+        return self.conn.execute('''
                              SELECT p.*,
                                     COUNT(DISTINCT w.id)          as word_count,
                                     COALESCE(SUM(s.correct), 0)   as correct,
@@ -1104,10 +3438,858 @@ def manage():
                              FROM pages p
                                       LEFT JOIN words w ON p.id = w.page_id
                                       LEFT JOIN statistics s ON w.id = s.word_id
+                             WHERE p.pending = 0
                              GROUP BY p.id
                              ORDER BY p.created_at DESC
                              ''').fetchall()
-    return render_template_string(MANAGE_TEMPLATE, pages=pages)
+
+    def study_pages(self):
+        return self.conn.execute('''
+                             SELECT p.*, COUNT(w.id) as word_count
+                             FROM pages p
+                                      LEFT JOIN words w ON p.id = w.page_id
+                             WHERE p.pending = 0
+                             GROUP BY p.id
+                             HAVING word_count > 0
+                             ORDER BY p.name
+                             ''').fetchall()
+
+    def get_page(self, page_id):
+        return self.conn.execute('SELECT * FROM pages WHERE id = ?', (page_id,)).fetchone()
+
+    def page_words(self, page_id):
+        return self.conn.execute('''
+                             SELECT w.*,
+                                    COALESCE(s.correct, 0)   as correct,
+                                    COALESCE(s.incorrect, 0) as incorrect
+                             FROM words w
+                                      LEFT JOIN statistics s ON w.id = s.word_id
+                             WHERE w.page_id = ?
+                             ORDER BY w.id
+                             ''', (page_id,)).fetchall()
+
+    def other_pages(self, page_id):
+        return self.conn.execute('SELECT id, name FROM pages WHERE id != ? AND pending = 0 ORDER BY name',
+                                 (page_id,)).fetchall()
+
+    def find_words(self, text):
+        return self.conn.execute('''
+            SELECT DISTINCT w.id, w.page_id, w.english, w.armenian, f.direction
+            FROM word_forms f
+            JOIN words w ON w.id = f.word_id
+            WHERE f.normalized = ?
+            ORDER BY w.id
+        ''', (normalize_form(text),)).fetchall()
+
+    def add_page(self, name, words):
+        conn = self.conn
+        digest = hashlib.sha256()
+        # Parse and hash first: a duplicate is detected without writing anything
+        words = list(hashing_words(words, digest))
+        duplicate = find_duplicate_page(conn, digest.hexdigest())
+        if duplicate:
+            return None, duplicate
+        with conn:
+            # Check again under the write lock, in case the same file was just added by another request
+            conn.execute('BEGIN IMMEDIATE')
+            duplicate = find_duplicate_page(conn, digest.hexdigest())
+            if duplicate:
+                return None, duplicate
+            cursor = conn.execute('INSERT INTO pages (name, content_hash) VALUES (?, ?)', (name, digest.hexdigest()))
+            page_id = cursor.lastrowid
+            import_words(conn, page_id, words)
+        return page_id, None
+
+    def replace_page_words(self, page_id, words):
+        conn = self.conn
+        digest = hashlib.sha256()
+        # Parse and hash first: the same words are detected without taking the write lock
+        words = list(hashing_words(words, digest))
+        page = conn.execute('SELECT content_hash FROM pages WHERE id = ?', (page_id,)).fetchone()
+        if page is None:
+            return 'missing'
+        if digest.hexdigest() == page['content_hash']:
+            # Same words: keep the existing rows, their ids and statistics
+            return 'unchanged'
+        with conn:
+            if not conn.execute('UPDATE pages SET content_hash = ? WHERE id = ?',
+                                (digest.hexdigest(), page_id)).rowcount:
+                return 'missing'
+            conn.execute('DELETE FROM words WHERE page_id = ?', (page_id,))
+            import_words(conn, page_id, words)
+            bump_page_version(conn, page_id)
+        return 'replaced'
+
+    def delete_page(self, page_id):
+        with self.conn:
+            bump_page_version(self.conn, page_id)
+            self.conn.execute('DELETE FROM pages WHERE id = ?', (page_id,))
+
+    def visible_page_ids(self, page_ids, deck_ids):
+        with self.conn:
+            select_pages(self.conn, page_ids, deck_ids)
+            return selected_page_ids(self.conn)
+
+    def merge_pages(self, page_ids, name=None):
+        with self.conn:
+            select_pages(self.conn, page_ids)
+            return merge_pages(self.conn, page_ids[0], name)
+
+    def reset_pages(self, page_ids):
+        with self.conn:
+            select_pages(self.conn, page_ids)
+            return reset_page_stats(self.conn)
+
+    def delete_pages(self, page_ids):
+        with self.conn:
+            select_pages(self.conn, page_ids)
+            return delete_pages(self.conn)
+
+    def split_page(self, page_id, ranges):
+        with self.conn:
+            return split_page(self.conn, page_id, ranges)
+
+    def move_words(self, word_ids, target_id):
+        with self.conn:
+            return move_words(self.conn, [(word_id, word_id) for word_id in word_ids], target_id)
+
+    def start_upload(self, upload_id, name, filename, parser_state):
+        with self.conn:
+            cursor = self.conn.execute('INSERT INTO pages (name, pending) VALUES (?, 1)', (name,))
+            self.conn.execute('INSERT INTO uploads (id, page_id, filename, parser_state) VALUES (?, ?, ?, ?)',
+                              (upload_id, cursor.lastrowid, filename, json.dumps(parser_state)))
+
+    def upload_offset(self, upload_id):
+        upload = self.conn.execute('SELECT received FROM uploads WHERE id = ?', (upload_id,)).fetchone()
+        return upload['received'] if upload else None
+
+    def add_upload_chunk(self, upload_id, offset, data):
+        conn = self.conn
+        with conn:
+            # Take the write lock first so concurrent retries of a chunk are serialized
+            conn.execute('BEGIN IMMEDIATE')
+            upload = conn.execute('SELECT page_id, received, parser_state FROM uploads WHERE id = ?',
+                                  (upload_id,)).fetchone()
+            if upload is None:
+                return 'missing', None
+            if offset != upload['received']:
+                return 'conflict', upload['received']
+
+            parser = WordFileParser.from_state(json.loads(upload['parser_state']))
+            append_words(conn, upload['page_id'], parser.feed(data))
+            conn.execute('''UPDATE uploads
+                            SET received = received + ?, parser_state = ?, updated_at = CURRENT_TIMESTAMP
+                            WHERE id = ?''', (len(data), json.dumps(parser.getstate()), upload_id))
+        return 'added', offset + len(data)
+
+    def finalize_upload(self, upload_id):
+        conn = self.conn
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            upload = conn.execute('SELECT page_id, filename, parser_state FROM uploads WHERE id = ?',
+                                  (upload_id,)).fetchone()
+            if upload is None:
+                return None
+
+            page_id = upload['page_id']
+            parser = WordFileParser.from_state(json.loads(upload['parser_state']))
+            import_words(conn, page_id, parser.close())
+            # The hash state can't be kept between chunks, so hash the stored words
+            content_hash = page_content_hash(conn, page_id)
+            duplicate = find_duplicate_page(conn, content_hash, page_id)
+            if duplicate:
+                conn.execute('DELETE FROM pages WHERE id = ?', (page_id,))
+                words = 0
+            else:
+                conn.execute('UPDATE pages SET pending = 0, content_hash = ? WHERE id = ?', (content_hash, page_id))
+                conn.execute('DELETE FROM uploads WHERE id = ?', (upload_id,))
+                words = conn.execute('SELECT COUNT(*) FROM words WHERE page_id = ?', (page_id,)).fetchone()[0]
+        return {'page_id': page_id, 'filename': upload['filename'], 'words': words, 'parser': parser,
+                'duplicate': duplicate}
+
+    def list_decks(self):
+        return self.conn.execute('''
+                             SELECT d.id, d.name, COUNT(DISTINCT dp.page_id) as page_count, COUNT(w.id) as word_count
+                             FROM decks d
+                                      LEFT JOIN deck_pages dp ON dp.deck_id = d.id
+                                      LEFT JOIN words w ON w.page_id = dp.page_id
+                             GROUP BY d.id
+                             ORDER BY d.name
+                             ''').fetchall()
+
+    def delete_deck(self, deck_id):
+        with self.conn:
+            self.conn.execute('DELETE FROM decks WHERE id = ?', (deck_id,))
+
+    def deck_words(self, page_ids, deck_ids, mode):
+        conn = self.conn
+        with conn:
+            select_pages(conn, page_ids, deck_ids)
+            words = fetch_deck(conn)
+            word_order = order_deck(conn, words, mode)
+        words_by_id = {word[0]: word for word in words}
+        return [words_by_id[word_id] for word_id in word_order]
+
+    def build_deck(self, page_ids, deck_ids, mode, save_as=None):
+        conn = self.conn
+        with conn:
+            select_pages(conn, page_ids, deck_ids)
+            word_ids = order_deck(conn, fetch_deck(conn), mode)
+            if save_as and word_ids:
+                save_deck(conn, save_as)
+            boxes = load_leitner_boxes(conn) if mode == 'leitner' else None
+        return word_ids, boxes
+
+    def create_study_session(self, direction, method, mode, deck, deck_size, seed, progress, boxes=None):
+        with self.conn:
+            cursor = self.conn.execute('''INSERT INTO study_sessions
+                                          (direction, method, mode, deck, deck_size, seed, progress)
+                                          VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                                       (direction, method, mode, deck, deck_size, seed, progress))
+            session_id = cursor.lastrowid
+            for box, word_ids in enumerate(boxes or (), start=1):
+                self.conn.executemany('''INSERT INTO leitner_queue (session_id, box, position, word_id)
+                                          VALUES (?, ?, ?, ?)''',
+                                      ((session_id, box, position, word_id)
+                                       for position, word_id in enumerate(word_ids)))
+        return session_id
+
+    def leitner_head(self, session_id, box):
+        row = self.conn.execute('''SELECT position, word_id FROM leitner_queue
+                                    WHERE session_id = ? AND box = ?
+                                    ORDER BY position LIMIT 1''', (session_id, box)).fetchone()
+        return tuple(row) if row else None
+
+    def leitner_move(self, session_id, box, position, to_box):
+        with self.conn:
+            self.conn.execute('''UPDATE leitner_queue
+                                 SET box = ?,
+                                     position = (SELECT COALESCE(MAX(position), -1) + 1 FROM leitner_queue
+                                                 WHERE session_id = ? AND box = ?)
+                                 WHERE session_id = ? AND box = ? AND position = ?''',
+                              (to_box, session_id, to_box, session_id, box, position))
+
+    def get_study_session(self, session_id):
+        return self.conn.execute('SELECT * FROM study_sessions WHERE id = ? AND finished = 0',
+                                 (session_id,)).fetchone()
+
+    def save_progress(self, session_id, progress):
+        with self.conn:
+            self.conn.execute('''UPDATE study_sessions SET progress = ?, updated_at = CURRENT_TIMESTAMP
+                                 WHERE id = ?''', (progress, session_id))
+
+    def add_wrong_word(self, session_id, prompt, answer):
+        with self.conn:
+            self.conn.execute('''UPDATE study_sessions
+                                 SET wrong_words = json_insert(wrong_words, '$[#]', json_object('prompt', ?, 'answer', ?))
+                                 WHERE id = ?''', (prompt, answer, session_id))
+
+    def wrong_words(self, session_id):
+        row = self.conn.execute('SELECT wrong_words FROM study_sessions WHERE id = ?', (session_id,)).fetchone()
+        return json.loads(row['wrong_words']) if row else []
+
+    def finish_study_session(self, session_id):
+        with self.conn:
+            self.conn.execute('UPDATE study_sessions SET finished = 1 WHERE id = ?', (session_id,))
+            self.conn.execute('DELETE FROM leitner_queue WHERE session_id = ?', (session_id,))
+
+    def resumable_sessions(self, limit):
+        return self.conn.execute('''SELECT id, direction, method, mode, deck_size, progress, updated_at
+                                    FROM study_sessions
+                                    WHERE finished = 0
+                                    ORDER BY updated_at DESC
+                                    LIMIT ?''', (limit,)).fetchall()
+
+    def cards(self, word_ids):
+        placeholders = ','.join('?' * len(word_ids))
+        words = self.conn.execute(f'SELECT id, english, armenian FROM words WHERE id IN ({placeholders})', word_ids)
+        cards = {row['id']: (row['english'], row['armenian'], [], []) for row in words}
+        forms = self.conn.execute(f'''
+            SELECT word_id, direction, text
+            FROM word_forms
+            WHERE word_id IN ({placeholders})
+            ORDER BY word_id, direction, position
+        ''', word_ids)
+        for form in forms:
+            cards[form['word_id']][2 if form['direction'] == 'en' else 3].append(form['text'])
+        return cards
+
+    def record_answer(self, word_id, correct, studied_at, key=None):
+        with self.conn:
+            if key is not None and not claim_answer_key(self.conn, key, word_id):
+                return False
+            update_word_stats(self.conn, word_id, correct, studied_at)
+        return True
+
+    def record_answers(self, answers):
+        applied = duplicates = 0
+        with self.conn:
+            for key, word_id, correct, studied_at in answers:
+                if not claim_answer_key(self.conn, key, word_id):
+                    duplicates += 1
+                    continue
+                update_word_stats(self.conn, word_id, correct, studied_at)
+                applied += 1
+        return applied, duplicates
+
+    def choice_candidates(self, word_id, side, column, confusions):
+        confused = self.conn.execute(f'''SELECT w.id, w.{column} FROM confusions c
+                                         JOIN words w ON w.id = c.chosen_id
+                                         WHERE c.word_id = ? AND c.side = ?
+                                         ORDER BY c.count DESC LIMIT ?''', (word_id, side, confusions)).fetchall()
+        similar = self.conn.execute(f'''SELECT w.id, w.{column} FROM distractors d
+                                        JOIN words w ON w.id = d.distractor_id
+                                        WHERE d.word_id = ? AND d.side = ?
+                                        ORDER BY d.rank''', (word_id, side)).fetchall()
+        return confused, similar
+
+    def word_texts(self, word_ids, column):
+        placeholders = ','.join('?' * len(word_ids))
+        return self.conn.execute(f'SELECT id, {column} FROM words WHERE id IN ({placeholders})',
+                                 tuple(word_ids)).fetchall()
+
+    def record_confusion(self, word_id, side, chosen_id):
+        with self.conn:
+            self.conn.execute('''INSERT INTO confusions (word_id, side, chosen_id) VALUES (?, ?, ?)
+                                 ON CONFLICT (word_id, side, chosen_id) DO UPDATE SET count = count + 1''',
+                              (word_id, side, chosen_id))
+
+
+class MemoryRepository(VocabularyRepository):
+    """The repository in plain dicts, for tests and benchmarks that leave out disk I/O.
+
+    Nothing is persisted and there are no tenants. Multiple-choice
+    distractors are not indexed, so options are random deck words plus
+    past confusions.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.pages = {}
+        self.words = {}
+        self.page_word_ids = {}
+        self.stats = {}
+        self.decks = {}
+        self.study_sessions = {}
+        # (session_id, box) -> deque of (position, word_id)
+        self.leitner_queues = {}
+        self.applied_answers = set()
+        self.confusions = Counter()
+        self.uploads = {}
+        self.counters = {}
+
+    def next_id(self, table):
+        self.counters[table] = self.counters.get(table, 0) + 1
+        return self.counters[table]
+
+    def visible_pages(self):
+        return [page for page in self.pages.values() if not page['pending']]
+
+    def select(self, page_ids, deck_ids=()):
+        """Ids of the visible pages among page_ids and the pages of the saved decks deck_ids, ascending"""
+        selected = set(page_ids)
+        for deck_id in deck_ids:
+            selected.update(self.decks[deck_id]['page_ids'] if deck_id in self.decks else ())
+        return sorted(page_id for page_id in selected if page_id in self.pages and not self.pages[page_id]['pending'])
+
+    def new_page(self, name, pending=0):
+        page_id = self.next_id('pages')
+        self.pages[page_id] = {'id': page_id, 'name': name, 'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                               'version': 0, 'pending': pending, 'content_hash': None}
+        return page_id
+
+    def remove_page(self, page_id):
+        self.drop_words(page_id)
+        del self.pages[page_id]
+        for deck in self.decks.values():
+            deck['page_ids'].discard(page_id)
+        for upload_id in [upload_id for upload_id, upload in self.uploads.items() if upload['page_id'] == page_id]:
+            del self.uploads[upload_id]
+
+    def words_changed(self, page_id):
+        """Bump the version and recompute the content hash of a page whose words changed"""
+        digest = hashlib.sha256()
+        for _ in hashing_words(((self.words[word_id]['english'], self.words[word_id]['armenian'])
+                                for word_id in self.page_word_ids[page_id]), digest):
+            pass
+        self.pages[page_id]['content_hash'] = digest.hexdigest()
+        self.pages[page_id]['version'] += 1
+
+    @staticmethod
+    def empty_stats():
+        return {'correct': 0, 'incorrect': 0, 'last_studied': None, 'box': 1,
+                'difficulty': 0.5, 'recall': 0.0, 'score': 0.5}
+
+    def page_totals(self, page):
+        word_ids = self.page_word_ids[page['id']]
+        return dict(page,
+                    word_count=len(word_ids),
+                    correct=sum(self.stats[word_id]['correct'] for word_id in word_ids),
+                    incorrect=sum(self.stats[word_id]['incorrect'] for word_id in word_ids))
+
+    def list_pages(self):
+        with self.lock:
+            pages = sorted(self.visible_pages(), key=lambda page: (page['created_at'], page['id']), reverse=True)
+            return [self.page_totals(page) for page in pages]
+
+    def study_pages(self):
+        with self.lock:
+            pages = sorted(self.visible_pages(), key=lambda page: page['name'])
+            return [dict(page, word_count=len(self.page_word_ids[page['id']]))
+                    for page in pages if self.page_word_ids[page['id']]]
+
+    def get_page(self, page_id):
+        with self.lock:
+            page = self.pages.get(page_id)
+            return dict(page) if page else None
+
+    def page_words(self, page_id):
+        with self.lock:
+            return [dict(self.words[word_id], correct=self.stats[word_id]['correct'],
+                         incorrect=self.stats[word_id]['incorrect'])
+                    for word_id in self.page_word_ids.get(page_id, ())]
+
+    def other_pages(self, page_id):
+        with self.lock:
+            return [{'id': page['id'], 'name': page['name']}
+                    for page in sorted(self.visible_pages(), key=lambda page: page['name'])
+                    if page['id'] != page_id]
+
+    def find_words(self, text):
+        normalized = normalize_form(text)
+        with self.lock:
+            return [{'id': word['id'], 'page_id': word['page_id'], 'english': word['english'],
+                     'armenian': word['armenian'], 'direction': direction}
+                    for word in sorted(self.words.values(), key=lambda word: word['id'])
+                    for direction, side in (('en', word['english']), ('am', word['armenian']))
+                    if any(normalize_form(form) == normalized for form in parse_synonyms(side) if form)]
+
+    def store_words(self, page_id, words):
+        word_ids = []
+        for english, armenian in words:
+            word_id = self.next_id('words')
+            self.words[word_id] = {'id': word_id, 'page_id': page_id, 'english': english, 'armenian': armenian}
+            self.stats[word_id] = self.empty_stats()
+            word_ids.append(word_id)
+        self.page_word_ids.setdefault(page_id, []).extend(word_ids)
+
+    def drop_words(self, page_id):
+        for word_id in self.page_word_ids.pop(page_id, ()):
+            del self.words[word_id]
+            del self.stats[word_id]
+
+    def find_duplicate(self, content_hash, page_id=None):
+        for page in self.visible_pages():
+            if page['content_hash'] == content_hash and page['id'] != page_id:
+                return {'id': page['id'], 'name': page['name']}
+        return None
+
+    def add_page(self, name, words):
+        digest = hashlib.sha256()
+        words = list(hashing_words(words, digest))
+        with self.lock:
+            duplicate = self.find_duplicate(digest.hexdigest())
+            if duplicate:
+                return None, duplicate
+            page_id = self.new_page(name)
+            self.pages[page_id]['content_hash'] = digest.hexdigest()
+            self.store_words(page_id, words)
+        return page_id, None
+
+    def replace_page_words(self, page_id, words):
+        digest = hashlib.sha256()
+        words = list(hashing_words(words, digest))
+        with self.lock:
+            page = self.pages.get(page_id)
+            if page is None:
+                return 'missing'
+            if digest.hexdigest() == page['content_hash']:
+                return 'unchanged'
+            self.drop_words(page_id)
+            self.store_words(page_id, words)
+            page['content_hash'] = digest.hexdigest()
+            page['version'] += 1
+        return 'replaced'
+
+    def delete_page(self, page_id):
+        with self.lock:
+            if page_id in self.pages:
+                self.remove_page(page_id)
+
+    def visible_page_ids(self, page_ids, deck_ids):
+        with self.lock:
+            return self.select(page_ids, deck_ids)
+
+    def merge_pages(self, page_ids, name=None):
+        target_id = page_ids[0]
+        with self.lock:
+            merged = [page_id for page_id in self.select(page_ids) if page_id != target_id]
+            moved = 0
+            for page_id in merged:
+                word_ids = self.page_word_ids.pop(page_id)
+                for word_id in word_ids:
+                    self.words[word_id]['page_id'] = target_id
+                self.page_word_ids[target_id].extend(word_ids)
+                moved += len(word_ids)
+                del self.pages[page_id]
+            for deck in self.decks.values():
+                if deck['page_ids'] & set(merged):
+                    deck['page_ids'] = (deck['page_ids'] - set(merged)) | {target_id}
+            if name:
+                self.pages[target_id]['name'] = name
+            self.page_word_ids[target_id].sort()
+            self.words_changed(target_id)
+        return moved
+
+    def reset_pages(self, page_ids):
+        with self.lock:
+            word_ids = [word_id for page_id in page_ids for word_id in self.page_word_ids.get(page_id, ())]
+            for word_id in word_ids:
+                self.stats[word_id] = self.empty_stats()
+        return len(word_ids)
+
+    def delete_pages(self, page_ids):
+        with self.lock:
+            page_ids = self.select(page_ids)
+            for page_id in page_ids:
+                self.remove_page(page_id)
+        return len(page_ids)
+
+    def split_page(self, page_id, ranges):
+        with self.lock:
+            page = self.pages.get(page_id)
+            if page is None:
+                raise ValueError(f'no page {page_id}')
+            word_ids = self.page_word_ids[page_id]
+            new_ids = []
+            for number, (first, last) in enumerate(ranges, 1):
+                new_id = self.new_page(f"{page['name']} ({number})")
+                self.page_word_ids[new_id] = word_ids[first - 1:last]
+                for word_id in self.page_word_ids[new_id]:
+                    self.words[word_id]['page_id'] = new_id
+                new_ids.append(new_id)
+            self.page_word_ids[page_id] = [word_id for word_id in word_ids if self.words[word_id]['page_id'] == page_id]
+            for changed_id in (page_id, *new_ids):
+                self.words_changed(changed_id)
+        return new_ids
+
+    def move_words(self, word_ids, target_id):
+        with self.lock:
+            moved = {word_id for word_id in word_ids
+                     if word_id in self.words and self.words[word_id]['page_id'] != target_id}
+            source_ids = {self.words[word_id]['page_id'] for word_id in moved}
+            for source_id in source_ids:
+                self.page_word_ids[source_id] = [word_id for word_id in self.page_word_ids[source_id]
+                                                 if word_id not in moved]
+            for word_id in moved:
+                self.words[word_id]['page_id'] = target_id
+            self.page_word_ids[target_id] = sorted(self.page_word_ids[target_id] + list(moved))
+            for page_id in (*source_ids, target_id):
+                self.words_changed(page_id)
+        return len(moved)
+
+    def start_upload(self, upload_id, name, filename, parser_state):
+        with self.lock:
+            page_id = self.new_page(name, pending=1)
+            self.page_word_ids[page_id] = []
+            self.uploads[upload_id] = {'page_id': page_id, 'filename': filename, 'received': 0,
+                                       'parser_state': parser_state}
+
+    def upload_offset(self, upload_id):
+        with self.lock:
+            upload = self.uploads.get(upload_id)
+            return upload['received'] if upload else None
+
+    def add_upload_chunk(self, upload_id, offset, data):
+        with self.lock:
+            upload = self.uploads.get(upload_id)
+            if upload is None:
+                return 'missing', None
+            if offset != upload['received']:
+                return 'conflict', upload['received']
+            parser = WordFileParser.from_state(upload['parser_state'])
+            self.store_words(upload['page_id'], parser.feed(data))
+            upload['received'] += len(data)
+            upload['parser_state'] = parser.getstate()
+        return 'added', upload['received']
+
+    def finalize_upload(self, upload_id):
+        with self.lock:
+            upload = self.uploads.pop(upload_id, None)
+            if upload is None:
+                return None
+            page_id = upload['page_id']
+            parser = WordFileParser.from_state(upload['parser_state'])
+            self.store_words(page_id, parser.close())
+            self.words_changed(page_id)
+            duplicate = self.find_duplicate(self.pages[page_id]['content_hash'], page_id)
+            if duplicate:
+                self.remove_page(page_id)
+            else:
+                self.pages[page_id]['pending'] = 0
+            return {'page_id': page_id, 'filename': upload['filename'], 'parser': parser, 'duplicate': duplicate,
+                    'words': 0 if duplicate else len(self.page_word_ids[page_id])}
+
+    def list_decks(self):
+        with self.lock:
+            return [{'id': deck['id'], 'name': deck['name'], 'page_count': len(deck['page_ids']),
+                     'word_count': sum(len(self.page_word_ids.get(page_id, ())) for page_id in deck['page_ids'])}
+                    for deck in sorted(self.decks.values(), key=lambda deck: deck['name'])]
+
+    def delete_deck(self, deck_id):
+        with self.lock:
+            self.decks.pop(deck_id, None)
+
+    def deck_words(self, page_ids, deck_ids, mode):
+        with self.lock:
+            word_ids, _ = self.build_deck(page_ids, deck_ids, mode)
+            return [(word_id, self.words[word_id]['english'], self.words[word_id]['armenian'])
+                    for word_id in word_ids]
+
+    def build_deck(self, page_ids, deck_ids, mode, save_as=None):
+        with self.lock:
+            selected = self.select(page_ids, deck_ids)
+            if save_as and any(self.page_word_ids[page_id] for page_id in selected):
+                deck = next((deck for deck in self.decks.values() if deck['name'] == save_as), None)
+                if deck is None:
+                    deck = {'id': self.next_id('decks'), 'name': save_as}
+                    self.decks[deck['id']] = deck
+                deck['page_ids'] = set(selected)
+
+            word_ids = [word_id for page_id in selected for word_id in self.page_word_ids[page_id]]
+            if mode == 'smart':
+                word_ids.sort(key=lambda word_id: (-self.stats[word_id]['score'], word_id))
+            boxes = None
+            if mode == 'leitner':
+                by_box = [[] for _ in range(LEITNER_BOXES)]
+                for word_id in sorted(word_ids):
+                    by_box[min(max(self.stats[word_id]['box'], 1), LEITNER_BOXES) - 1].append(word_id)
+                boxes = by_box
+        return word_ids, boxes
+
+    def create_study_session(self, direction, method, mode, deck, deck_size, seed, progress, boxes=None):
+        with self.lock:
+            session_id = self.next_id('study_sessions')
+            self.study_sessions[session_id] = {
+                'id': session_id, 'direction': direction, 'method': method, 'mode': mode, 'deck': deck,
+                'deck_size': deck_size, 'seed': seed, 'progress': progress, 'wrong_words': [],
+                'finished': 0, 'updated_at': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()),
+            }
+            for box, word_ids in enumerate(boxes or (), start=1):
+                self.leitner_queues[session_id, box] = deque(enumerate(word_ids))
+        return session_id
+
+    def leitner_head(self, session_id, box):
+        with self.lock:
+            queue = self.leitner_queues.get((session_id, box))
+            while queue and queue[0][1] not in self.words:
+                queue.popleft()
+            return tuple(queue[0]) if queue else None
+
+    def leitner_move(self, session_id, box, position, to_box):
+        with self.lock:
+            queue = self.leitner_queues.get((session_id, box))
+            if not queue or queue[0][0] != position:
+                return
+            _, word_id = queue.popleft()
+            target = self.leitner_queues.setdefault((session_id, to_box), deque())
+            target.append((target[-1][0] + 1 if target else 0, word_id))
+
+    def get_study_session(self, session_id):
+        with self.lock:
+            row = self.study_sessions.get(session_id)
+            return dict(row) if row and not row['finished'] else None
+
+    def save_progress(self, session_id, progress):
+        with self.lock:
+            row = self.study_sessions.get(session_id)
+            if row is None:
+                return
+            row['progress'] = progress
+            row['updated_at'] = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+    def add_wrong_word(self, session_id, prompt, answer):
+        with self.lock:
+            row = self.study_sessions.get(session_id)
+            if row is not None:
+                row['wrong_words'].append({'prompt': prompt, 'answer': answer})
+
+    def wrong_words(self, session_id):
+        with self.lock:
+            row = self.study_sessions.get(session_id)
+            return list(row['wrong_words']) if row else []
+
+    def finish_study_session(self, session_id):
+        with self.lock:
+            if session_id in self.study_sessions:
+                self.study_sessions[session_id]['finished'] = 1
+            for box in range(1, LEITNER_BOXES + 1):
+                self.leitner_queues.pop((session_id, box), None)
+
+    def resumable_sessions(self, limit):
+        with self.lock:
+            rows = [dict(row) for row in self.study_sessions.values() if not row['finished']]
+        rows.sort(key=lambda row: (row['updated_at'], row['id']), reverse=True)
+        return rows[:limit]
+
+    def cards(self, word_ids):
+        with self.lock:
+            return {word_id: (word['english'], word['armenian'],
+                              [form for form in parse_synonyms(word['english']) if form],
+                              [form for form in parse_synonyms(word['armenian']) if form])
+                    for word_id, word in ((word_id, self.words.get(word_id)) for word_id in word_ids) if word}
+
+    def record_answer(self, word_id, correct, studied_at, key=None):
+        with self.lock:
+            if key is not None:
+                if key in self.applied_answers:
+                    return False
+                self.applied_answers.add(key)
+            stats = self.stats.get(word_id)
+            if stats is None:
+                return True
+            if correct:
+                stats['correct'] += 1
+                stats['box'] = min(stats['box'] + 1, LEITNER_BOXES)
+            else:
+                stats['incorrect'] += 1
+                stats['box'] = 1
+            stats['last_studied'] = max(stats['last_studied'] or '', str(studied_at))
+            # As update_word_stats(): recall is 1 at the moment of the answer
+            stats['difficulty'] = (stats['incorrect'] + 1) / (stats['correct'] + stats['incorrect'] + 2)
+            stats['recall'] = 1.0
+            stats['score'] = stats['difficulty'] * (1 - stats['recall'])
+        return True
+
+    def record_answers(self, answers):
+        applied = duplicates = 0
+        with self.lock:
+            for key, word_id, correct, studied_at in answers:
+                if self.record_answer(word_id, correct, studied_at, key):
+                    applied += 1
+                else:
+                    duplicates += 1
+        return applied, duplicates
+
+    def choice_candidates(self, word_id, side, column, confusions):
+        with self.lock:
+            picks = [(chosen_id, count) for (confused_id, confused_side, chosen_id), count in self.confusions.items()
+                     if confused_id == word_id and confused_side == side and chosen_id in self.words]
+            picks.sort(key=lambda pick: -pick[1])
+            return [(chosen_id, self.words[chosen_id][column]) for chosen_id, _ in picks[:confusions]], []
+
+    def word_texts(self, word_ids, column):
+        with self.lock:
+            return [(word_id, self.words[word_id][column]) for word_id in word_ids if word_id in self.words]
+
+    def record_confusion(self, word_id, side, chosen_id):
+        with self.lock:
+            self.confusions[word_id, side, chosen_id] += 1
+
+
+def get_repository():
+    """Storage for the routes: app.config['REPOSITORY'] when set, else the current tenant's database"""
+    repository = app.config.get('REPOSITORY')
+    return repository if repository is not None else SQLiteRepository(get_db())
+
+
+# Tenant selection
+# Sessions hold word, page and study session ids, so each tenant gets its
+# own session cookie and switching tenants never mixes them up.
+TENANT_COOKIE = 'tenant'
+
+
+def tenant_from_request():
+    tenant = request.headers.get('X-Tenant') or request.cookies.get(TENANT_COOKIE)
+    return tenant or None
+
+
+class TenantSessionInterface(SecureCookieSessionInterface):
+    def get_cookie_name(self, app):
+        name = super().get_cookie_name(app)
+        tenant = tenant_from_request() if has_request_context() else None
+        if tenant is None or not TENANT_NAME.fullmatch(tenant):
+            return name
+        return f'{name}-{tenant}'
+
+
+app.session_interface = TenantSessionInterface()
+
+
+@app.before_request
+def select_tenant():
+    """Route this request's get_db() calls to the tenant it names"""
+    tenant = tenant_from_request()
+    if tenant is not None and not tenant_exists(tenant) and request.endpoint != 'switch_tenant':
+        abort(404, f'Unknown tenant {tenant!r}')
+    g.tenant = tenant
+
+
+@app.teardown_request
+def end_transactions(exc):
+    """Roll back whatever the request left uncommitted on this thread's pooled connections"""
+    for conn in open_connections().values():
+        if conn.in_transaction:
+            conn.rollback()
+
+
+# Routes
+@app.route('/')
+def index():
+    return render_template_string(HOME_TEMPLATE, tenant=current_tenant())
+
+
+@app.route('/tenant', methods=['POST'])
+def switch_tenant():
+    """Choose the tenant this browser studies with; an empty name returns to the default database"""
+    tenant = request.form.get('tenant', '').strip().lower()
+    response = redirect(url_for('index'))
+    if not tenant:
+        response.delete_cookie(TENANT_COOKIE)
+        return response
+    if not tenant_exists(tenant):
+        abort(404, f'Unknown tenant {tenant!r}')
+    response.set_cookie(TENANT_COOKIE, tenant, max_age=365 * 24 * 3600, samesite='Lax')
+    return response
+
+
+@app.route('/end_session')
+def end_session():
+    """End the current session and show statistics"""
+    if 'deck' not in session:
+        return redirect(url_for('study'))
+    wrong_words = session_wrong_words()
+    finish_study_session()
+
+    direction = session.get('direction')
+    method = session.get('method')
+    mode = session.get('mode')
+
+    session_stats = session.get('stats', {'correct': 0, 'incorrect': 0, 'total': 0})
+    if session_stats['total'] > 0:
+        session_stats['accuracy'] = round((session_stats['correct'] / session_stats['total']) * 100, 1)
+    else:
+        session_stats['accuracy'] = 0
+
+    direction_text = "English → Armenian" if direction == 'en_to_am' else "Armenian → English"
+    method_text = METHOD_NAMES.get(method, "Say")
+    mode_text = MODE_NAMES.get(mode, "Unknown")
+
+    return render_template_string(
+        STUDY_SESSION_TEMPLATE,
+        completed=True,
+        session_stats=session_stats,
+        wrong_words=wrong_words,
+        direction=direction,
+        method=method,
+        mode=mode,
+        direction_text=direction_text,
+        method_text=method_text,
+        mode_text=mode_text
+    )
+@app.route('/manage')
+def manage():
+    return render_template_string(MANAGE_TEMPLATE, pages=get_repository().list_pages())
 
 
 @app.route('/upload_file', methods=['POST'])
@@ -1118,39 +4300,96 @@ def upload_file():
     files = request.files.getlist('files')
 
     for file in files:
-        if file.filename == '' or not file.filename.endswith('.txt'):
+        if file.filename == '' or not file.filename.endswith(WORD_FILE_EXTENSIONS):
             continue
 
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-
-        # Extract page name from filename
-        page_name = filename.replace('.txt', '')
-        if page_name.isdigit():
-            page_name = f"Page {page_name}"
-        else:
-            page_name = page_name.replace('_', ' ').title()
-
-        # Parse file and add to database
-        words = parse_word_file(filepath)
+        try:
+            parser = parser_for_upload(filename)
+        except ValueError as e:
+            flash(str(e))
+            return redirect(url_for('manage'))
+
+        # Parse the file as it is read and add to database
+        page_id, duplicate = get_repository().add_page(page_name_from_filename(filename),
+                                                       iter_word_rows(file.stream, parser))
+        if duplicate:
+            flash(describe_duplicate(filename, duplicate))
+            continue
+        audit('upload_page', page_id=page_id, filename=filename, skipped_lines=parser.error_count)
 
-        with get_db() as conn:
-            cursor = conn.execute('INSERT INTO pages (name) VALUES (?)', (page_name,))
-            page_id = cursor.lastrowid
+        if parser.error_count:
+            flash(describe_parse_errors(filename, parser))
 
-            for english, armenian in words:
-                cursor = conn.execute(
-                    'INSERT INTO words (page_id, english, armenian) VALUES (?, ?, ?)',
-                    (page_id, english, armenian)
-                )
-                word_id = cursor.lastrowid
-                conn.execute('INSERT INTO statistics (word_id) VALUES (?)', (word_id,))
-            conn.commit()
+    return redirect(url_for('manage'))
 
-        os.remove(filepath)
 
-    return redirect(url_for('manage'))
+@app.route('/uploads', methods=['POST'])
+def start_upload():
+    """Start a chunked upload: creates a hidden page that the chunks are imported into.
+
+    The client then posts the file in pieces to /uploads/<id>/chunk?offset=N
+    and calls /uploads/<id>/finalize. GET /uploads/<id> returns the offset
+    to resume from after a dropped connection.
+    """
+    filename = secure_filename(request.form.get('filename', ''))
+    if not filename.endswith(WORD_FILE_EXTENSIONS):
+        return jsonify({'error': f'only {", ".join(WORD_FILE_EXTENSIONS)} files can be uploaded'}), 400
+    try:
+        parser = parser_for_upload(filename)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    upload_id = secrets.token_urlsafe(16)
+    get_repository().start_upload(upload_id, page_name_from_filename(filename), filename, parser.getstate())
+    return jsonify({'upload_id': upload_id, 'offset': 0, 'chunk_size': UPLOAD_CHUNK_SIZE}), 201
+
+
+@app.route('/uploads/<upload_id>')
+def upload_status(upload_id):
+    offset = get_repository().upload_offset(upload_id)
+    if offset is None:
+        return jsonify({'error': 'unknown upload'}), 404
+    return jsonify({'upload_id': upload_id, 'offset': offset, 'chunk_size': UPLOAD_CHUNK_SIZE})
+
+
+@app.route('/uploads/<upload_id>/chunk', methods=['POST'])
+def upload_chunk(upload_id):
+    """Parse the next piece of an upload and import its complete lines.
+
+    The chunk is only accepted at the offset the server has reached; a
+    retried or out-of-order chunk gets 409 with the offset to continue from.
+    The parser state (decoder bytes, partial last line, errors) is saved
+    with the words in the same transaction.
+    """
+    offset = request.args.get('offset', type=int)
+    data = request.get_data(cache=False)
+
+    result, offset = get_repository().add_upload_chunk(upload_id, offset, data)
+    if result == 'missing':
+        return jsonify({'error': 'unknown upload'}), 404
+    if result == 'conflict':
+        return jsonify({'error': 'unexpected offset', 'offset': offset}), 409
+    return jsonify({'upload_id': upload_id, 'offset': offset})
+
+
+@app.route('/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    """Import the last line, create statistics and word forms and show the page"""
+    upload = get_repository().finalize_upload(upload_id)
+    if upload is None:
+        return jsonify({'error': 'unknown upload'}), 404
+    if upload['duplicate']:
+        flash(describe_duplicate(upload['filename'], upload['duplicate']))
+        return jsonify({'page_id': upload['duplicate']['id'], 'duplicate': True})
+
+    parser = upload['parser']
+    audit('upload_page', page_id=upload['page_id'], filename=upload['filename'], words=upload['words'],
+          skipped_lines=parser.error_count)
+
+    if parser.error_count:
+        flash(describe_parse_errors(upload['filename'], parser))
+    return jsonify({'page_id': upload['page_id'], 'words': upload['words'], 'skipped_lines': parser.error_count})
 
 
 @app.route('/reupload_page/<int:page_id>', methods=['POST'])
@@ -1159,68 +4398,130 @@ def reupload_page(page_id):
         return redirect(url_for('manage'))
 
     file = request.files['file']
-    if file.filename == '' or not file.filename.endswith('.txt'):
+    if file.filename == '' or not file.filename.endswith(WORD_FILE_EXTENSIONS):
         return redirect(url_for('manage'))
 
     filename = secure_filename(file.filename)
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
+    try:
+        parser = parser_for_upload(filename)
+    except ValueError as e:
+        flash(str(e))
+        return redirect(url_for('manage'))
 
-    words = parse_word_file(filepath)
+    result = get_repository().replace_page_words(page_id, iter_word_rows(file.stream, parser))
+    if result == 'missing':
+        return redirect(url_for('manage'))
+    if result == 'unchanged':
+        flash(f'{filename}: no changes, the page was left as it is')
+        return redirect(url_for('manage'))
+    deck_cache.discard_page(current_tenant(), page_id)
+    audit('reupload_page', page_id=page_id, filename=filename, skipped_lines=parser.error_count)
 
-    with get_db() as conn:
-        conn.execute('DELETE FROM words WHERE page_id = ?', (page_id,))
+    if parser.error_count:
+        flash(describe_parse_errors(filename, parser))
 
-        for english, armenian in words:
-            cursor = conn.execute(
-                'INSERT INTO words (page_id, english, armenian) VALUES (?, ?, ?)',
-                (page_id, english, armenian)
-            )
-            word_id = cursor.lastrowid
-            conn.execute('INSERT INTO statistics (word_id) VALUES (?)', (word_id,))
-        conn.commit()
+    return redirect(url_for('manage'))
+
+
+@app.route('/bulk_pages', methods=['POST'])
+def bulk_pages():
+    """Merge, reset or delete the pages ticked on the manage page in one transaction"""
+    action = request.form.get('action')
+    repository = get_repository()
+    page_ids = repository.visible_page_ids(request.form.getlist('pages', type=int),
+                                           request.form.getlist('decks', type=int))
+    if not page_ids:
+        flash('Select at least one page first')
+        return redirect(url_for('manage'))
 
-    os.remove(filepath)
+    if action == 'merge':
+        moved = repository.merge_pages(page_ids, request.form.get('name', '').strip() or None)
+        message = f'Merged {len(page_ids)} page(s), {moved} word(s) moved'
+    elif action == 'reset':
+        message = f'Reset the statistics of {repository.reset_pages(page_ids)} word(s)'
+    elif action == 'delete':
+        message = f'Deleted {repository.delete_pages(page_ids)} page(s)'
+    else:
+        return redirect(url_for('manage'))
+
+    for page_id in page_ids:
+        deck_cache.discard_page(current_tenant(), page_id)
+    audit(f'{action}_pages', page_ids=page_ids, result=message)
+    flash(message)
+    return redirect(url_for('manage'))
+
+
+@app.route('/split_page/<int:page_id>', methods=['POST'])
+def split_page_route(page_id):
+    try:
+        ranges = parse_ranges(request.form.get('ranges', ''))
+    except ValueError as e:
+        abort(400, f'Split failed: {e}')
+    try:
+        new_ids = get_repository().split_page(page_id, ranges)
+    except ValueError as e:
+        flash(f'Split failed: {e}')
+        return redirect(url_for('manage'))
+    deck_cache.discard_page(current_tenant(), page_id)
+    audit('split_page', page_id=page_id, new_page_ids=new_ids)
+    flash(f'Split into {len(new_ids)} new page(s)')
     return redirect(url_for('manage'))
 
 
+@app.route('/move_words', methods=['POST'])
+def move_words_route():
+    """Move the words ticked on a page view to another page"""
+    source_id = request.form.get('source_page', type=int)
+    target_id = request.form.get('target_page', type=int)
+    word_ids = request.form.getlist('words', type=int)
+    if source_id is None:
+        abort(400, 'No source page given')
+    repository = get_repository()
+    if target_id is None or repository.get_page(target_id) is None:
+        return redirect(url_for('view_page', page_id=source_id))
+    repository.move_words(word_ids, target_id)
+    deck_cache.discard_page(current_tenant(), source_id)
+    deck_cache.discard_page(current_tenant(), target_id)
+    audit('move_words', word_ids=word_ids, target_page_id=target_id)
+    return redirect(url_for('view_page', page_id=source_id))
+
+
 @app.route('/view_page/<int:page_id>')
 def view_page(page_id):
-    with get_db() as conn:
-        page = conn.execute('SELECT * FROM pages WHERE id = ?', (page_id,)).fetchone()
-        words = conn.execute('''
-                             SELECT w.*,
-                                    COALESCE(s.correct, 0)   as correct,
-                                    COALESCE(s.incorrect, 0) as incorrect
-                             FROM words w
-                                      LEFT JOIN statistics s ON w.id = s.word_id
-                             WHERE w.page_id = ?
-                             ORDER BY w.id
-                             ''', (page_id,)).fetchall()
-    return render_template_string(VIEW_PAGE_TEMPLATE, page=page, words=words)
+    repository = get_repository()
+    page = repository.get_page(page_id)
+    words = repository.page_words(page_id)
+    other_pages = repository.other_pages(page_id)
+    return render_template_string(VIEW_PAGE_TEMPLATE, page=page, words=words, other_pages=other_pages)
 
 
 @app.route('/delete_page/<int:page_id>')
 def delete_page(page_id):
-    with get_db() as conn:
-        conn.execute('DELETE FROM pages WHERE id = ?', (page_id,))
-        conn.commit()
+    get_repository().delete_page(page_id)
+    deck_cache.discard_page(current_tenant(), page_id)
+    audit('delete_page', page_id=page_id)
     return redirect(url_for('manage'))
 
 
 @app.route('/study')
 def study():
+    # Flashed messages live in the session, so take them out before clearing it
+    messages = get_flashed_messages()
     session.clear()
-    with get_db() as conn:
-        pages = conn.execute('''
-                             SELECT p.*, COUNT(w.id) as word_count
-                             FROM pages p
-                                      LEFT JOIN words w ON p.id = w.page_id
-                             GROUP BY p.id
-                             HAVING word_count > 0
-                             ORDER BY p.name
-                             ''').fetchall()
-    return render_template_string(STUDY_SETUP_TEMPLATE, pages=pages)
+    repository = get_repository()
+    pages = repository.study_pages()
+    decks = repository.list_decks()
+    study_sessions = resumable_study_sessions(repository)
+    return render_template_string(STUDY_SETUP_TEMPLATE, pages=pages, decks=decks, study_sessions=study_sessions,
+                                  messages=messages)
+
+
+@app.route('/delete_deck/<int:deck_id>', methods=['POST'])
+def delete_deck(deck_id):
+    """Forget a saved deck; its pages are kept"""
+    get_repository().delete_deck(deck_id)
+    audit('delete_deck', deck_id=deck_id)
+    return redirect(url_for('study'))
 
 
 @app.route('/study_session', methods=['POST'])
@@ -1228,120 +4529,186 @@ def study_session():
     direction = request.form.get('direction')
     method = request.form.get('method')
     mode = request.form.get('mode')
-    page_ids = request.form.getlist('pages')
-
-    with get_db() as conn:
-        words = conn.execute('''
-            SELECT w.*, 
-                   COALESCE(s.correct, 0) as correct,
-                   COALESCE(s.incorrect, 0) as incorrect
-            FROM words w
-            LEFT JOIN statistics s ON w.id = s.word_id
-            WHERE w.page_id IN ({})
-        '''.format(','.join('?' * len(page_ids))), page_ids).fetchall()
-
-    words_list = [dict(w) for w in words]
-
-    if mode == 'smart':
-        words_list.sort(key=lambda w: w['incorrect'] / (w['correct'] + w['incorrect'] + 1), reverse=True)
-        word_order = [w['id'] for w in words_list]
-    elif mode == 'session':
-        word_order = [w['id'] for w in words_list]
-        random.shuffle(word_order)
-    else:
-        word_order = [w['id'] for w in words_list]
+    deck_name = request.form.get('save_deck', '').strip()
+    if direction not in ANSWER_SIDES or method not in METHOD_NAMES or mode not in MODE_NAMES:
+        abort(400, 'Unknown direction, method or mode')
+
+    repository = get_repository()
+    word_order, boxes = repository.build_deck(request.form.getlist('pages', type=int),
+                                              request.form.getlist('decks', type=int), mode, deck_name or None)
+    if not word_order:
+        flash('Choose at least one page or saved deck with words to study')
+        return redirect(url_for('study'))
+    if boxes is not None:
+        session['box_sizes'] = [len(box) for box in boxes]
 
     session['direction'] = direction
     session['method'] = method
     session['mode'] = mode
-    session['words'] = words_list
-    session['word_order'] = word_order
+    session['deck'] = pack_ids(word_order)
+    session['deck_size'] = len(word_order)
+    session['seed'] = random.getrandbits(32)
+    session['cards'] = {}
     session['current_index'] = 0
     session['stats'] = {'correct': 0, 'incorrect': 0, 'total': 0}
-    session['wrong_words'] = []
     session['checked'] = False
     session['revealed'] = False
     session['all_revealed'] = False
     session['is_correct'] = False
     session['current_word_id'] = None
 
+    create_study_session(repository, boxes)
+
+    return redirect(url_for('study_word'))
+
+
+@app.route('/resume_session', methods=['POST'])
+def resume_session():
+    """Continue a saved session, on this or another device, with its original deck"""
+    row = get_repository().get_study_session(request.form.get('session_id', type=int))
+    if row is None:
+        return redirect(url_for('study'))
+
+    progress = json.loads(row['progress'])
+    if 'boxes' in progress:
+        # Saved before the Leitner boxes moved to leitner_queue
+        flash('This Leitner session was saved by an older version and cannot be resumed.')
+        return redirect(url_for('study'))
+
+    session.clear()
+    session['direction'] = row['direction']
+    session['method'] = row['method']
+    session['mode'] = row['mode']
+    session['deck'] = row['deck']
+    session['deck_size'] = row['deck_size']
+    session['seed'] = row['seed']
+    session['cards'] = {}
+    session.update(progress)
+    session['checked'] = False
+    session['revealed'] = False
+    session['all_revealed'] = False
+    session['is_correct'] = False
+    # A Leitner card drawn before the interruption is shown again
+    session['current_word_id'] = progress['leitner_card'][0] if progress.get('leitner_card') else None
+    session['study_session_id'] = row['id']
+    session['checkpoint'] = progress_checksum(progress)
+
     return redirect(url_for('study_word'))
 
 
 @app.route('/check_field', methods=['POST'])
 def check_field():
+    if 'deck' not in session:
+        return jsonify({'error': 'no active session'}), 409
+
     field_index = int(request.form.get('field_index'))
     user_answer = request.form.get('user_answer')
     is_correct = request.form.get('is_correct') == 'true'
-    word_id = int(request.form.get('word_id'))
+    word_id = request.form.get('word_id', type=int)
+    key = request_answer_key()
+
+    current_word_dict = get_session_card(word_id) if word_id is not None else None
+    if current_word_dict is None:
+        return jsonify({'error': 'word is not part of this session'}), 400
 
     session[f'field_{field_index}_checked'] = True
     session[f'field_{field_index}_correct'] = is_correct
     session[f'field_{field_index}_user_answer'] = user_answer
     session.modified = True
 
-    if not session.get('word_stats_updated'):
-        words_list = session['words']
-        current_word_dict = next(w for w in words_list if w['id'] == word_id)
-
-        direction = session['direction']
-        if direction == 'en_to_am':
-            answer_list = parse_synonyms(current_word_dict['armenian'])
-        else:
-            answer_list = parse_synonyms(current_word_dict['english'])
+    if not answer_counted(key):
+        answer_list = answer_forms(current_word_dict)
 
         all_checked = all(session.get(f'field_{i}_checked') for i in range(len(answer_list)))
 
         if all_checked:
             all_correct = all(session.get(f'field_{i}_correct') for i in range(len(answer_list)))
 
-            with get_db() as conn:
-                if all_correct:
-                    conn.execute('UPDATE statistics SET correct = correct + 1, last_studied = ? WHERE word_id = ?',
-                                 (datetime.now(), word_id))
-                    session['stats']['correct'] += 1
-                else:
-                    conn.execute('UPDATE statistics SET incorrect = incorrect + 1, last_studied = ? WHERE word_id = ?',
-                                 (datetime.now(), word_id))
-                    session['stats']['incorrect'] += 1
+            record_word_result(get_repository(), current_word_dict, all_correct, key)
+
+    return '', 204
 
-                    # Track wrong word
-                    prompt = current_word_dict['english'] if direction == 'en_to_am' else current_word_dict['armenian']
-                    answer = current_word_dict['armenian'] if direction == 'en_to_am' else current_word_dict['english']
-                    session['wrong_words'].append({'prompt': prompt, 'answer': answer})
 
-                conn.commit()
+@app.route('/check_word', methods=['POST'])
+def check_word():
+    """Grade every synonym field of the current word in one request and move on"""
+    if 'deck' not in session:
+        return jsonify({'error': 'no active session'}), 409
 
-            session['stats']['total'] += 1
-            session['word_stats_updated'] = True
-            session.modified = True
+    word_id = request.form.get('word_id', type=int)
+    user_answers = request.form.getlist('answers')
+    key = request_answer_key()
 
-    return '', 204
+    current_word_dict = get_session_card(word_id) if word_id is not None else None
+    if current_word_dict is None:
+        return jsonify({'error': 'word is not part of this session'}), 400
+
+    answer_list = answer_forms(current_word_dict)
+    results = grade_answers(user_answers, answer_list)
+    all_correct = len(results) == len(answer_list) and all(results)
+
+    if key and key == session.get('answer_key'):
+        # A retry of a request this session already applied: the word has moved on
+        return jsonify({'results': results, 'correct': all_correct, 'answers': answer_list})
+
+    if not answer_counted(key):
+        record_word_result(get_repository(), current_word_dict, all_correct, key)
+
+    advance_session()
+
+    return jsonify({'results': results, 'correct': all_correct, 'answers': answer_list})
+
+
+@app.route('/check_choice', methods=['POST'])
+def check_choice():
+    """Grade a multiple-choice answer, count a wrong pick as a confusion and move on"""
+    if 'deck' not in session:
+        return jsonify({'error': 'no active session'}), 409
+
+    word_id = request.form.get('word_id', type=int)
+    choice_id = request.form.get('choice_id', type=int)
+    key = request_answer_key()
+
+    current_word_dict = get_session_card(word_id) if word_id is not None else None
+    if current_word_dict is None:
+        return jsonify({'error': 'word is not part of this session'}), 400
+    _, column = ANSWER_SIDES[session['direction']]
+    correct = choice_id == word_id
+    result = {'correct': correct, 'answer_id': word_id, 'answer': current_word_dict[column]}
+
+    if key and key == session.get('answer_key'):
+        # A retry of a request this session already applied: the word has moved on
+        return jsonify(result)
+    if choice_id not in session.get('choice_ids', ()):
+        return jsonify({'error': 'not one of the offered choices'}), 400
+
+    if not answer_counted(key):
+        repository = get_repository()
+        record_word_result(repository, current_word_dict, correct, key)
+        if not correct:
+            repository.record_confusion(word_id, ANSWER_SIDES[session['direction']][0], choice_id)
+
+    advance_session()
+
+    return jsonify(result)
 
 
 @app.route('/reveal_all', methods=['POST'])
 def reveal_all():
-    word_id = int(request.form.get('word_id'))
+    if 'deck' not in session:
+        return jsonify({'error': 'no active session'}), 409
 
-    session['all_revealed'] = True
+    word_id = request.form.get('word_id', type=int)
+    key = request_answer_key()
 
-    if not session.get('word_stats_updated'):
-        with get_db() as conn:
-            conn.execute('UPDATE statistics SET incorrect = incorrect + 1, last_studied = ? WHERE word_id = ?',
-                         (datetime.now(), word_id))
-            conn.commit()
+    current_word_dict = get_session_card(word_id) if word_id is not None else None
+    if current_word_dict is None:
+        return jsonify({'error': 'word is not part of this session'}), 400
 
-        session['stats']['incorrect'] += 1
-        session['stats']['total'] += 1
-        session['word_stats_updated'] = True
+    session['all_revealed'] = True
 
-        # Track wrong word
-        words_list = session['words']
-        current_word_dict = next(w for w in words_list if w['id'] == word_id)
-        direction = session['direction']
-        prompt = current_word_dict['english'] if direction == 'en_to_am' else current_word_dict['armenian']
-        answer = current_word_dict['armenian'] if direction == 'en_to_am' else current_word_dict['english']
-        session['wrong_words'].append({'prompt': prompt, 'answer': answer})
+    if not answer_counted(key):
+        record_word_result(get_repository(), current_word_dict, False, key)
 
     session.modified = True
     return '', 204
@@ -1349,17 +4716,17 @@ def reveal_all():
 
 @app.route('/study_word')
 def study_word():
-    if 'words' not in session:
+    if 'deck' not in session:
         return redirect(url_for('study'))
 
     direction = session['direction']
     method = session['method']
     mode = session['mode']
-    words_list = session['words']
-    word_order = session['word_order']
     current_index = session['current_index']
 
-    if mode == 'session' and current_index >= len(word_order):
+    if mode == 'session' and current_index >= session['deck_size']:
+        wrong_words = session_wrong_words()
+        finish_study_session()
         session_stats = session['stats']
         if session_stats['total'] > 0:
             session_stats['accuracy'] = round((session_stats['correct'] / session_stats['total']) * 100, 1)
@@ -1367,14 +4734,14 @@ def study_word():
             session_stats['accuracy'] = 0
 
         direction_text = "English → Armenian" if direction == 'en_to_am' else "Armenian → English"
-        method_text = "Write" if method == 'write' else "Say"
-        mode_text = {"smart": "Smart Mode", "random": "Random Mode", "session": "Session Mode"}[mode]
+        method_text = METHOD_NAMES.get(method, "Say")
+        mode_text = MODE_NAMES.get(mode, "Unknown")
 
         return render_template_string(
             STUDY_SESSION_TEMPLATE,
             completed=True,
             session_stats=session_stats,
-            wrong_words=session.get('wrong_words', []),
+            wrong_words=wrong_words,
             direction=direction,
             method=method,
             mode=mode,
@@ -1383,23 +4750,35 @@ def study_word():
             mode_text=mode_text
         )
 
+    deck = unpack_runs(session['deck'])
+    upcoming = ()
     if session.get('current_word_id'):
         current_word_id = session['current_word_id']
-        current_word_dict = next(w for w in words_list if w['id'] == current_word_id)
     elif mode == 'random':
-        current_word_dict = random.choice(words_list)
+        current_word_id = id_at(deck, random.randrange(session['deck_size']))
+    elif mode == 'leitner':
+        current_word_id = leitner_draw()
+        if current_word_id is None:
+            return redirect(url_for('end_session'))
     else:
-        current_word_id = word_order[current_index]
-        current_word_dict = next(w for w in words_list if w['id'] == current_word_id)
+        current_word_id = id_at(deck, deck_position(current_index))
+        upcoming = [id_at(deck, deck_position(index))
+                    for index in range(current_index + 1, min(current_index + CARD_WINDOW, session['deck_size']))]
+
+    current_word_dict = get_card(current_word_id, upcoming)
+    if current_word_dict is None:
+        # The word was deleted or re-uploaded since the session started
+        session.pop('leitner_card', None)
+        advance_session()
+        return redirect(url_for('study_word'))
 
+    answer_list = answer_forms(current_word_dict)
     if direction == 'en_to_am':
         prompt = current_word_dict['english']
-        answer_list = parse_synonyms(current_word_dict['armenian'])
         display_answer = current_word_dict['armenian']
         direction_text = "English → Armenian"
     else:
         prompt = current_word_dict['armenian']
-        answer_list = parse_synonyms(current_word_dict['english'])
         display_answer = current_word_dict['english']
         direction_text = "Armenian → English"
 
@@ -1412,12 +4791,17 @@ def study_word():
         'answer_list': answer_list
     }
 
-    method_text = "Write" if method == 'write' else "Say"
-    mode_text = {"smart": "Smart Mode", "random": "Random Mode", "session": "Session Mode"}[mode]
+    choices = None
+    if method == 'choice':
+        choices = choice_options(get_repository(), current_word_dict, deck)
+        session['choice_ids'] = [choice['id'] for choice in choices]
+
+    method_text = METHOD_NAMES.get(method, "Say")
+    mode_text = MODE_NAMES.get(mode, "Unknown")
 
     progress = None
     if mode == 'session':
-        progress = {'current': current_index + 1, 'total': len(word_order)}
+        progress = {'current': current_index + 1, 'total': session['deck_size']}
 
     return render_template_string(
         STUDY_SESSION_TEMPLATE,
@@ -1434,13 +4818,14 @@ def study_word():
         revealed=session.get('revealed', False),
         all_revealed=session.get('all_revealed', False),
         progress=progress,
+        choices=choices,
         user_answer=session.get('user_answer', '')
     )
 
 
 @app.route('/study_action', methods=['POST'])
 def study_action():
-    if 'words' not in session:
+    if 'deck' not in session:
         return redirect(url_for('study'))
 
     action = request.form.get('action')
@@ -1453,90 +4838,1117 @@ def study_action():
         session.modified = True
         return redirect(url_for('study_word'))
 
-    elif action == 'mark_wrong':
-        # Mark as wrong for "say" method
-        if session.get('current_word_id') and not session.get('word_stats_updated'):
-            word_id = session['current_word_id']
-            with get_db() as conn:
-                conn.execute('UPDATE statistics SET incorrect = incorrect + 1, last_studied = ? WHERE word_id = ?',
-                             (datetime.now(), word_id))
-                conn.commit()
+    elif action in ('mark_wrong', 'next'):
+        # For "say" method - "next" marks as correct if not already updated
+        key = request_answer_key()
+        if key and key == session.get('answer_key'):
+            # Resubmitted form: the answer was counted and the word has moved on
+            return redirect(url_for('study_word'))
 
-            session['stats']['incorrect'] += 1
-            session['stats']['total'] += 1
+        if session.get('current_word_id') and not answer_counted(key):
+            current_word_dict = get_session_card(session['current_word_id'])
+            # A word deleted since it was shown is skipped without a result
+            if current_word_dict is not None:
+                record_word_result(get_repository(), current_word_dict, action == 'next', key)
 
-            # Track wrong word
-            words_list = session['words']
-            current_word_dict = next(w for w in words_list if w['id'] == word_id)
-            direction = session['direction']
-            prompt = current_word_dict['english'] if direction == 'en_to_am' else current_word_dict['armenian']
-            answer = current_word_dict['armenian'] if direction == 'en_to_am' else current_word_dict['english']
-            session['wrong_words'].append({'prompt': prompt, 'answer': answer})
-
-            session['word_stats_updated'] = True
-
-        # Move to next word
-        session['current_word_id'] = None
-        if session['mode'] != 'random':
-            session['current_index'] += 1
-        session['checked'] = False
-        session['revealed'] = False
-        session['is_correct'] = False
-        session.pop('word_stats_updated', None)
-        session.modified = True
+        advance_session()
         return redirect(url_for('study_word'))
 
     elif action == 'skip':
-        session['current_word_id'] = None
+        advance_session()
+        return redirect(url_for('study_word'))
+
+    return redirect(url_for('study'))
 
-        for key in list(session.keys()):
-            if key.startswith('field_'):
-                session.pop(key)
-        session.pop('word_stats_updated', None)
-        session.pop('all_revealed', None)
 
-        if session['mode'] != 'random':
-            session['current_index'] += 1
+@app.route('/offline')
+def offline():
+    return render_template_string(OFFLINE_STUDY_TEMPLATE)
 
-        session['checked'] = False
-        session['revealed'] = False
-        session['is_correct'] = False
-        session.modified = True
-        return redirect(url_for('study_word'))
 
-    elif action == 'next':
-        # For "say" method - mark as correct if not already updated
-        if session.get('current_word_id') and not session.get('word_stats_updated'):
-            word_id = session['current_word_id']
-            with get_db() as conn:
-                conn.execute('UPDATE statistics SET correct = correct + 1, last_studied = ? WHERE word_id = ?',
-                             (datetime.now(), word_id))
-                conn.commit()
+@app.route('/offline_deck')
+def offline_deck():
+    """Compact JSON copy of the selected deck for studying without a connection"""
+    mode = request.args.get('mode')
+    if mode not in MODE_NAMES:
+        return jsonify({'error': f'unknown mode {mode!r}'}), 400
+
+    deck = get_repository().deck_words(request.args.getlist('pages', type=int),
+                                       request.args.getlist('decks', type=int), mode)
+    seed = random.getrandbits(32)
+    if mode == 'session':
+        deck = [deck[permute_index(index, len(deck), seed)] for index in range(len(deck))]
+
+    # Every download is ordered afresh; the client keeps saved progress with the deck_id it belongs to
+    return jsonify({'deck_id': f'{seed:08x}', 'mode': mode, 'words': deck})
+
+
+@app.route('/lookup')
+def lookup():
+    """Find the words that have a given synonym on either side"""
+    rows = get_repository().find_words(request.args.get('q', ''))
+    return jsonify([dict(row) for row in rows])
+
+
+@app.route('/admin/deck_cache')
+def deck_cache_stats():
+    require_admin()
+    return jsonify(deck_cache.stats())
+
+
+@app.route('/admin/profile', methods=['GET', 'DELETE'])
+def profile_stats():
+    """Profiles collected by the sampling hook.
+
+    ?format=pstats downloads a file for pstats/snakeviz, ?format=collapsed
+    gives folded stacks for flamegraph.pl or speedscope; both take
+    ?route=<rule> to select one route. DELETE clears the collected data.
+    """
+    require_admin()
+    if request.method == 'DELETE':
+        with route_profiles_lock:
+            route_profiles.clear()
+            route_profile_counts.clear()
+        return '', 204
+
+    fmt = request.args.get('format', 'json')
+    route = request.args.get('route')
+    if fmt == 'json':
+        summary = {}
+        with route_profiles_lock:
+            for key, stats in route_profiles.items():
+                top = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:15]
+                summary[key] = {
+                    'requests': route_profile_counts[key],
+                    'seconds': round(stats.total_tt, 6),
+                    'top_cumulative': [{'function': frame_label(func), 'calls': nc,
+                                        'self_seconds': round(tt, 6), 'cumulative_seconds': round(ct, 6)}
+                                       for func, (_, nc, tt, ct, _) in top],
+                }
+        return jsonify({'sample_rate': PROFILE_SAMPLE_RATE, 'routes': summary})
+
+    stats = merged_profile(route)
+    if stats is None:
+        return jsonify({'error': 'no profiles collected'}), 404
+    name = secure_filename(route or 'all').strip('_') or 'root'
+    if fmt == 'pstats':
+        response = app.response_class(marshal.dumps(stats.stats), mimetype='application/octet-stream')
+        response.headers['Content-Disposition'] = f'attachment; filename={name}.pstats'
+        return response
+    if fmt == 'collapsed':
+        response = app.response_class(collapsed_stacks(stats), mimetype='text/plain')
+        response.headers['Content-Disposition'] = f'attachment; filename={name}.folded'
+        return response
+    return jsonify({'error': f'unknown format {fmt!r}'}), 400
+
+
+@app.route('/sw.js')
+def service_worker():
+    response = app.response_class(SERVICE_WORKER_JS, mimetype='application/javascript')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/sync', methods=['POST'])
+def sync():
+    """Apply a batch of answers recorded offline; replayed events are ignored"""
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('events', []), list):
+        return jsonify({'error': 'expected an object with a list of events'}), 400
+    answers = []
+    rejected = []
+    for event in payload.get('events', []):
+        if not isinstance(event, dict):
+            rejected.append(None)
+            continue
+        key = event.get('key')
+        # Without its own key an answer could not be told apart from a replay
+        if not isinstance(key, str) or not key:
+            rejected.append(None)
+            continue
+        try:
+            answers.append((key[:ANSWER_KEY_LENGTH], int(event['word_id']), bool(event['correct']),
+                            datetime.fromtimestamp(float(event['ts']))))
+        except (KeyError, TypeError, ValueError, OverflowError, OSError):
+            rejected.append(key)
+
+    applied, duplicates = get_repository().record_answers(answers)
+    return jsonify({'applied': applied, 'duplicates': duplicates, 'rejected': rejected})
+
+
+# Bulk page operations
+# Each operation is a few set-based statements in the caller's transaction.
+# Word ids never change, so statistics, word forms and saved study sessions
+# follow the words to their new page.
+def parse_ranges(text):
+    """Parse '1-100,150,200-210' into [(1, 100), (150, 150), (200, 210)].
+
+    Overlapping ranges are rejected: a position in two ranges of a split
+    would be matched twice by the UPDATE, with no telling which one wins.
+    """
+    ranges = []
+    for part in text.replace(' ', '').split(','):
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        try:
+            first, last = int(first), int(last or first)
+        except ValueError:
+            raise ValueError(f'invalid range {part!r}')
+        if first < 1 or last < first:
+            raise ValueError(f'invalid range {part!r}')
+        ranges.append((first, last))
+    if not ranges:
+        raise ValueError('no ranges given')
+    ordered = sorted(ranges)
+    for (first, last), (next_first, next_last) in zip(ordered, ordered[1:]):
+        if next_first <= last:
+            raise ValueError(f'ranges {first}-{last} and {next_first}-{next_last} overlap')
+    return ranges
+
+
+def load_ranges(conn, ranges):
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS ranges (first INTEGER NOT NULL, last INTEGER NOT NULL)')
+    conn.execute('DELETE FROM temp.ranges')
+    conn.executemany('INSERT INTO temp.ranges (first, last) VALUES (?, ?)', ranges)
+
+
+def pages_changed(conn, page_ids):
+    """Bump the versions and recompute the content hashes of pages whose words changed"""
+    for page_id in page_ids:
+        bump_page_version(conn, page_id)
+        conn.execute('UPDATE pages SET content_hash = ? WHERE id = ?', (page_content_hash(conn, page_id), page_id))
+
+
+def selected_page_ids(conn):
+    return [row[0] for row in conn.execute('''SELECT p.id FROM temp.selected_pages s
+                                              JOIN pages p ON p.id = s.page_id
+                                              WHERE p.pending = 0
+                                              ORDER BY p.id''')]
+
+
+def merge_pages(conn, target_id, name=None):
+    """Move the words of the pages chosen with select_pages() into target_id.
+
+    The emptied pages are deleted; saved decks that contained one of them
+    get the target page instead. Returns the number of words moved.
+    """
+    conn.execute('''INSERT OR IGNORE INTO deck_pages (deck_id, page_id)
+                    SELECT dp.deck_id, ? FROM deck_pages dp
+                    JOIN temp.selected_pages s ON s.page_id = dp.page_id''', (target_id,))
+    moved = conn.execute('''UPDATE words SET page_id = ?
+                            WHERE page_id IN (SELECT s.page_id FROM temp.selected_pages s
+                                              JOIN pages p ON p.id = s.page_id
+                                              WHERE p.pending = 0 AND p.id != ?)''',
+                         (target_id, target_id)).rowcount
+    conn.execute('''DELETE FROM pages
+                    WHERE id IN (SELECT page_id FROM temp.selected_pages) AND id != ? AND pending = 0''',
+                 (target_id,))
+    if name:
+        conn.execute('UPDATE pages SET name = ? WHERE id = ?', (name, target_id))
+    pages_changed(conn, [target_id])
+    return moved
+
+
+def split_page(conn, page_id, ranges):
+    """Move the words at the given 1-based positions of a page into new pages, one per range.
+
+    Words outside every range stay where they are. Returns the new page ids.
+    """
+    page = conn.execute('SELECT name FROM pages WHERE id = ?', (page_id,)).fetchone()
+    if page is None:
+        raise ValueError(f'no page {page_id}')
+
+    conn.execute('''CREATE TEMP TABLE IF NOT EXISTS split_targets
+                    (first INTEGER NOT NULL, last INTEGER NOT NULL, page_id INTEGER NOT NULL)''')
+    conn.execute('DELETE FROM temp.split_targets')
+    new_ids = []
+    for number, (first, last) in enumerate(ranges, 1):
+        cursor = conn.execute('INSERT INTO pages (name) VALUES (?)', (f"{page['name']} ({number})",))
+        new_ids.append(cursor.lastrowid)
+        conn.execute('INSERT INTO temp.split_targets (first, last, page_id) VALUES (?, ?, ?)',
+                     (first, last, cursor.lastrowid))
+
+    conn.execute('''UPDATE words SET page_id = t.page_id
+                    FROM (SELECT id, ROW_NUMBER() OVER (ORDER BY id) AS position
+                          FROM words WHERE page_id = ?) AS n
+                    JOIN temp.split_targets t ON n.position BETWEEN t.first AND t.last
+                    WHERE words.id = n.id''', (page_id,))
+    pages_changed(conn, [page_id, *new_ids])
+    return new_ids
+
+
+def move_words(conn, word_ranges, target_id):
+    """Move the words whose ids fall in the given ranges to another page; returns the count"""
+    load_ranges(conn, word_ranges)
+    source_ids = [row[0] for row in conn.execute('''SELECT DISTINCT w.page_id
+                                                    FROM temp.ranges r
+                                                    JOIN words w ON w.id BETWEEN r.first AND r.last
+                                                    WHERE w.page_id != ?''', (target_id,))]
+    moved = conn.execute('''UPDATE words SET page_id = ?
+                            WHERE id IN (SELECT w.id FROM temp.ranges r
+                                         JOIN words w ON w.id BETWEEN r.first AND r.last)
+                              AND page_id != ?''', (target_id, target_id)).rowcount
+    pages_changed(conn, [*source_ids, target_id])
+    return moved
+
+
+def reset_page_stats(conn):
+    """Forget answers, Leitner boxes and scores of the words of the selected pages"""
+    return conn.execute('''UPDATE statistics
+                           SET correct = 0, incorrect = 0, last_studied = NULL, box = 1,
+                               difficulty = 0.5, recall = 0, score = 0.5
+                           WHERE word_id IN (SELECT w.id FROM temp.selected_pages s
+                                             JOIN words w ON w.page_id = s.page_id)''').rowcount
+
+
+def delete_pages(conn):
+    """Delete the selected pages with their words and statistics"""
+    return conn.execute('''DELETE FROM pages
+                           WHERE id IN (SELECT page_id FROM temp.selected_pages) AND pending = 0''').rowcount
+
+
+# Difficulty scoring
+# Days after which a word last seen in box 1 is recalled with probability 1/e;
+# every box up doubles it
+RECALL_STABILITY_DAYS = 1.0
+
+
+def score_words(conn, batch_size=50000):
+    """Recompute difficulty, recall probability and score of every word with NumPy.
+
+    difficulty is the smoothed share of wrong answers. recall follows an
+    exponential forgetting curve whose stability grows with the Leitner box
+    and shrinks with difficulty; a word never studied has recall 0. Smart
+    mode presents words by score = difficulty * (1 - recall), highest
+    first.
+
+    The scores are written back by rowid, batch_size rows per transaction.
+    """
+    import numpy as np
+
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute('''SELECT id, correct, incorrect, box,
+                                     COALESCE(julianday('now') - julianday(last_studied), -1)
+                              FROM statistics''').fetchall()
+    if not rows:
+        return 0
+
+    data = np.array(rows, dtype=np.float64)
+    row_ids = data[:, 0].astype(np.int64)
+    correct, incorrect, box, elapsed_days = data[:, 1], data[:, 2], data[:, 3], data[:, 4]
+
+    difficulty = (incorrect + 1) / (correct + incorrect + 2)
+    stability = RECALL_STABILITY_DAYS * np.exp2(np.clip(box, 1, LEITNER_BOXES) - 1) * (1.5 - difficulty)
+    recall = np.where(elapsed_days >= 0, np.exp(-np.maximum(elapsed_days, 0) / stability), 0.0)
+    score = difficulty * (1 - recall)
+
+    updates = zip(difficulty.tolist(), recall.tolist(), score.tolist(), row_ids.tolist())
+    while True:
+        batch = list(itertools.islice(updates, batch_size))
+        if not batch:
+            break
+        conn.executemany('UPDATE statistics SET difficulty = ?, recall = ?, score = ? WHERE id = ?', batch)
+        conn.commit()
+    return len(rows)
+
+
+# Multiple-choice distractors
+# build_distractors() stores, for every word and answer language, the words
+# whose synonyms share the most character trigrams with its own; a card's
+# options are then one primary-key range read instead of a vocabulary scan.
+# Wrong picks are counted in confusions and offered first the next time.
+DISTRACTOR_CANDIDATES = 8
+CHOICE_DISTRACTORS = 3
+# Past confusions among the distractors of a card; the rest are similar words
+CHOICE_CONFUSIONS = 2
+# Trigrams shared by more words than this (e.g. '  a') say little about similarity and are skipped
+MAX_TRIGRAM_POSTINGS = 1000
+
+# Answer language of each direction: (side in distractors/confusions, words column)
+ANSWER_SIDES = {'en_to_am': ('am', 'armenian'), 'am_to_en': ('en', 'english')}
+
+
+def trigrams(forms):
+    grams = set()
+    for form in forms:
+        padded = f'  {form} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similar_words(words, targets=None, count=DISTRACTOR_CANDIDATES, max_postings=MAX_TRIGRAM_POSTINGS):
+    """Yield (word_id, [similar word ids, best first]) for each id in targets (default: all).
+
+    words is a list of (id, text) pairs. Similarity is the Jaccard index of
+    the trigram sets of the synonyms; words sharing a synonym are never
+    similar, since both would be correct answers.
+    """
+    forms = [{normalize_form(form) for form in parse_synonyms(text) if form.strip()} for _, text in words]
+    grams = [trigrams(word_forms) for word_forms in forms]
+    postings = {}
+    for index, word_grams in enumerate(grams):
+        for gram in word_grams:
+            postings.setdefault(gram, []).append(index)
+
+    positions = {word_id: index for index, (word_id, _) in enumerate(words)}
+    for word_id in (positions if targets is None else targets):
+        index = positions[word_id]
+        shared = Counter()
+        for gram in grams[index]:
+            posting = postings[gram]
+            if len(posting) <= max_postings:
+                shared.update(posting)
+        shared.pop(index, None)
+        size = len(grams[index])
+        # Rank the words sharing the most trigrams by Jaccard index
+        best = heapq.nlargest(
+            count,
+            ((common / (size + len(grams[other]) - common), other)
+             for other, common in shared.most_common(count * 4) if not forms[index] & forms[other])
+        )
+        yield word_id, [words[other][0] for _, other in best]
 
-            session['stats']['correct'] += 1
-            session['stats']['total'] += 1
-            session['word_stats_updated'] = True
 
-        session['current_word_id'] = None
+def build_distractors(conn, full=False, batch_size=5000):
+    """Fill the distractors table; without full only words that have no rows yet.
 
-        for key in list(session.keys()):
-            if key.startswith('field_'):
-                session.pop(key)
-        session.pop('word_stats_updated', None)
-        session.pop('all_revealed', None)
+    Returns the number of words (per answer language) that were indexed.
+    """
+    built = 0
+    for side, column in ANSWER_SIDES.values():
+        words = [tuple(row) for row in conn.execute(f'SELECT id, {column} FROM words ORDER BY id')]
+        if full:
+            targets = [word_id for word_id, _ in words]
+        else:
+            targets = [row[0] for row in conn.execute('''
+                SELECT w.id FROM words w
+                WHERE NOT EXISTS (SELECT 1 FROM distractors d WHERE d.word_id = w.id AND d.side = ?)
+                ORDER BY w.id''', (side,))]
+
+        results = similar_words(words, targets)
+        while True:
+            batch = list(itertools.islice(results, batch_size))
+            if not batch:
+                break
+            conn.executemany('DELETE FROM distractors WHERE word_id = ? AND side = ?',
+                             ((word_id, side) for word_id, _ in batch))
+            conn.executemany('INSERT INTO distractors (word_id, side, rank, distractor_id) VALUES (?, ?, ?, ?)',
+                             ((word_id, side, rank, other)
+                              for word_id, similar in batch
+                              for rank, other in enumerate(similar)))
+            conn.commit()
+            built += len(batch)
+    return built
 
-        if session['mode'] != 'random':
-            session['current_index'] += 1
 
-        session['checked'] = False
-        session['revealed'] = False
-        session['is_correct'] = False
-        session.modified = True
-        return redirect(url_for('study_word'))
+def choice_options(repository, card, deck):
+    """The correct answer and up to CHOICE_DISTRACTORS others, shuffled, as dicts with id and text.
 
-    return redirect(url_for('study'))
+    Words not indexed yet (e.g. just uploaded) get random words of the deck.
+    """
+    side, column = ANSWER_SIDES[session['direction']]
+    confused, similar = repository.choice_candidates(card['id'], side, column, CHOICE_CONFUSIONS)
 
+    options = {card['id']: card[column]}
+    texts = {normalize_form(card[column])}
 
-if __name__ == '__main__':
+    def add(candidates):
+        for word_id, text in candidates:
+            if len(options) > CHOICE_DISTRACTORS:
+                return
+            if word_id not in options and normalize_form(text) not in texts:
+                options[word_id] = text
+                texts.add(normalize_form(text))
+
+    add(confused)
+    add(random.sample(similar, len(similar)))
+    if len(options) <= CHOICE_DISTRACTORS:
+        ids = {id_at(deck, random.randrange(session['deck_size'])) for _ in range(CHOICE_DISTRACTORS * 4)}
+        add(repository.word_texts(sorted(ids), column))
+
+    choices = [{'id': word_id, 'text': text} for word_id, text in options.items()]
+    random.shuffle(choices)
+    return choices
+
+
+# Database maintenance
+# Orphan checks: (table, id column, condition that marks a row as orphaned)
+ORPHAN_CHECKS = (
+    ('words', 'id', 'NOT EXISTS (SELECT 1 FROM pages p WHERE p.id = words.page_id)'),
+    ('statistics', 'id', 'NOT EXISTS (SELECT 1 FROM words w WHERE w.id = statistics.word_id)'),
+    ('word_forms', 'word_id', 'NOT EXISTS (SELECT 1 FROM words w WHERE w.id = word_forms.word_id)'),
+)
+
+
+def database_size(conn):
+    return conn.execute('PRAGMA page_count').fetchone()[0] * conn.execute('PRAGMA page_size').fetchone()[0]
+
+
+def collect_orphans(conn, batch_size=5000, pause=0.0):
+    """Delete rows whose parent row is gone, one id range per transaction.
+
+    Databases written before foreign keys were enforced still hold the
+    words of deleted pages and the statistics of re-uploaded words. Each
+    statement covers batch_size ids, so the write lock is held briefly.
+    """
+    removed = {}
+    for table, id_column, orphaned in ORPHAN_CHECKS:
+        removed[table] = 0
+        low, high = conn.execute(f'SELECT MIN({id_column}), MAX({id_column}) FROM {table}').fetchone()
+        if low is None:
+            continue
+        for start in range(low, high + 1, batch_size):
+            cursor = conn.execute(
+                f'DELETE FROM {table} WHERE {id_column} >= ? AND {id_column} < ? AND {orphaned}',
+                (start, start + batch_size)
+            )
+            conn.commit()
+            removed[table] += cursor.rowcount
+            if pause:
+                time.sleep(pause)
+    return removed
+
+
+def reclaim_free_pages(conn, step_pages=256, pause=0.0):
+    """Return free pages to the file system a few at a time"""
+    while conn.execute('PRAGMA freelist_count').fetchone()[0] > 0:
+        conn.execute(f'PRAGMA incremental_vacuum({step_pages})').fetchall()
+        conn.commit()
+        if pause:
+            time.sleep(pause)
+
+
+def expire_answer_keys(conn, ttl=None):
+    """Forget idempotency keys older than ttl seconds (ANSWER_KEY_TTL by default)"""
+    ttl = ANSWER_KEY_TTL if ttl is None else ttl
+    cursor = conn.execute("DELETE FROM applied_answers WHERE applied_at < datetime('now', ?)",
+                          (f'-{int(ttl)} seconds',))
+    conn.commit()
+    return cursor.rowcount
+
+
+def run_maintenance(batch_size=5000, vacuum_pages=256, pause=0.0):
+    """Collect orphans, expire answer keys, refresh planner statistics and reclaim free space"""
+    started = time.perf_counter()
+    conn = get_db()
+    try:
+        size_before = database_size(conn)
+        removed = collect_orphans(conn, batch_size, pause)
+        expired_keys = expire_answer_keys(conn)
+        expired_sessions = expire_study_sessions(conn)
+        expired_uploads = expire_uploads(conn)
+
+        # A bounded ANALYZE keeps this cheap on large databases
+        conn.execute('PRAGMA analysis_limit = 1000')
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA optimize')
+        conn.commit()
+
+        auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        if auto_vacuum == 2:
+            reclaim_free_pages(conn, vacuum_pages, pause)
+        size_after = database_size(conn)
+    finally:
+        conn.close()
+
+    return {
+        'removed': removed,
+        'expired_keys': expired_keys,
+        'expired_sessions': expired_sessions,
+        'expired_uploads': expired_uploads,
+        'bytes_reclaimed': size_before - size_after,
+        'incremental_vacuum': auto_vacuum == 2,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def start_background_jobs():
+    """Start the periodic commands configured in the environment as child processes.
+
+    MAINTENANCE_INTERVAL runs 'maintenance', BACKUP_INTERVAL runs 'backup',
+    SCORE_INTERVAL runs 'score-words' and DISTRACTOR_INTERVAL runs
+    'build-distractors' (all in seconds), each through 'tenants run
+    --interval' so every tenant database is covered.
+    """
+    jobs = []
+    for env_var, command in (('MAINTENANCE_INTERVAL', ('maintenance', '--pause', '0.05')),
+                             ('BACKUP_INTERVAL', ('backup',)), ('SCORE_INTERVAL', ('score-words',)),
+                             ('DISTRACTOR_INTERVAL', ('build-distractors',))):
+        interval = float(os.environ.get(env_var, 0))
+        if interval > 0:
+            jobs.append(subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), 'tenants', 'run', '--interval', str(interval), *command]
+            ))
+    return jobs
+
+
+# Backups
+BACKUP_DIR = os.environ.get('BACKUP_DIR', 'backups')
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verify_backup(path):
+    """Raise ValueError unless the backup matches its checksum and passes an integrity check"""
+    checksum_path = path + '.sha256'
+    if not os.path.exists(checksum_path):
+        raise ValueError(f'{checksum_path} is missing')
+    with open(checksum_path) as f:
+        expected = f.read().split()[0]
+    if file_checksum(path) != expected:
+        raise ValueError(f'{path} does not match its checksum')
+
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+    finally:
+        conn.close()
+    if result != 'ok':
+        raise ValueError(f'{path} failed the integrity check: {result}')
+
+
+def backup_database(backup_dir=BACKUP_DIR, pages_per_step=128, step_pause=0.005, keep=7):
+    """Copy the live database with SQLite's online backup API.
+
+    The copy proceeds pages_per_step pages at a time with a pause in
+    between, so learners' writes are only blocked for one short step.
+    The result is verified, recorded with a .sha256 file and only then
+    given its final name; backups beyond the newest keep are deleted.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    path = os.path.join(backup_dir, datetime.now().strftime('vocabulary-%Y%m%d-%H%M%S-%f.db'))
+    partial_path = path + '.part'
+
+    source = get_db()
+    target = sqlite3.connect(partial_path)
+    try:
+        source.backup(target, pages=pages_per_step, sleep=step_pause)
+        # Keep the backup a single self-contained file
+        target.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        target.close()
+        source.close()
+
+    with open(partial_path + '.sha256', 'w') as f:
+        f.write(f'{file_checksum(partial_path)}  {os.path.basename(path)}\n')
+    verify_backup(partial_path)
+    os.replace(partial_path + '.sha256', path + '.sha256')
+    os.replace(partial_path, path)
+
+    for old in list_backups(backup_dir)[keep:]:
+        os.remove(old)
+        # Backups copied in by hand may come without a checksum file
+        if os.path.exists(old + '.sha256'):
+            os.remove(old + '.sha256')
+    return path
+
+
+def list_backups(backup_dir=BACKUP_DIR):
+    """Completed backups, newest first"""
+    if not os.path.isdir(backup_dir):
+        return []
+    names = sorted((name for name in os.listdir(backup_dir)
+                    if name.startswith('vocabulary-') and name.endswith('.db')), reverse=True)
+    return [os.path.join(backup_dir, name) for name in names]
+
+
+def tenant_backup_dir(backup_dir):
+    """Backups of a tenant's database go to a subdirectory named after the tenant"""
+    tenant = current_tenant()
+    return backup_dir if tenant is None else os.path.join(backup_dir, tenant)
+
+
+def restore_database(path):
+    """Replace the live database contents with a verified backup"""
+    verify_backup(path)
+    source = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    target = get_db()
+    try:
+        max_version = target.execute('SELECT COALESCE(MAX(version), 0) FROM pages').fetchone()[0]
+        source.backup(target)
+        # Running servers cache decks by (page, version); move every restored
+        # page past the versions they may have cached
+        target.execute('UPDATE pages SET version = version + ?', (max_version + 1,))
+        target.commit()
+        target.execute('PRAGMA journal_mode=WAL')
+    finally:
+        target.close()
+        source.close()
+
+
+# Command line interface
+@app.cli.command('serve')
+@click.option('--host', default='0.0.0.0', show_default=True, help='Interface to bind.')
+@click.option('--port', default=lambda: int(os.environ.get('PORT', 5000)), type=int, help='Port to bind (default: $PORT or 5000).')
+@click.option('--workers', default=lambda: os.cpu_count() or 1, type=int, help='Worker processes (default: CPU count).')
+@click.option('--threads', default=4, show_default=True, type=int, help='Threads per worker process.')
+@click.option('--timeout', default=30, show_default=True, type=int, help='Seconds before a silent worker is restarted.')
+@click.option('--graceful-timeout', default=30, show_default=True, type=int,
+              help='Seconds workers get to finish requests on reload or shutdown.')
+def serve(host, port, workers, threads, timeout, graceful_timeout):
+    """Run the app under gunicorn with several worker processes.
+
+    The schema is initialized once in the master process before any worker
+    is forked; tenant databases are upgraded by the first worker that opens
+    them. Every worker thread keeps its own connections to the WAL
+    databases. Send SIGHUP to the master to reload workers gracefully and
+    SIGTERM to shut down; each worker runs the on_shutdown() hooks before
+    exiting.
+
+    \b
+    Example:
+        flask --app app serve --workers 8 --threads 4
+        python app.py serve --port 8000
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise click.ClickException('gunicorn is not installed; run "pip install gunicorn"')
+
+    init_db()
+    # Forked workers must open their own connections
+    close_connections()
+    background_jobs = []
+
+    class StandaloneApplication(BaseApplication):
+        def load_config(self):
+            options = {
+                'bind': f'{host}:{port}',
+                'workers': workers,
+                'threads': threads,
+                'worker_class': 'gthread',
+                'timeout': timeout,
+                'graceful_timeout': graceful_timeout,
+                'worker_exit': lambda server, worker: run_shutdown_hooks(),
+                'when_ready': lambda server: background_jobs.extend(start_background_jobs()),
+                'on_exit': lambda server: [job.terminate() for job in background_jobs],
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    click.echo(f'Serving on http://{host}:{port} with {workers} worker(s) x {threads} thread(s)')
+    StandaloneApplication().run()
+
+
+# Commands that start_background_jobs() runs next to the server take
+# --interval and then keep running at low priority
+interval_option = click.option('--interval', type=float,
+                               help='Keep running at low priority, once every INTERVAL seconds.')
+
+
+def run_periodically(job, interval, errors=(sqlite3.Error,), failure='Failed'):
+    """Run job() once, or with an interval forever at low priority, once every interval seconds.
+
+    A periodic run that raises one of errors is reported and the next run
+    still happens; a single run lets the error propagate.
+    """
+    if not interval:
+        job()
+        return
+
+    try:
+        os.nice(10)
+    except (AttributeError, OSError):
+        pass
+    while True:
+        time.sleep(interval)
+        try:
+            job()
+        except errors as e:
+            click.echo(f'{failure}: {e}', err=True)
+
+
+@app.cli.command('maintenance')
+@click.option('--batch-size', default=5000, show_default=True, type=int, help='Ids covered by each delete.')
+@click.option('--vacuum-pages', default=256, show_default=True, type=int, help='Pages freed per vacuum step.')
+@click.option('--enable-incremental-vacuum', is_flag=True,
+              help='Switch an existing database to auto_vacuum=INCREMENTAL (runs a full VACUUM once).')
+@click.option('--pause', type=float, help='Seconds to wait between batches (default: 0, or 0.05 with --interval).')
+@interval_option
+def maintenance_command(batch_size, vacuum_pages, enable_incremental_vacuum, pause, interval):
+    """Remove orphaned rows, expire answer keys, refresh planner statistics and reclaim free space.
+
+    Set MAINTENANCE_INTERVAL (seconds) to have the server start this command
+    with --interval in a background process.
+    """
+    init_db()
+    if enable_incremental_vacuum:
+        conn = get_db()
+        try:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                size_before = database_size(conn)
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                conn.execute('VACUUM')
+                click.echo(f'Enabled incremental vacuum, reclaimed {size_before - database_size(conn)} byte(s)')
+        finally:
+            conn.close()
+
+    if pause is None:
+        # Next to the server, pause between batches so request threads get the write lock in between
+        pause = 0.05 if interval else 0.0
+    run_periodically(lambda: echo_maintenance_report(run_maintenance(batch_size, vacuum_pages, pause)), interval,
+                     failure='Maintenance failed')
+
+
+def echo_maintenance_report(report):
+    for table, count in report['removed'].items():
+        click.echo(f'Removed {count} orphaned row(s) from {table}')
+    click.echo(f"Expired {report['expired_keys']} answer key(s)")
+    click.echo(f"Removed {report['expired_sessions']} finished or stale study session(s)")
+    click.echo(f"Removed {report['expired_uploads']} abandoned upload(s)")
+    if report['incremental_vacuum']:
+        click.echo(f"Reclaimed {report['bytes_reclaimed']} byte(s)")
+    else:
+        click.echo('Free pages are not reclaimed: run again with --enable-incremental-vacuum')
+    click.echo(f"Done in {report['seconds']}s")
+
+
+@app.cli.command('score-words')
+@click.option('--batch-size', default=50000, show_default=True, type=int, help='Rows updated per transaction.')
+@interval_option
+def score_words_command(batch_size, interval):
+    """Recompute the difficulty scores that order smart mode.
+
+    Needs NumPy. Set SCORE_INTERVAL (seconds) to have the server start this
+    command with --interval in a background process.
+    """
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        raise click.ClickException('numpy is not installed; run "pip install numpy"')
+
+    init_db()
+
+    def run():
+        started = time.perf_counter()
+        conn = get_db()
+        try:
+            count = score_words(conn, batch_size)
+        finally:
+            conn.close()
+        click.echo(f'Scored {count} word(s) in {time.perf_counter() - started:.2f}s')
+
+    run_periodically(run, interval, failure='Scoring failed')
+
+
+@app.cli.command('build-distractors')
+@click.option('--full', is_flag=True, help='Rebuild every word, not only the ones added since the last run.')
+@click.option('--batch-size', default=5000, show_default=True, type=int, help='Words written per transaction.')
+@interval_option
+def build_distractors_command(full, batch_size, interval):
+    """Index similar words for the multiple-choice method.
+
+    Set DISTRACTOR_INTERVAL (seconds) to have the server start this command
+    with --interval in a background process.
+    """
+    init_db()
+
+    def run():
+        started = time.perf_counter()
+        conn = get_db()
+        try:
+            count = build_distractors(conn, full, batch_size)
+        finally:
+            conn.close()
+        click.echo(f'Indexed distractors for {count} word side(s) in {time.perf_counter() - started:.2f}s')
+
+    run_periodically(run, interval, failure='Building distractors failed')
+
+
+@app.cli.command('backup')
+@click.option('--dir', 'backup_dir', default=BACKUP_DIR, show_default=True, help='Where backups are written.')
+@click.option('--keep', default=lambda: int(os.environ.get('BACKUP_KEEP', 7)), type=int,
+              help='Backups to keep (default: $BACKUP_KEEP or 7).')
+@click.option('--pages-per-step', default=128, show_default=True, type=int, help='Pages copied per backup step.')
+@interval_option
+def backup_command(backup_dir, keep, pages_per_step, interval):
+    """Write a verified online backup of the database and rotate old ones.
+
+    Set BACKUP_INTERVAL (seconds) to have the server start this command with
+    --interval in a background process. With TENANT set, backups go to a
+    subdirectory named after the tenant.
+    """
+    backup_dir = tenant_backup_dir(backup_dir)
+    run_periodically(lambda: click.echo(f'Backup written to {backup_database(backup_dir, pages_per_step, keep=keep)}'),
+                     interval, errors=(sqlite3.Error, OSError, ValueError), failure='Backup failed')
+
+
+@app.cli.command('restore')
+@click.argument('path', required=False)
+@click.option('--dir', 'backup_dir', default=BACKUP_DIR, show_default=True, help='Where to look for the latest backup.')
+@click.confirmation_option(prompt='This replaces all current data. Continue?')
+def restore_command(path, backup_dir):
+    """Restore the database from PATH (default: the newest backup).
+
+    The backup's checksum and integrity are verified before anything is
+    overwritten.
+    """
+    if path is None:
+        backups = list_backups(tenant_backup_dir(backup_dir))
+        if not backups:
+            raise click.ClickException(f'No backups found in {backup_dir}')
+        path = backups[0]
+    try:
+        restore_database(path)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'Restored {path}')
+
+
+@app.cli.group('tenants')
+def tenants_cli():
+    """Create and inspect tenant databases and run commands across all of them.
+
+    Any other command works on one tenant when TENANT is set, e.g.
+    TENANT=school-1 python app.py import-dir words/.
+    """
+
+
+def shards():
+    """The default database (when it exists) and every tenant, as current_tenant() values"""
+    return ([None] if os.path.exists(DATABASE) else []) + list_tenants()
+
+
+def shard_label(tenant):
+    return '(default)' if tenant is None else tenant
+
+
+@tenants_cli.command('list')
+def tenants_list():
+    """Show the size, pages and words of every database."""
+    for tenant in shards():
+        with use_tenant(tenant):
+            conn = get_db()
+            pages = conn.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+            words = conn.execute('SELECT COUNT(*) FROM words').fetchone()[0]
+            size = database_size(conn)
+        click.echo(f'{shard_label(tenant):<24} {size / 1024 / 1024:8.1f} MiB '
+                   f'{pages:>7} page(s) {words:>9} word(s)')
+
+
+@tenants_cli.command('create')
+@click.argument('names', nargs=-1, required=True)
+def tenants_create(names):
+    """Create an empty database for each tenant in NAMES."""
+    for name in names:
+        try:
+            path = tenant_database(name)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        if os.path.exists(path):
+            click.echo(f'{name} already exists')
+            continue
+        with use_tenant(name):
+            get_db()
+        click.echo(f'Created {path}')
+
+
+@tenants_cli.command('run', context_settings={'ignore_unknown_options': True, 'allow_interspersed_args': False})
+@interval_option
+@click.argument('command', nargs=-1, required=True, type=click.UNPROCESSED)
+def tenants_run(interval, command):
+    """Run COMMAND once for every database, one after the other.
+
+    Each database gets its own process with TENANT set, so a failure in one
+    does not stop the others.
+
+    \b
+    Example:
+        python app.py tenants run maintenance
+        python app.py tenants run backup --keep 3
+    """
+    def run_all():
+        failed = []
+        for tenant in shards():
+            env = dict(os.environ)
+            env.pop('TENANT', None)
+            if tenant is not None:
+                env['TENANT'] = tenant
+            click.echo(f'== {shard_label(tenant)}')
+            if subprocess.run([sys.executable, os.path.abspath(__file__), *command], env=env).returncode:
+                failed.append(shard_label(tenant))
+        if failed:
+            raise click.ClickException(f"Failed for {', '.join(failed)}")
+
+    run_periodically(run_all, interval, errors=(click.ClickException,), failure=' '.join(command))
+
+
+@app.cli.group('pages')
+def pages_cli():
+    """Reorganize pages in bulk.
+
+    Page and word ids are given as ranges, e.g. 1-100,150. Every command
+    runs in a single transaction.
+    """
     init_db()
-    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=False)
\ No newline at end of file
+
+
+def run_page_operation(operation, *args):
+    """Run a bulk operation in one transaction, reporting ValueErrors as usage errors"""
+    conn = get_db()
+    try:
+        result = operation(conn, *args)
+        conn.commit()
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        conn.close()
+    return result
+
+
+def select_page_ranges(conn, page_ranges):
+    load_ranges(conn, parse_ranges(page_ranges))
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS selected_pages (page_id INTEGER PRIMARY KEY)')
+    conn.execute('DELETE FROM temp.selected_pages')
+    conn.execute('''INSERT OR IGNORE INTO temp.selected_pages (page_id)
+                    SELECT p.id FROM temp.ranges r JOIN pages p ON p.id BETWEEN r.first AND r.last''')
+
+
+@pages_cli.command('merge')
+@click.argument('page_ranges')
+@click.option('--into', 'target_id', type=int, help='Page that keeps the words (default: the lowest id).')
+@click.option('--name', help='New name for the merged page.')
+def pages_merge(page_ranges, target_id, name):
+    """Merge the pages in PAGE_RANGES into one page."""
+    def merge(conn):
+        select_page_ranges(conn, page_ranges)
+        page_ids = selected_page_ids(conn)
+        if not page_ids:
+            raise ValueError('no pages match')
+        target = target_id if target_id is not None else page_ids[0]
+        if conn.execute('SELECT 1 FROM pages WHERE id = ?', (target,)).fetchone() is None:
+            raise ValueError(f'no page {target}')
+        return len(page_ids), merge_pages(conn, target, name)
+
+    count, moved = run_page_operation(merge)
+    click.echo(f'Merged {count} page(s), {moved} word(s) moved')
+
+
+@pages_cli.command('split')
+@click.argument('page_id', type=int)
+@click.argument('positions')
+def pages_split(page_id, positions):
+    """Split a page: each range of word POSITIONS (1-based) becomes a new page."""
+    new_ids = run_page_operation(lambda conn: split_page(conn, page_id, parse_ranges(positions)))
+    click.echo(f"Created page(s) {', '.join(map(str, new_ids))}")
+
+
+@pages_cli.command('move')
+@click.argument('word_ranges')
+@click.option('--to', 'target_id', required=True, type=int, help='Page that receives the words.')
+def pages_move(word_ranges, target_id):
+    """Move the words with ids in WORD_RANGES to another page."""
+    def move(conn):
+        if conn.execute('SELECT 1 FROM pages WHERE id = ?', (target_id,)).fetchone() is None:
+            raise ValueError(f'no page {target_id}')
+        return move_words(conn, parse_ranges(word_ranges), target_id)
+
+    click.echo(f'Moved {run_page_operation(move)} word(s)')
+
+
+@pages_cli.command('reset')
+@click.argument('page_ranges')
+def pages_reset(page_ranges):
+    """Reset the statistics of the words in PAGE_RANGES."""
+    def reset(conn):
+        select_page_ranges(conn, page_ranges)
+        return reset_page_stats(conn)
+
+    click.echo(f'Reset the statistics of {run_page_operation(reset)} word(s)')
+
+
+@app.cli.command('import-dir')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--workers', default=lambda: os.cpu_count() or 1, type=int, help='Parser processes (default: CPU count).')
+@click.option('--batch-size', default=50000, show_default=True, type=int, help='Rows written per transaction.')
+@click.option('--format', 'fmt', type=click.Choice(('auto',) + WORD_FILE_FORMATS), default='auto', show_default=True,
+              help="Word file format; 'auto' picks by extension.")
+@click.option('--separator', help="Separator for the 'separator' format.")
+def import_dir(directory, workers, batch_size, fmt, separator):
+    """Import every word file (.txt, .tsv, .csv) under DIRECTORY as a page.
+
+    Files are parsed in a process pool with the same rules as the upload
+    form; a single writer inserts the results in large transactions. Page
+    names follow the upload form (1.txt becomes "Page 1").
+    """
+    paths = sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(directory)
+        for name in names
+        if name.endswith(WORD_FILE_EXTENSIONS)
+    )
+    if not paths:
+        click.echo('No word files found.')
+        return
+    formats = [format_for_filename(path) if fmt == 'auto' else fmt for path in paths]
+    try:
+        line_splitter(formats[0], separator)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--separator')
+
+    init_db()
+    started = time.perf_counter()
+    total_rows = 0
+    pending_rows = 0
+    skipped_lines = 0
+    duplicates = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor, get_db() as conn:
+        chunksize = max(1, len(paths) // (workers * 4))
+        results = executor.map(read_word_file, paths, formats, [separator] * len(paths), chunksize=chunksize)
+        for path, (words, errors, error_count) in zip(paths, results):
+            for error in errors:
+                click.echo(f'{path}:{error.line_no}: {error.reason}: {error.text}', err=True)
+            if error_count > len(errors):
+                click.echo(f'{path}: {error_count - len(errors)} more malformed line(s) not shown', err=True)
+            skipped_lines += error_count
+
+            digest = hashlib.sha256()
+            words = list(hashing_words(words, digest))
+            duplicate = find_duplicate_page(conn, digest.hexdigest())
+            if duplicate:
+                click.echo(describe_duplicate(path, duplicate), err=True)
+                duplicates += 1
+                continue
+
+            page_name = page_name_from_filename(secure_filename(os.path.basename(path)))
+            cursor = conn.execute('INSERT INTO pages (name, content_hash) VALUES (?, ?)',
+                                  (page_name, digest.hexdigest()))
+            import_words(conn, cursor.lastrowid, words)
+
+            total_rows += len(words)
+            pending_rows += len(words)
+            if pending_rows >= batch_size:
+                conn.commit()
+                pending_rows = 0
+        conn.commit()
+
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    click.echo(f'Imported {len(paths) - duplicates} file(s), {total_rows} word(s) in {elapsed:.2f}s '
+               f'({len(paths) / elapsed:.1f} files/s, {total_rows / elapsed:.0f} rows/s)')
+    if skipped_lines:
+        click.echo(f'Skipped {skipped_lines} malformed line(s), see above.')
+    if duplicates:
+        click.echo(f'Skipped {duplicates} file(s) with the same words as an existing page.')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        # e.g. "python app.py serve --workers 8"
+        app.cli.main(obj=ScriptInfo(create_app=lambda: app))
+    else:
+        init_db()
+        for job in start_background_jobs():
+            atexit.register(job.terminate)
+        app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=False)
\ No newline at end of file
@@ -0,0 +1,106 @@
+"""Study-route latency before and during an online backup.
+
+Builds a large vocabulary database in a temporary directory, measures the
+study loop (study_word + check_word) with Flask's test client, then repeats
+the measurement while `app.py backup` runs in a separate process. The
+temporary directory is removed at the end unless --keep is given.
+
+    python benchmarks/backup_latency.py --words 500000 --pages-per-step 64
+"""
+import argparse
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def build_database(app_module, words, pages):
+    client = app_module.app.test_client()
+    per_page = words // pages
+    for page in range(pages):
+        lines = '\n'.join(f'word{page}x{i} - բառ{page}x{i}' for i in range(per_page))
+        client.post('/upload_file',
+                    data={'files': [(io.BytesIO(lines.encode('utf-8')), f'page{page}.txt')]},
+                    content_type='multipart/form-data')
+    return client
+
+
+def study_loop(client, page_ids, requests):
+    client.post('/study_session', data={'direction': 'en_to_am', 'method': 'write',
+                                        'mode': 'random', 'pages': page_ids})
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        page = client.get('/study_word').get_data(as_text=True)
+        word_id = page.split('const wordId = ', 1)[1].split(';', 1)[0]
+        client.post('/check_word', data={'word_id': word_id, 'answers': ['?']})
+        client.post('/study_action', data={'action': 'next'})
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def report(label, timings):
+    print(f'{label:<16} n={len(timings):<6} '
+          f'p50={percentile(timings, 0.50) * 1000:7.2f}ms '
+          f'p95={percentile(timings, 0.95) * 1000:7.2f}ms '
+          f'max={max(timings) * 1000:7.2f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--words', type=int, default=200000)
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--pages-per-step', type=int, default=128)
+    parser.add_argument('--keep', action='store_true', help='Keep the temporary directory with the database')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='backup-bench-')
+    os.chdir(workdir)
+    import app as app_module
+    try:
+        app_module.init_db()
+
+        started = time.perf_counter()
+        client = build_database(app_module, args.words, args.pages)
+        with app_module.get_db() as conn:
+            size = app_module.database_size(conn)
+        print(f'Built {args.words} words in {time.perf_counter() - started:.1f}s '
+              f'({size / 1024 / 1024:.1f} MiB) at {workdir}')
+
+        page_ids = [str(page_id) for page_id in range(1, args.pages + 1)]
+        report('idle', study_loop(client, page_ids, args.requests))
+
+        backup = subprocess.Popen([sys.executable, os.path.join(ROOT, 'app.py'), 'backup',
+                                   '--pages-per-step', str(args.pages_per_step)],
+                                  stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        during = []
+        while backup.poll() is None:
+            during.extend(study_loop(client, page_ids, 20))
+        print(backup.stdout.read().strip())
+        if during:
+            report('during backup', during)
+        else:
+            print('Backup finished before any request completed')
+    finally:
+        app_module.close_connections()
+        os.chdir(ROOT)
+        if args.keep:
+            print(f'Kept {workdir}')
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""Import, page and deck-building cost at growing vocabulary sizes.
+
+Generates synthetic libraries (English words with Armenian translations,
+one to four synonyms per side) at each scale and measures, with Flask's test
+client:
+
+    parse        parse_word_file() on the whole library as one file
+    upload       /upload_file of every page, then /reupload_page of one page
+                 with changed and with unchanged words
+    manage       GET /manage
+    study        GET /study
+    deck         POST /study_session over every page, per study mode
+    view_page    GET /view_page of one page
+
+Every scale gets its own tenant database in a temporary directory, so the
+deck cache and session cookies never carry over between scales. The
+directory is removed at the end unless --keep is given. Results are
+written as JSON so scaling curves can be compared across releases.
+
+    python benchmarks/data_scale.py --scales 1000,10000,100000 --output results.json
+    python benchmarks/data_scale.py --backend memory --backend sqlite
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ENGLISH_ONSETS = ['b', 'br', 'c', 'ch', 'd', 'dr', 'f', 'g', 'gr', 'h', 'j', 'k', 'l', 'm', 'n', 'p',
+                  'pl', 'r', 's', 'sh', 'st', 't', 'th', 'tr', 'v', 'w']
+ENGLISH_VOWELS = ['a', 'e', 'i', 'o', 'u', 'ai', 'ea', 'oo', 'ou']
+ENGLISH_CODAS = ['', '', 'n', 'r', 's', 't', 'nd', 'ng', 'st', 'ck']
+ARMENIAN_CONSONANTS = list('բգդզթժլխծկհձղճմյնշչպջռսվտրցփքֆ')
+ARMENIAN_VOWELS = list('աեէըիոու')
+
+# Share of words with 1, 2, 3 and 4 comma-separated synonyms on a side
+SYNONYM_WEIGHTS = [0.55, 0.3, 0.1, 0.05]
+STUDY_MODES = ['random', 'smart', 'leitner', 'session']
+
+
+def english_word(rng):
+    return ''.join(rng.choice(ENGLISH_ONSETS) + rng.choice(ENGLISH_VOWELS)
+                   for _ in range(rng.randint(1, 3))) + rng.choice(ENGLISH_CODAS)
+
+
+def armenian_word(rng):
+    return ''.join(rng.choice(ARMENIAN_CONSONANTS) + rng.choice(ARMENIAN_VOWELS)
+                   for _ in range(rng.randint(1, 4))) + rng.choice(ARMENIAN_CONSONANTS + [''])
+
+
+def synonyms(rng, make_word):
+    count = rng.choices(range(1, len(SYNONYM_WEIGHTS) + 1), SYNONYM_WEIGHTS)[0]
+    return ', '.join(make_word(rng) for _ in range(count))
+
+
+def synthetic_page(rng, words):
+    """Text of a dash-format word file with the given number of lines"""
+    return '\n'.join(f'{synonyms(rng, english_word)} - {synonyms(rng, armenian_word)}'
+                     for _ in range(words)) + '\n'
+
+
+def synthetic_library(seed, words, page_words):
+    """The pages of a library as (filename, text) pairs; the same seed gives the same library"""
+    rng = random.Random(seed)
+    pages = []
+    for page, start in enumerate(range(0, words, page_words)):
+        pages.append((f'page{page:05d}.txt', synthetic_page(rng, min(page_words, words - start))))
+    return pages
+
+
+def timed(call, repeat):
+    """Run call() repeat times; returns summary timings in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+    return {
+        'runs': repeat,
+        'min_ms': round(min(timings) * 1000, 2),
+        'median_ms': round(statistics.median(timings) * 1000, 2),
+        'max_ms': round(max(timings) * 1000, 2),
+    }
+
+
+def checked(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f'{response.request.path} returned {response.status_code}')
+    return response
+
+
+def measure_parse(app_module, pages, workdir):
+    path = os.path.join(workdir, 'library.txt')
+    with open(path, 'w', encoding='utf-8') as f:
+        for _, text in pages:
+            f.write(text)
+    size = os.path.getsize(path)
+    started = time.perf_counter()
+    rows = len(app_module.parse_word_file(path))
+    elapsed = time.perf_counter() - started
+    os.remove(path)
+    return {
+        'rows': rows,
+        'bytes': size,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed),
+        'mib_per_second': round(size / 1024 / 1024 / elapsed, 2),
+    }
+
+
+def measure_upload(client, pages, files_per_request):
+    started = time.perf_counter()
+    for start in range(0, len(pages), files_per_request):
+        batch = pages[start:start + files_per_request]
+        checked(client.post('/upload_file',
+                            data={'files': [(io.BytesIO(text.encode('utf-8')), name) for name, text in batch]},
+                            content_type='multipart/form-data'))
+    elapsed = time.perf_counter() - started
+    words = sum(text.count('\n') for _, text in pages)
+    return {
+        'pages': len(pages),
+        'requests': -(-len(pages) // files_per_request),
+        'seconds': round(elapsed, 3),
+        'words_per_second': round(words / elapsed),
+    }
+
+
+def measure_reupload(client, page_id, text):
+    def reupload(body):
+        started = time.perf_counter()
+        checked(client.post(f'/reupload_page/{page_id}',
+                            data={'file': (io.BytesIO(body.encode('utf-8')), 'page.txt')},
+                            content_type='multipart/form-data'))
+        return round((time.perf_counter() - started) * 1000, 2)
+
+    lines = text.splitlines()
+    # Drop a tenth of the lines and add as many new ones
+    changed = lines[len(lines) // 10:] + [f'{line.split(" - ", 1)[0]}x - {line.split(" - ", 1)[1]}'
+                                          for line in lines[:len(lines) // 10]]
+    return {
+        'words': len(lines),
+        'changed_ms': reupload('\n'.join(changed) + '\n'),
+        'unchanged_ms': reupload('\n'.join(changed) + '\n'),
+    }
+
+
+def page_ids(app_module, tenant):
+    """Ids of the uploaded pages, read back through the repository the routes use"""
+    with app_module.app.test_request_context(headers={'X-Tenant': tenant}):
+        app_module.select_tenant()
+        return [page['id'] for page in app_module.get_repository().list_pages()]
+
+
+def run_scale(app_module, args, backend, words, workdir):
+    tenant = f'{backend}-{words}'
+    with app_module.use_tenant(tenant):
+        app_module.get_db()
+    app_module.app.config['REPOSITORY'] = app_module.MemoryRepository() if backend == 'memory' else None
+
+    client = app_module.app.test_client()
+    client.environ_base['HTTP_X_TENANT'] = tenant
+
+    started = time.perf_counter()
+    pages = synthetic_library(args.seed, words, args.page_words)
+    result = {'backend': backend, 'words': words, 'pages': len(pages),
+              'generate_seconds': round(time.perf_counter() - started, 3)}
+    print(f'== {backend} {words} words, {len(pages)} page(s)')
+
+    result['parse'] = measure_parse(app_module, pages, workdir)
+    result['upload'] = measure_upload(client, pages, args.files_per_request)
+    ids = page_ids(app_module, tenant)
+    result['reupload'] = measure_reupload(client, ids[0], pages[0][1])
+
+    result['manage'] = timed(lambda: checked(client.get('/manage')), args.repeat)
+    result['study'] = timed(lambda: checked(client.get('/study')), args.repeat)
+    result['deck'] = {
+        mode: timed(lambda: checked(client.post('/study_session', data={
+            'direction': 'en_to_am', 'method': 'write', 'mode': mode, 'pages': ids})), args.repeat)
+        for mode in STUDY_MODES
+    }
+    result['view_page'] = timed(lambda: checked(client.get(f'/view_page/{ids[-1]}')), args.repeat)
+
+    if backend == 'sqlite':
+        with app_module.use_tenant(tenant):
+            result['database_bytes'] = app_module.database_size(app_module.get_db())
+
+    print(f"   parse {result['parse']['rows_per_second']} rows/s, "
+          f"upload {result['upload']['seconds']}s, "
+          f"manage {result['manage']['median_ms']}ms, study {result['study']['median_ms']}ms, "
+          f"deck {result['deck']['random']['median_ms']}ms, view_page {result['view_page']['median_ms']}ms")
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', default='1000,10000,100000,1000000',
+                        help='Comma-separated library sizes in words')
+    parser.add_argument('--backend', action='append', choices=['sqlite', 'memory'],
+                        help='Repository to measure; repeat for both (default: sqlite)')
+    parser.add_argument('--page-words', type=int, default=1000)
+    parser.add_argument('--files-per-request', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='data_scale.json')
+    parser.add_argument('--keep', action='store_true', help='Keep the temporary directory with the databases')
+    args = parser.parse_args()
+    scales = [int(scale) for scale in args.scales.split(',')]
+    output = os.path.abspath(args.output)
+
+    started = datetime.now().isoformat(timespec='seconds')
+    workdir = tempfile.mkdtemp(prefix='data-scale-bench-')
+    os.chdir(workdir)
+    try:
+        import app as app_module
+
+        results = []
+        for backend in args.backend or ['sqlite']:
+            for words in scales:
+                results.append(run_scale(app_module, args, backend, words, workdir))
+        app_module.app.config['REPOSITORY'] = None
+        app_module.close_connections()
+    finally:
+        os.chdir(ROOT)
+        if args.keep:
+            print(f'Kept {workdir}')
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'benchmark': 'data_scale',
+        'revision': git_revision(),
+        'started': started,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'settings': {'page_words': args.page_words, 'files_per_request': args.files_per_request,
+                     'repeat': args.repeat, 'seed': args.seed},
+        'results': results,
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f'Wrote {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py keeps its databases, uploads and logs under the working directory
+WORKDIR = tempfile.mkdtemp(prefix='vocabulary-tests-')
+os.chdir(WORKDIR)
+import app as app_module  # noqa: E402
+
+_tenant_numbers = itertools.count(1)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    app_module.close_connections()
+    os.chdir(ROOT)
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture
+def tenant():
+    """A new tenant, so every test starts from an empty database"""
+    name = f'test-{next(_tenant_numbers)}'
+    with app_module.use_tenant(name):
+        app_module.get_db()
+    return name
+
+
+@pytest.fixture
+def db(tenant):
+    with app_module.use_tenant(tenant):
+        yield app_module.get_db()
+
+
+@pytest.fixture
+def client(tenant):
+    client = app_module.app.test_client()
+    client.environ_base['HTTP_X_TENANT'] = tenant
+    return client
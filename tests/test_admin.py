@@ -0,0 +1,19 @@
+import pytest
+
+import app as app_module
+
+
+@pytest.mark.parametrize('path', ['/admin/deck_cache', '/admin/profile'])
+def test_admin_routes_are_refused_without_a_configured_token(client, monkeypatch, path):
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', None)
+    assert client.get(path).status_code == 403
+    assert client.get(path, headers={'X-Admin-Token': ''}).status_code == 403
+
+
+@pytest.mark.parametrize('path', ['/admin/deck_cache', '/admin/profile'])
+def test_admin_token_is_only_read_from_the_header(client, monkeypatch, path):
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', 'secret')
+    assert client.get(path).status_code == 403
+    assert client.get(f'{path}?token=secret').status_code == 403
+    assert client.get(path, headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    assert client.get(path, headers={'X-Admin-Token': 'secret'}).status_code == 200
@@ -0,0 +1,54 @@
+import io
+
+
+def upload(client, text, filename='1.txt'):
+    client.post('/upload_file', data={'files': [(io.BytesIO(text.encode('utf-8')), filename)]},
+                content_type='multipart/form-data')
+
+
+def answer_counts(db):
+    return tuple(db.execute('SELECT SUM(correct), SUM(incorrect) FROM statistics').fetchone())
+
+
+def test_retried_answer_is_applied_once(client, tenant, db):
+    upload(client, 'one - մեկ\n')
+    client.post('/study_session', data={'direction': 'en_to_am', 'method': 'write', 'mode': 'session',
+                                        'pages': ['1']})
+    client.get('/study_word')
+    with client.session_transaction(headers={'X-Tenant': tenant}) as cookie:
+        before = dict(cookie)
+
+    answer = {'word_id': 1, 'answers': ['մեկ'], 'answer_key': 'key-1'}
+    assert client.post('/check_word', data=answer).json['correct']
+    # The response was lost: the client retries with the cookie it had
+    with client.session_transaction(headers={'X-Tenant': tenant}) as cookie:
+        cookie.clear()
+        cookie.update(before)
+    client.post('/check_word', data=answer)
+
+    assert answer_counts(db) == (1, 0)
+    with client.session_transaction(headers={'X-Tenant': tenant}) as cookie:
+        assert cookie['current_index'] == 1
+        assert cookie['stats']['correct'] == 1
+
+
+def test_replayed_sync_is_applied_once(client, db):
+    upload(client, 'one - մեկ\ntwo - երկու\n')
+    events = {'events': [{'key': 'offline-1', 'word_id': 1, 'correct': True, 'ts': 1700000000},
+                         {'key': 'offline-2', 'word_id': 2, 'correct': False, 'ts': 1700000001}]}
+
+    assert client.post('/sync', json=events).json == {'applied': 2, 'duplicates': 0, 'rejected': []}
+    assert client.post('/sync', json=events).json == {'applied': 0, 'duplicates': 2, 'rejected': []}
+    assert answer_counts(db) == (1, 1)
+
+
+def test_sync_rejects_events_without_key(client, db):
+    upload(client, 'one - մեկ\n')
+    events = {'events': [{'word_id': 1, 'correct': True, 'ts': 1700000000},
+                         {'key': None, 'word_id': 1, 'correct': True, 'ts': 1700000001},
+                         {'key': '', 'word_id': 1, 'correct': True, 'ts': 1700000002},
+                         {'key': 7, 'word_id': 1, 'correct': True, 'ts': 1700000003}]}
+
+    assert client.post('/sync', json=events).json == {'applied': 0, 'duplicates': 0,
+                                                      'rejected': [None, None, None, None]}
+    assert answer_counts(db) == (0, 0)
@@ -0,0 +1,39 @@
+import pytest
+
+from app import id_at, pack_ids, permute_index, runs_contain, unpack_ids, unpack_runs
+
+
+@pytest.mark.parametrize('seed', [0, 1, 0xDEADBEEF, 2 ** 32 - 1])
+def test_permute_index_is_a_bijection(seed):
+    for size in range(1, 300):
+        assert sorted(permute_index(index, size, seed) for index in range(size)) == list(range(size))
+
+
+def test_permute_index_depends_on_seed():
+    size = 1000
+    orders = {tuple(permute_index(index, size, seed) for index in range(size)) for seed in range(5)}
+    assert len(orders) == 5
+
+
+@pytest.mark.parametrize('ids', [
+    [],
+    [7],
+    list(range(1, 1001)),
+    [5, 3, 9, 1, 12],
+    [1, 2, 3, 10, 11, 4, 5, 100],
+    [2 ** 40, 2 ** 40 + 1, 3],
+])
+def test_pack_ids_round_trip(ids):
+    assert unpack_ids(pack_ids(ids)) == ids
+
+
+def test_runs_lookup_matches_unpacked_ids():
+    ids = [1, 2, 3, 10, 11, 4, 5, 100]
+    runs = unpack_runs(pack_ids(ids))
+    assert [id_at(runs, position) for position in range(len(ids))] == ids
+    assert all(runs_contain(runs, word_id) for word_id in ids)
+    assert not any(runs_contain(runs, word_id) for word_id in (0, 6, 12, 99, 101))
+
+
+def test_consecutive_ids_pack_small():
+    assert len(pack_ids(list(range(1, 100001)))) < 40
@@ -0,0 +1,43 @@
+import io
+
+
+def upload(client, text, filename):
+    client.post('/upload_file', data={'files': [(io.BytesIO(text.encode('utf-8')), filename)]},
+                content_type='multipart/form-data')
+
+
+def page_of_word(db, word_id):
+    return db.execute('SELECT page_id FROM words WHERE id = ?', (word_id,)).fetchone()[0]
+
+
+def test_move_words_without_source_page_changes_nothing(client, db):
+    upload(client, 'one - մեկ\n', '1.txt')
+    upload(client, 'two - երկու\n', '2.txt')
+
+    response = client.post('/move_words', data={'target_page': 2, 'words': [1]})
+    assert response.status_code == 400
+    assert page_of_word(db, 1) == 1
+
+    response = client.post('/move_words', data={'source_page': 1, 'target_page': 2, 'words': [1]})
+    assert response.headers['Location'] == '/view_page/1'
+    assert page_of_word(db, 1) == 2
+
+
+def test_merge_keeps_the_oldest_page(client, db):
+    upload(client, 'one - մեկ\n', '1.txt')
+    upload(client, 'two - երկու\n', '2.txt')
+    assert 'Merge ticked pages into the oldest one' in client.get('/manage').get_data(as_text=True)
+
+    client.post('/bulk_pages', data={'action': 'merge', 'pages': [2, 1]})
+    assert [tuple(row) for row in db.execute('SELECT id, name FROM pages')] == [(1, 'Page 1')]
+    assert page_of_word(db, 2) == 1
+
+
+def test_duplicate_upload_writes_nothing(client, db):
+    upload(client, 'one - մեկ\ntwo - երկու\n', '1.txt')
+    changes = db.total_changes
+
+    upload(client, 'One -  մեկ\ntwo - երկու\n', '2.txt')
+    assert 'same words as' in client.get('/manage').get_data(as_text=True)
+    assert db.total_changes == changes
+    assert db.execute('SELECT COUNT(*) FROM pages').fetchone()[0] == 1
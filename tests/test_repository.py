@@ -0,0 +1,25 @@
+import io
+
+import pytest
+
+import app as app_module
+
+
+def test_incomplete_repository_fails_when_created():
+    class Partial(app_module.VocabularyRepository):
+        def list_pages(self):
+            return []
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_page_routes_use_the_configured_repository(client, monkeypatch):
+    repository = app_module.MemoryRepository()
+    monkeypatch.setitem(app_module.app.config, 'REPOSITORY', repository)
+    client.post('/upload_file', data={'files': [(io.BytesIO('one - մեկ\n'.encode('utf-8')), '1.txt')]},
+                content_type='multipart/form-data')
+    page_id = repository.list_pages()[0]['id']
+
+    client.get(f'/delete_page/{page_id}')
+    assert repository.list_pages() == []
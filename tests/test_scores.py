@@ -0,0 +1,37 @@
+import io
+import time
+
+import app as app_module
+
+
+def test_word_answered_just_now_ranks_below_overdue_word(client, tenant, db):
+    client.post('/upload_file', data={'files': [(io.BytesIO('one - մեկ\ntwo - երկու\n'.encode('utf-8')), '1.txt')]},
+                content_type='multipart/form-data')
+    now = time.time()
+    # Word 1 was known well a month ago and is overdue by now
+    client.post('/sync', json={'events': [{'key': f'old-{i}', 'word_id': 1, 'correct': True, 'ts': now}
+                                          for i in range(3)]})
+    db.execute("UPDATE statistics SET last_studied = datetime('now', '-30 days') WHERE word_id = 1")
+    db.commit()
+    app_module.score_words(db)
+    # Word 2 is answered right now
+    client.post('/sync', json={'events': [{'key': 'new', 'word_id': 2, 'correct': True, 'ts': now}]})
+
+    with app_module.use_tenant(tenant):
+        word_ids, _ = app_module.SQLiteRepository(db).build_deck([1], [], 'smart')
+    assert word_ids == [1, 2]
+
+    app_module.score_words(db)
+    with app_module.use_tenant(tenant):
+        word_ids, _ = app_module.SQLiteRepository(db).build_deck([1], [], 'smart')
+    assert word_ids == [1, 2]
+
+
+def test_memory_repository_scores_answers_the_same_way():
+    repository = app_module.MemoryRepository()
+    page_id, _ = repository.add_page('Page 1', [('one', 'մեկ'), ('two', 'երկու')])
+    repository.record_answer(2, True, '2024-01-01 00:00:00')
+
+    word_ids, _ = repository.build_deck([page_id], [], 'smart')
+    assert word_ids == [1, 2]
+    assert repository.stats[2]['score'] == 0
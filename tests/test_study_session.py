@@ -0,0 +1,40 @@
+import io
+
+import pytest
+
+
+def upload(client, text, filename='1.txt'):
+    client.post('/upload_file', data={'files': [(io.BytesIO(text.encode('utf-8')), filename)]},
+                content_type='multipart/form-data')
+
+
+def start(client, mode, **selection):
+    return client.post('/study_session', data={'direction': 'en_to_am', 'method': 'write', 'mode': mode,
+                                               **selection})
+
+
+@pytest.mark.parametrize('mode', ['random', 'smart', 'session', 'leitner'])
+def test_empty_selection_is_rejected(client, mode):
+    upload(client, 'one - մեկ\n')
+
+    response = start(client, mode)
+    assert response.status_code == 302
+    assert response.headers['Location'] == '/study'
+    assert 'Choose at least one page' in client.get('/study').get_data(as_text=True)
+    assert client.get('/study_word').status_code < 500
+
+
+@pytest.mark.parametrize('mode', ['random', 'smart', 'session', 'leitner'])
+def test_saved_deck_without_pages_is_rejected(client, db, mode):
+    upload(client, 'one - մեկ\n')
+    start(client, mode, pages=['1'], save_deck='Numbers')
+    client.get('/delete_page/1')
+
+    response = start(client, mode, decks=['1'])
+    assert response.headers['Location'] == '/study'
+    assert client.get('/study_word').status_code < 500
+
+
+def test_empty_selection_is_not_saved_as_deck(client, db):
+    start(client, 'random', save_deck='Nothing')
+    assert db.execute('SELECT COUNT(*) FROM decks').fetchone()[0] == 0
@@ -0,0 +1,37 @@
+CHUNK = 777
+
+
+def post_chunk(client, upload_id, offset, data):
+    return client.post(f'/uploads/{upload_id}/chunk?offset={offset}', data=data,
+                       content_type='application/octet-stream')
+
+
+def test_retried_chunk_is_rejected_and_finalize_imports_the_whole_file(client, db):
+    words = [(f'word{i}', f'բառ{i}') for i in range(3000)]
+    # The BOM and the two-byte Armenian letters are split across chunks
+    data = ('﻿' + '\n'.join(f'{english} - {armenian}' for english, armenian in words)).encode('utf-8')
+
+    response = client.post('/uploads', data={'filename': 'big list.txt'})
+    assert response.status_code == 201
+    upload_id = response.json['upload_id']
+
+    offset = 0
+    while offset < len(data):
+        chunk = data[offset:offset + CHUNK]
+        response = post_chunk(client, upload_id, offset, chunk)
+        assert response.status_code == 200
+        retry = post_chunk(client, upload_id, offset, chunk)
+        assert retry.status_code == 409
+        assert retry.json['offset'] == offset + len(chunk)
+        offset = response.json['offset']
+    assert client.get(f'/uploads/{upload_id}').json['offset'] == len(data)
+
+    response = client.post(f'/uploads/{upload_id}/finalize')
+    assert response.json == {'page_id': 1, 'words': len(words), 'skipped_lines': 0}
+    stored = db.execute('SELECT english, armenian FROM words WHERE page_id = 1 ORDER BY id').fetchall()
+    assert [tuple(row) for row in stored] == words
+    assert client.post(f'/uploads/{upload_id}/finalize').status_code == 404
+
+
+def test_chunk_for_unknown_upload(client):
+    assert post_chunk(client, 'missing', 0, b'one - \xd5\xb4\n').status_code == 404